@@ -0,0 +1,361 @@
+"""Runs a local load test of the service with payloads of a stand-in anomaly detection
+
+Starts the service with several uvicorn worker processes, generates the outputs of a fake anomaly detection in several
+sizes and sends a configurable mix of requests with a fixed number of concurrent clients for each concurrency level.
+Reports the latency percentiles, the throughput and the error rate of each level (overall, per endpoint and per
+payload size) and the peak memory of each uvicorn worker and its explanation worker processes.
+Runs offline on a single Linux machine (the memory is read from /proc); the load generator shares the CPUs with the
+service, so the results are a lower bound of the capacity.
+
+Usage (from the repository root):
+    python -m benchmarks.loadtest --uvicorn-workers 2 --workers 2 --concurrency 1 4 16 --duration 10 \\
+        --payloads 4x8 8x52 --mix 3:/prototypes 1:/prototypes?method=mask 2:/feature-attribution
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+import numpy as np
+import orjson
+
+from benchmarks.payloads import generate_anomaly_data
+from benchmarks.startup import free_port
+
+
+class FakeProducer:
+    """Stand-in for the anomaly detection that produces request bodies of several sizes.
+
+    Each size is produced in several variants (different random values), so concurrent requests are not all
+    coalesced into a single calculation.
+    """
+
+    def __init__(self, sizes: list[str], variants: int, frequency: int, anomalies: int, anomaly_length: int,
+                 seed: int = 0):
+        """Generates the request bodies.
+
+        Args:
+            sizes: The payload sizes as "<sensors>x<weeks>".
+            variants: The number of different payloads per size.
+            frequency: The number of values per hour.
+            anomalies: The number of anomalies per payload.
+            anomaly_length: The length of each anomaly (in values).
+            seed: The seed of the first variant.
+        """
+        self.anomalies = anomalies
+        self.bodies = {}
+        for size in sizes:
+            sensors, weeks = (int(e) for e in size.split("x"))
+            self.bodies[size] = [orjson.dumps({"payload": generate_anomaly_data(sensors, weeks, frequency, anomalies,
+                                                                                 anomaly_length, seed + i)})
+                                 for i in range(variants)]
+
+    def produce(self, rng: np.random.Generator) -> tuple[str, bytes]:
+        """Returns a random request body.
+
+        Args:
+            rng: The random generator of the client.
+
+        Returns:
+            The size and the request body.
+        """
+        size = list(self.bodies)[rng.integers(len(self.bodies))]
+        bodies = self.bodies[size]
+        return size, bodies[rng.integers(len(bodies))]
+
+
+class MemorySampler(threading.Thread):
+    """Samples the resident memory of the uvicorn workers and of their child processes (the explanation workers)."""
+
+    def __init__(self, pid: int, supervised: bool, interval: float = 0.25):
+        """Initializes the sampler.
+
+        Args:
+            pid: The process ID of the uvicorn main process.
+            supervised: Whether uvicorn runs the app in worker processes (--workers > 1) instead of its main process.
+            interval: The time (in seconds) between two samples.
+        """
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.supervised = supervised
+        self.interval = interval
+        self.peaks = {}
+        self._finished = threading.Event()
+
+    def run(self):
+        while not self._finished.wait(self.interval):
+            for worker, memory in sample_memory(self.pid, self.supervised).items():
+                peak = self.peaks.setdefault(worker, {"rss": 0, "children": 0, "child_processes": 0})
+                peak["rss"] = max(peak["rss"], memory["rss"])
+                peak["children"] = max(peak["children"], memory["children"])
+                peak["child_processes"] = max(peak["child_processes"], memory["child_processes"])
+
+    def stop(self) -> dict:
+        """Stops the sampling.
+
+        Returns:
+            The peak resident memory (in bytes) of each uvicorn worker and of its child processes.
+        """
+        self._finished.set()
+        self.join()
+        return self.peaks
+
+
+def sample_memory(pid: int, supervised: bool) -> dict:
+    """Reads the resident memory of the uvicorn workers and of their child processes.
+
+    Args:
+        pid: The process ID of the uvicorn main process.
+        supervised: Whether uvicorn runs the app in worker processes instead of its main process.
+
+    Returns:
+        The resident memory (in bytes) of each worker, the sum of its child processes and their number.
+    """
+    children = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as file:
+                    parent = int(file.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(parent, []).append(int(entry))
+
+    def descendants(process: int) -> list[int]:
+        return [e for child in children.get(process, []) for e in [child] + descendants(child)]
+
+    # the workers of uvicorn are spawned with multiprocessing, other children (e.g. its resource tracker) are skipped
+    workers = [e for e in children.get(pid, []) if b"spawn_main" in cmdline(e)] if supervised else [pid]
+    return {worker: {"rss": rss(worker), "children": sum(rss(e) for e in descendants(worker)),
+                     "child_processes": len(descendants(worker))} for worker in workers}
+
+
+def cmdline(pid: int) -> bytes:
+    """Reads the command line of a process.
+
+    Args:
+        pid: The process ID.
+
+    Returns:
+        The null-separated command line (empty if the process ended).
+    """
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as file:
+            return file.read()
+    except OSError:
+        return b""
+
+
+def rss(pid: int) -> int:
+    """Reads the resident memory of a process.
+
+    Args:
+        pid: The process ID.
+
+    Returns:
+        The resident memory in bytes (0 if the process ended).
+    """
+    try:
+        with open(f"/proc/{pid}/status") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+async def load(client: httpx.AsyncClient, producer: FakeProducer, mix: list[tuple[float, str]], concurrency: int,
+               duration: float, seed: int) -> list[dict]:
+    """Sends requests with a fixed number of concurrent clients.
+
+    Args:
+        client: The HTTP client.
+        producer: The producer of the request bodies.
+        mix: The weight and the path (with query) of each request type.
+        concurrency: The number of concurrent clients.
+        duration: The time (in seconds) after which no further requests are sent.
+        seed: The seed of the random choices of the clients.
+
+    Returns:
+        The path, the payload size, the status (or the name of the transport error) and the latency of each request.
+    """
+    weights = np.array([weight for weight, _ in mix]) / sum(weight for weight, _ in mix)
+    deadline = time.perf_counter() + duration
+    samples = []
+
+    async def user(rng: np.random.Generator):
+        while time.perf_counter() < deadline:
+            path = mix[rng.choice(len(mix), p=weights)][1]
+            size, body = producer.produce(rng)
+            url = f"{path}{'&' if '?' in path else '?'}anomaly={rng.integers(1, producer.anomalies + 1)}"
+            start = time.perf_counter()
+            try:
+                response = await client.post(url, content=body, headers={"content-type": "application/json"})
+                status = response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            samples.append({"path": path, "payload": size, "status": status, "latency": time.perf_counter() - start})
+
+    await asyncio.gather(*(user(np.random.default_rng([seed, i])) for i in range(concurrency)))
+    return samples
+
+
+def summarize(samples: list[dict], elapsed: float) -> dict:
+    """Summarizes the requests of a load level.
+
+    Args:
+        samples: The requests.
+        elapsed: The duration (in seconds) of the level.
+
+    Returns:
+        The number of requests, the throughput (successful requests per second), the error rate,
+        the number of requests per status and the latency percentiles (in seconds) of the successful requests.
+    """
+    latencies = np.array([e["latency"] for e in samples if e["status"] == 200])
+    statuses = {}
+    for e in samples:
+        statuses[str(e["status"])] = statuses.get(str(e["status"]), 0) + 1
+    errors = len(samples) - len(latencies)
+    summary = {"requests": len(samples), "throughput": len(latencies) / elapsed,
+               "error_rate": errors / len(samples) if samples else 0.0, "status": statuses}
+    if len(latencies):
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99]).tolist()
+        summary["latency"] = {"p50": p50, "p90": p90, "p99": p99, "mean": latencies.mean().item(),
+                              "max": latencies.max().item()}
+    return summary
+
+
+def start_service(arguments: argparse.Namespace) -> tuple[subprocess.Popen, str]:
+    """Starts the service with uvicorn and waits until it accepts requests.
+
+    Args:
+        arguments: The command line arguments.
+
+    Returns:
+        The uvicorn process and the base URL of the service.
+
+    Raises:
+        TimeoutError: The service did not start within a minute.
+    """
+    port = free_port()
+    env = dict(os.environ, EXPLAINABILITY_WORKERS=str(arguments.workers),
+               EXPLAINABILITY_RESULT_TTL=str(arguments.result_ttl), EXPLAINABILITY_START_METHOD=arguments.start_method)
+    process = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers",
+                                str(arguments.uvicorn_workers), "--log-level", "warning"], env=env)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.perf_counter() + 60
+    while time.perf_counter() < deadline:
+        try:
+            if httpx.get(f"{url}/").status_code == 200:
+                return process, url
+        except httpx.TransportError:
+            time.sleep(0.1)
+    process.terminate()
+    raise TimeoutError("The service did not start")
+
+
+async def run_levels(url: str, pid: int, producer: FakeProducer, mix: list[tuple[float, str]],
+                     arguments: argparse.Namespace) -> list[dict]:
+    """Runs the warm-up and one load level per concurrency.
+
+    Args:
+        url: The base URL of the service.
+        pid: The process ID of the uvicorn main process.
+        producer: The producer of the request bodies.
+        mix: The weight and the path (with query) of each request type.
+        arguments: The command line arguments.
+
+    Returns:
+        The summary of each level, including the peak memory of the workers.
+    """
+    levels = []
+    # without keep-alive, each request opens a new connection, which is accepted by any of the uvicorn workers
+    limits = httpx.Limits(max_connections=max(arguments.concurrency),
+                          max_keepalive_connections=max(arguments.concurrency) if arguments.keep_alive else 0)
+    async with httpx.AsyncClient(base_url=url, timeout=arguments.timeout, limits=limits) as client:
+        await load(client, producer, mix, max(arguments.concurrency), arguments.warmup, arguments.seed)
+        for concurrency in arguments.concurrency:
+            sampler = MemorySampler(pid, arguments.uvicorn_workers > 1)
+            sampler.start()
+            start = time.perf_counter()
+            samples = await load(client, producer, mix, concurrency, arguments.duration, arguments.seed + concurrency)
+            elapsed = time.perf_counter() - start
+            memory = sampler.stop()
+            level = {"concurrency": concurrency, "elapsed": elapsed, **summarize(samples, elapsed),
+                     "paths": {}, "payloads": {}, "memory": {str(worker): peak for worker, peak in memory.items()}}
+            for key, group in (("paths", "path"), ("payloads", "payload")):
+                for value in dict.fromkeys(e[group] for e in samples):
+                    level[key][value] = summarize([e for e in samples if e[group] == value], elapsed)
+            levels.append(level)
+            report(level)
+    return levels
+
+
+def report(level: dict):
+    """Prints the summary of a load level.
+
+    Args:
+        level: The summary of the level.
+    """
+    def line(name: str, summary: dict):
+        latency = summary.get("latency", {})
+        print(f"{level['concurrency']:>5} {name:<40} {summary['requests']:>8} {summary['throughput']:>8.1f} "
+              f"{latency.get('p50', np.nan) * 1000:>9.1f} {latency.get('p99', np.nan) * 1000:>9.1f} "
+              f"{summary['error_rate'] * 100:>7.2f}%")
+
+    line("all", level)
+    for path, summary in level["paths"].items():
+        line(path, summary)
+    for size, summary in level["payloads"].items():
+        line(f"payload {size}", summary)
+    for worker, peak in level["memory"].items():
+        print(f"{'':>5} worker {worker:<33} rss {peak['rss'] / 2 ** 20:.0f} MiB, "
+              f"{peak['child_processes']} child processes {peak['children'] / 2 ** 20:.0f} MiB")
+
+
+def main():
+    """Starts the service, runs the load levels and writes the results as JSON."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--uvicorn-workers", type=int, default=2, help="uvicorn worker processes")
+    parser.add_argument("--workers", type=int, default=2, help="explanation worker processes per uvicorn worker")
+    parser.add_argument("--start-method", default="spawn", help="start method of the explanation workers")
+    parser.add_argument("--result-ttl", type=float, default=0, help="result cache TTL (in s) of the service")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="concurrent clients per level")
+    parser.add_argument("--duration", type=float, default=10, help="duration (in s) of each level")
+    parser.add_argument("--warmup", type=float, default=2, help="duration (in s) of the warm-up")
+    parser.add_argument("--timeout", type=float, default=60, help="timeout (in s) of each request")
+    parser.add_argument("--keep-alive", action="store_true", help="reuse the connections of the clients")
+    parser.add_argument("--payloads", nargs="+", default=["4x8", "8x52"], help="payload sizes as <sensors>x<weeks>")
+    parser.add_argument("--variants", type=int, default=8, help="different payloads per size")
+    parser.add_argument("--frequency", type=int, default=4, help="values per hour")
+    parser.add_argument("--anomalies", type=int, default=5, help="anomalies per payload")
+    parser.add_argument("--anomaly-length", type=int, default=8, help="length of each anomaly (in values)")
+    parser.add_argument("--mix", nargs="+", default=["3:/prototypes", "1:/feature-attribution"],
+                        help="request types as <weight>:<path with query>")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the payloads and the clients")
+    parser.add_argument("--output", help="path of the JSON results (optional)")
+    arguments = parser.parse_args()
+
+    mix = [(float(weight), path) for weight, path in (e.split(":", 1) for e in arguments.mix)]
+    producer = FakeProducer(arguments.payloads, arguments.variants, arguments.frequency, arguments.anomalies,
+                            arguments.anomaly_length, arguments.seed)
+    process, url = start_service(arguments)
+    try:
+        print(f"{'conc.':>5} {'requests of':<40} {'count':>8} {'req/s':>8} {'p50 (ms)':>9} {'p99 (ms)':>9} "
+              f"{'errors':>8}")
+        levels = asyncio.run(run_levels(url, process.pid, producer, mix, arguments))
+    finally:
+        process.terminate()
+        process.wait()
+    if arguments.output:
+        with open(arguments.output, "wb") as file:
+            file.write(orjson.dumps({"parameters": vars(arguments), "levels": levels}, option=orjson.OPT_INDENT_2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Benchmarks the nearest-neighbour prototypes for growing history lengths
+
+Compares the FFT-based distance profile (MASS) with a naive scan that z-normalizes and compares every window,
+both in duration and in the calculated distances (the benchmark fails if they differ by more than the tolerance).
+
+Usage (from the repository root):
+    python -m benchmarks.nearest_prototypes --weeks 4 16 64 256 --offset 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from src import prototypes
+
+
+def naive_distance_profile(series: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """Calculates the z-normalized euclidean distance of each window with a scan over all windows in O(n * m).
+
+    Args:
+        series: The values of a sensor.
+        query: The query window.
+
+    Returns:
+        The distance of each window.
+    """
+    m = len(query)
+    query = (query - query.mean()) / query.std()
+    distances = np.empty(len(series) - m + 1)
+    for i in range(len(distances)):
+        window = series[i:i + m]
+        distances[i] = np.linalg.norm((window - window.mean()) / window.std() - query)
+    return distances
+
+
+def profile_error(series: np.ndarray, start: int, length: int) -> float:
+    """Returns the largest difference between the squared distances of MASS and the naive scan.
+
+    The squared distances are compared, since the square root amplifies rounding errors of windows that are almost
+    identical to the query (e.g. the query window itself).
+
+    Args:
+        series: The values of a sensor.
+        start: The index of the first value of the query window.
+        length: The length of the query window.
+
+    Returns:
+        The largest absolute difference of the squared distances of all windows with variance.
+    """
+    query = series[start:start + length]
+    mass = prototypes.calculate_distance_profile(series, query)
+    naive = naive_distance_profile(series, query)
+    finite = np.isfinite(mass) & np.isfinite(naive)
+    if (np.isfinite(mass) != np.isfinite(naive)).any():
+        return np.inf
+    return float(np.abs(mass[finite] ** 2 - naive[finite] ** 2).max(initial=0.0))
+
+
+def measure(function, repeat: int) -> float:
+    """Returns the best time of several calls of the function.
+
+    Args:
+        function: The function to call.
+        repeat: The number of calls.
+
+    Returns:
+        The shortest duration (in seconds).
+    """
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+
+def main():
+    """Runs the benchmark and prints one line per history length."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--weeks", type=int, nargs="+", default=[4, 16, 64, 256], help="history lengths in weeks")
+    parser.add_argument("--frequency", type=int, default=4, help="values per hour")
+    parser.add_argument("--padding", type=int, default=4, help="padding (in h) on both sides of the anomaly")
+    parser.add_argument("--anomaly-length", type=int, default=8, help="length of the anomaly (in values)")
+    parser.add_argument("--repeat", type=int, default=3, help="calls per measurement")
+    parser.add_argument("--naive-limit", type=int, default=64, help="maximum weeks for the naive scan")
+    parser.add_argument("--offset", type=float, default=0.0, help="level of the series (e.g. of meter readings)")
+    parser.add_argument("--tolerance", type=float, default=1e-6, help="maximum error of the squared distances")
+    arguments = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    length = 2 * arguments.padding * arguments.frequency + arguments.anomaly_length
+    failed = False
+    print(f"{'weeks':>6} {'values':>9} {'mass (ms)':>10} {'naive (ms)':>11} {'speedup':>8} {'error':>9}")
+    for weeks in arguments.weeks:
+        n = weeks * 168 * arguments.frequency
+        day = np.sin(np.arange(n) * 2 * np.pi / (24 * arguments.frequency))
+        series = arguments.offset + day + rng.normal(0, 0.1, n)
+        start = n // 2
+        mass = measure(lambda: prototypes.find_nearest_windows(series, start, length, 2), arguments.repeat)
+        if weeks <= arguments.naive_limit:
+            naive = measure(lambda: naive_distance_profile(series, series[start:start + length]), 1)
+            error = profile_error(series, start, length)
+            failed |= not error <= arguments.tolerance
+            print(f"{weeks:>6} {n:>9} {mass * 1000:>10.2f} {naive * 1000:>11.2f} {naive / mass:>7.1f}x {error:>9.1e}")
+        else:
+            print(f"{weeks:>6} {n:>9} {mass * 1000:>10.2f} {'-':>11} {'-':>8} {'-':>9}")
+    if failed:
+        raise SystemExit(f"The distances of MASS differ from the naive scan by more than {arguments.tolerance}")
+
+
+if __name__ == "__main__":
+    main()
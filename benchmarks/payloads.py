@@ -0,0 +1,95 @@
+"""Generates synthetic outputs of the anomaly detection for benchmarks and load tests
+
+The values of each sensor follow a daily and a weekly pattern with noise, the anomalies are spikes or level shifts
+with an increased deep error at non-overlapping positions after the first week.
+
+Usage (from the repository root):
+    python -m benchmarks.payloads --sensors 8 --weeks 52 --output payload.json
+"""
+import argparse
+
+import numpy as np
+import orjson
+import pandas as pd
+
+
+def generate_anomaly_data(sensors: int = 4, weeks: int = 8, frequency: int = 4, anomalies: int = 5,
+                          anomaly_length: int = 8, seed: int = 0) -> dict:
+    """Generates a synthetic output of the anomaly detection in the JSON format of the endpoints.
+
+    Args:
+        sensors: The number of sensors.
+        weeks: The length of the history in weeks.
+        frequency: The number of values per hour.
+        anomalies: The number of anomalies.
+        anomaly_length: The length of each anomaly (in values).
+        seed: The seed of the random values.
+
+    Returns:
+        The output of the anomaly detection with the dataframe as nested dict.
+
+    Raises:
+        ValueError: The history is too short for the anomalies.
+    """
+    rng = np.random.default_rng(seed)
+    length = weeks * 168 * frequency
+    week_length = 168 * frequency
+    if anomalies and (length - week_length) // max(anomaly_length, 1) < anomalies:
+        raise ValueError("History is too short for the anomalies")
+    index = pd.date_range("2020-07-31T20:00:00", periods=length, freq=pd.Timedelta(hours=1) / frequency)
+    timestamps = index.strftime("%Y-%m-%dT%H:%M:%S").tolist()
+
+    hours = np.arange(length) / frequency
+    day = np.clip(np.sin((hours % 24 - 6) * np.pi / 12), 0, None)
+    workday = np.where((hours // 24 + index[0].dayofweek) % 7 < 5, 1.0, 0.4)
+    scales = rng.uniform(0.5, 5.0, (sensors, 1))
+    values = scales * (0.2 + day * workday + rng.normal(0, 0.05, (sensors, length)))
+    deep_error = np.abs(rng.normal(0, 0.01, (sensors, length)))
+
+    slots = rng.choice((length - week_length) // anomaly_length, anomalies, replace=False) if anomalies else []
+    positions = np.sort(week_length + np.asarray(slots, dtype=np.int64) * anomaly_length)
+    entries = []
+    for position in positions.tolist():
+        sensor = rng.integers(sensors)
+        kind = "Point" if anomaly_length == 1 or rng.random() < 0.5 else "Area"
+        if kind == "Point":
+            values[sensor, position:position + anomaly_length] += scales[sensor] * rng.uniform(2, 4)
+        else:
+            values[sensor, position:position + anomaly_length] *= rng.uniform(1.5, 2.5)
+        deep_error[sensor, position:position + anomaly_length] += rng.uniform(0.2, 0.5)
+        entries.append({"timestamp": timestamps[position], "type": kind, "index": position,
+                        "length": anomaly_length})
+
+    names = [f"Sensor.{i + 1} Diff" for i in range(sensors)]
+    values = values.round(4)
+    return {
+        "deep-error": deep_error.tolist(),
+        "dataframe": {name: dict(zip(timestamps, row)) for name, row in zip(names, values.tolist())},
+        "sensors": names,
+        "algo": 2,
+        "timestamps": timestamps,
+        "anomalies": entries,
+        "error": deep_error.mean(axis=0).tolist()
+    }
+
+
+def main():
+    """Writes a generated output of the anomaly detection as request body ({"payload": ...}) to a file."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sensors", type=int, default=4, help="number of sensors")
+    parser.add_argument("--weeks", type=int, default=8, help="history length in weeks")
+    parser.add_argument("--frequency", type=int, default=4, help="values per hour")
+    parser.add_argument("--anomalies", type=int, default=5, help="number of anomalies")
+    parser.add_argument("--anomaly-length", type=int, default=8, help="length of each anomaly (in values)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random values")
+    parser.add_argument("--output", required=True, help="path of the JSON file")
+    arguments = parser.parse_args()
+
+    anomaly_data = generate_anomaly_data(arguments.sensors, arguments.weeks, arguments.frequency,
+                                         arguments.anomalies, arguments.anomaly_length, arguments.seed)
+    with open(arguments.output, "wb") as file:
+        file.write(orjson.dumps({"payload": anomaly_data}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Benchmarks the cold start of the service (time to the first successful request)
+
+Starts the service with uvicorn in a new process for each run and sends requests until the first one succeeds.
+Reports the time from the start of the process until the service accepts connections (GET /), until the first
+explanation succeeds (POST /prototypes, calculated by a worker process) and the duration of the first request of the
+OpenAPI schema. The modes differ in the start method of the worker processes and the generation of the schema:
+
+- default: spawned workers, schema generated on first use
+- forkserver: workers forked from a server process that preloaded the explanations, schema read from a generated file
+- fork: workers forked from the service process, schema read from a generated file
+
+Usage (from the repository root):
+    python -m benchmarks.startup --modes default forkserver fork --runs 5
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import orjson
+
+from benchmarks.payloads import generate_anomaly_data
+
+MODES = {
+    "default": {"EXPLAINABILITY_START_METHOD": "spawn"},
+    "forkserver": {"EXPLAINABILITY_START_METHOD": "forkserver", "EXPLAINABILITY_PRELOAD": "src.explanations"},
+    "fork": {"EXPLAINABILITY_START_METHOD": "fork"},
+}
+
+
+def free_port() -> int:
+    """Returns a free local TCP port.
+
+    Returns:
+        The port number.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(client: httpx.Client, method: str, url: str, start: float, timeout: float, **kwargs) -> float:
+    """Sends the request until it succeeds.
+
+    Args:
+        client: The HTTP client.
+        method: The HTTP method.
+        url: The URL of the request.
+        start: The start time of the service process (time.perf_counter).
+        timeout: The maximum time (in seconds) since the start.
+        **kwargs: The further arguments of the request.
+
+    Returns:
+        The time (in seconds) from the start until the first successful response.
+
+    Raises:
+        TimeoutError: No request succeeded within the timeout.
+    """
+    while time.perf_counter() - start < timeout:
+        try:
+            if client.request(method, url, **kwargs).status_code == 200:
+                return time.perf_counter() - start
+        except httpx.TransportError:
+            pass
+        time.sleep(0.005)
+    raise TimeoutError(f"{method} {url} did not succeed within {timeout} s")
+
+
+def run(mode: str, workers: int, body: bytes, schema_file: str, timeout: float) -> dict:
+    """Starts the service once and measures its cold start.
+
+    Args:
+        mode: The name of the mode.
+        workers: The number of worker processes.
+        body: The request body of the explanation.
+        schema_file: The path of the generated OpenAPI schema.
+        timeout: The maximum time (in seconds) until the first explanation succeeds.
+
+    Returns:
+        The time until the service listens and until the first explanation succeeds
+        and the duration of the first request of the OpenAPI schema (in seconds).
+    """
+    port = free_port()
+    env = dict(os.environ, EXPLAINABILITY_WORKERS=str(workers), **MODES[mode])
+    if mode != "default":
+        env["EXPLAINABILITY_OPENAPI_FILE"] = schema_file
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level",
+                                "warning"], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=timeout) as client:
+            listening = wait_for(client, "GET", "/", start, timeout)
+            first = wait_for(client, "POST", "/prototypes?anomaly=1", start, timeout, content=body,
+                             headers={"content-type": "application/json"})
+            openapi = time.perf_counter()
+            client.get("/openapi.json").raise_for_status()
+            return {"listening": listening, "first_request": first, "openapi": time.perf_counter() - openapi}
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    """Runs the benchmark and prints the median times of each mode."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES), help="start-up modes")
+    parser.add_argument("--runs", type=int, default=3, help="starts per mode")
+    parser.add_argument("--workers", type=int, default=2, help="worker processes of the service")
+    parser.add_argument("--weeks", type=int, default=4, help="history length of the payload in weeks")
+    parser.add_argument("--timeout", type=float, default=60, help="maximum time (in s) until the first explanation")
+    parser.add_argument("--output", help="path of the JSON results (optional)")
+    arguments = parser.parse_args()
+
+    body = orjson.dumps({"payload": generate_anomaly_data(weeks=arguments.weeks)})
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        schema_file = os.path.join(directory, "openapi.json")
+        subprocess.run([sys.executable, "-m", "src.schema", schema_file], check=True, stderr=subprocess.DEVNULL)
+        print(f"{'mode':<12} {'listening (ms)':>15} {'first request (ms)':>19} {'openapi (ms)':>13}")
+        for mode in arguments.modes:
+            runs = [run(mode, arguments.workers, body, schema_file, arguments.timeout) for _ in range(arguments.runs)]
+            results[mode] = {key: statistics.median(e[key] for e in runs) for key in runs[0]}
+            results[mode]["runs"] = runs
+            print(f"{mode:<12} {results[mode]['listening'] * 1000:>15.0f} "
+                  f"{results[mode]['first_request'] * 1000:>19.0f} {results[mode]['openapi'] * 1000:>13.1f}")
+    if arguments.output:
+        with open(arguments.output, "wb") as file:
+            file.write(orjson.dumps({"parameters": vars(arguments), "results": results}, option=orjson.OPT_INDENT_2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""Runs the micro-benchmarks of the functions in src and the end-to-end benchmarks of the endpoints
+
+The micro-benchmarks call each function with the parsed output of the anomaly detection (as it is kept for a
+registered dataset) and a fresh context, so memoized intermediate results are not reused between calls.
+The end-to-end benchmarks send requests to the app through an in-process ASGI client (httpx.ASGITransport),
+including the decoding of the payload, the worker processes and the encoding of the response.
+The results are written as JSON, so runs can be compared with --baseline.
+
+Usage (from the repository root):
+    python -m benchmarks.suite --sensors 8 --weeks 52 --output results.json
+    python -m benchmarks.suite --baseline results.json
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+import orjson
+import pandas as pd
+
+from benchmarks.payloads import generate_anomaly_data
+
+
+def measure(function, repeat: int, warmup: int = 1) -> dict:
+    """Measures the duration of several calls of the function.
+
+    Args:
+        function: The function to call.
+        repeat: The number of measured calls.
+        warmup: The number of calls before the measurement.
+
+    Returns:
+        The minimum, median, mean and standard deviation of the durations (in seconds) and the number of calls.
+    """
+    for _ in range(warmup):
+        function()
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return summarize(durations)
+
+
+async def measure_async(function, repeat: int, warmup: int = 1) -> dict:
+    """Measures the duration of several calls of the coroutine function.
+
+    Args:
+        function: The coroutine function to call.
+        repeat: The number of measured calls.
+        warmup: The number of calls before the measurement.
+
+    Returns:
+        The minimum, median, mean and standard deviation of the durations (in seconds) and the number of calls.
+    """
+    for _ in range(warmup):
+        await function()
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await function()
+        durations.append(time.perf_counter() - start)
+    return summarize(durations)
+
+
+def summarize(durations: list[float]) -> dict:
+    """Summarizes the durations of a benchmark.
+
+    Args:
+        durations: The duration of each call (in seconds).
+
+    Returns:
+        The minimum, median, mean and standard deviation of the durations and the number of calls.
+    """
+    return {"min": min(durations), "median": statistics.median(durations), "mean": statistics.fmean(durations),
+            "stdev": statistics.stdev(durations) if len(durations) > 1 else 0.0, "repeat": len(durations)}
+
+
+def micro_benchmarks(payload: dict, anomalies: list[int], padding: int) -> dict:
+    """Returns the micro-benchmarks of the functions in src.
+
+    Args:
+        payload: The output of the anomaly detection in the JSON format.
+        anomalies: The IDs of the anomalies (starting at 0).
+        padding: The padding (in h) of the prototypes.
+
+    Returns:
+        A function without arguments for each benchmark name.
+    """
+    from src import datasets, downsampling, formats, ingestion, prototypes
+    from src import feature_attribution as ft
+    from src.context import ExplanationContext
+
+    # like a registered dataset, with the intermediate results shared by all requests
+    parsed = datasets.precompute_anomaly_data(datasets.parse_anomaly_data(payload))
+    anomaly = anomalies[0]
+    context = ExplanationContext(parsed)
+    sensor = context.sensor(anomaly)
+    series = context.series(sensor)
+    window = prototypes.create_averaged_prototypes(anomaly, parsed, padding, context)
+    result = {"prototypes": {"prototype a": window[0], "prototype b": window[1], "anomaly": window[2]}}
+    last = prototypes.HistoryPolicy("last", 4)
+
+    benchmarks = {
+        "ingestion.build_dataframe": lambda: ingestion.build_dataframe(payload["dataframe"]),
+        "datasets.parse_anomaly_data": lambda: datasets.parse_anomaly_data(payload),
+        "datasets.content_hash": lambda: datasets.content_hash(payload),
+        "ft.fetch_deep_error": lambda: ft.fetch_deep_error(payload),
+        "ft.calculate_prefix_sums": lambda: ft.calculate_prefix_sums(context.deep_error),
+        "prototypes.calculate_minute_of_week_index":
+            lambda: prototypes.calculate_minute_of_week_index(parsed["dataframe"].index),
+        "prototypes.fetch_frequency": lambda: prototypes.fetch_frequency(parsed["dataframe"]),
+        "prototypes.calculate_distance_profile":
+            lambda: prototypes.calculate_distance_profile(series, series[:len(window[0])]),
+        "downsampling.lttb_positions": lambda: downsampling.lttb_positions(list(window), 16),
+        "formats.encode_response/json": lambda: formats.encode_response(result, None),
+        "formats.encode_response/npz": lambda: formats.encode_response(result, formats.NPZ),
+        "formats.encode_response/arrow": lambda: formats.encode_response(result, formats.ARROW),
+    }
+    for function in (ft.calculate_averaged_feature_attribution, ft.calculate_median_feature_attribution,
+                     ft.calculate_basic_feature_attribution, ft.calculate_very_basic_feature_attribution):
+        benchmarks[f"ft.{function.__name__}"] = lambda function=function: function(anomaly, parsed)
+    for function in ft.FEATURE_ATTRIBUTION_BATCHES.values():
+        benchmarks[f"ft.{function.__name__}"] = \
+            lambda function=function: function(anomalies, parsed, ExplanationContext(parsed))
+    for function in (prototypes.create_averaged_prototypes, prototypes.create_averaged_prototypes_mask,
+                     prototypes.create_local_prototypes, prototypes.create_nearest_prototypes):
+        benchmarks[f"prototypes.{function.__name__}"] = \
+            lambda function=function: function(anomaly, parsed, padding, ExplanationContext(parsed))
+    benchmarks.update({
+        "prototypes.create_averaged_prototypes/last":
+            lambda: prototypes.create_averaged_prototypes(anomaly, parsed, padding, ExplanationContext(parsed),
+                                                          history=last),
+        "prototypes.create_averaged_prototypes_batch":
+            lambda: prototypes.create_averaged_prototypes_batch(anomalies, parsed, padding,
+                                                                context=ExplanationContext(parsed)),
+        "prototypes.create_averaged_prototypes_sensors":
+            lambda: prototypes.create_averaged_prototypes_sensors(anomaly, parsed, list(range(len(parsed["sensors"]))),
+                                                                  padding, ExplanationContext(parsed)),
+    })
+    return benchmarks
+
+
+async def end_to_end_benchmarks(payload: dict, repeat: int, padding: int, selection: str = "") -> dict:
+    """Runs the end-to-end benchmarks of the endpoints through an in-process ASGI client.
+
+    Args:
+        payload: The output of the anomaly detection in the JSON format.
+        repeat: The number of measured requests per benchmark.
+        padding: The padding (in h) of the prototypes.
+        selection: Only benchmarks whose name contains this text are run.
+
+    Returns:
+        The results of each benchmark.
+    """
+    import httpx
+    import main
+    from src import explanations
+
+    body = orjson.dumps({"payload": payload})
+    headers = {"content-type": "application/json"}
+    results = {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.lifespan(main.app), httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        async def post(url: str, content: bytes = body):
+            response = await client.post(url, content=content, headers=headers)
+            if response.status_code != 200:
+                raise RuntimeError(f"{url} returned {response.status_code}: {response.text}")
+            return response
+
+        dataset = (await post("/datasets")).json()["dataset"]
+        requests = {f"POST /prototypes?method={method}": (f"/prototypes?anomaly=1&method={method}&padding={padding}",
+                                                          body) for method in explanations.PROTOTYPE_METHODS}
+        requests.update({f"POST /feature-attribution?method={method}":
+                         (f"/feature-attribution?anomaly=1&method={method}", body)
+                         for method in explanations.FEATURE_ATTRIBUTION_METHODS})
+        requests.update({
+            "POST /explanations": (f"/explanations?padding={padding}", body),
+            "POST /datasets": ("/datasets", body),
+            "POST /prototypes?dataset": (f"/prototypes?anomaly=1&padding={padding}&dataset={dataset}", b"")
+        })
+        for name, (url, content) in requests.items():
+            if selection in name:
+                results[name] = await measure_async(lambda url=url, content=content: post(url, content), repeat)
+    return results
+
+
+def compare(results: dict, baseline: dict):
+    """Prints the ratio of the median durations of two runs for all benchmarks of both runs.
+
+    Args:
+        results: The results of the current run.
+        baseline: The results of an earlier run.
+    """
+    if baseline.get("parameters") != results["parameters"]:
+        print(f"\nThe baseline was run with different parameters: {baseline.get('parameters')}", file=sys.stderr)
+    print(f"\n{'benchmark':<60} {'baseline (ms)':>14} {'current (ms)':>13} {'ratio':>7}")
+    for group in ("micro", "end_to_end"):
+        for name, result in results[group].items():
+            if name in baseline.get(group, {}):
+                before, after = baseline[group][name]["median"], result["median"]
+                print(f"{name:<60} {before * 1000:>14.3f} {after * 1000:>13.3f} {after / before:>6.2f}x")
+
+
+def environment() -> dict:
+    """Returns the versions and the commit the benchmarks were run with.
+
+    Returns:
+        A dict with the commit, the versions of Python, NumPy and pandas and the platform.
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "numpy": np.__version__,
+            "pandas": pd.__version__, "platform": platform.platform(), "cpus": os.cpu_count()}
+
+
+def main():
+    """Runs the benchmarks, prints their median durations and writes the results as JSON."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sensors", type=int, default=4, help="number of sensors")
+    parser.add_argument("--weeks", type=int, default=8, help="history length in weeks")
+    parser.add_argument("--frequency", type=int, default=4, help="values per hour")
+    parser.add_argument("--anomalies", type=int, default=5, help="number of anomalies")
+    parser.add_argument("--anomaly-length", type=int, default=8, help="length of each anomaly (in values)")
+    parser.add_argument("--padding", type=int, default=4, help="padding (in h) of the prototypes")
+    parser.add_argument("--repeat", type=int, default=5, help="measured calls per benchmark")
+    parser.add_argument("--workers", type=int, default=0, help="worker processes of the app (0 runs in threads)")
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this text")
+    parser.add_argument("--skip-end-to-end", action="store_true", help="only run the micro-benchmarks")
+    parser.add_argument("--output", help="path of the JSON results (default: benchmarks/results/<time>.json)")
+    parser.add_argument("--baseline", help="path of earlier JSON results to compare with")
+    arguments = parser.parse_args()
+
+    # configure the app before it is imported: identical requests must not be answered from the result cache
+    os.environ["EXPLAINABILITY_WORKERS"] = str(arguments.workers)
+    os.environ["EXPLAINABILITY_RESULT_TTL"] = "0"
+    parameters = {key: getattr(arguments, key) for key in
+                  ("sensors", "weeks", "frequency", "anomalies", "anomaly_length", "padding", "repeat", "workers")}
+    payload = generate_anomaly_data(arguments.sensors, arguments.weeks, arguments.frequency, arguments.anomalies,
+                                    arguments.anomaly_length)
+    anomalies = list(range(len(payload["anomalies"])))
+
+    results = {"created": datetime.datetime.now(datetime.timezone.utc).isoformat(), "environment": environment(),
+               "parameters": parameters, "micro": {}, "end_to_end": {}}
+    print(f"{'benchmark':<60} {'median (ms)':>12} {'min (ms)':>10}")
+    for name, function in micro_benchmarks(payload, anomalies, arguments.padding).items():
+        if arguments.filter in name:
+            results["micro"][name] = measure(function, arguments.repeat)
+            print(f"{name:<60} {results['micro'][name]['median'] * 1000:>12.3f} "
+                  f"{results['micro'][name]['min'] * 1000:>10.3f}")
+    if not arguments.skip_end_to_end:
+        results["end_to_end"] = asyncio.run(end_to_end_benchmarks(payload, arguments.repeat, arguments.padding,
+                                                                  arguments.filter))
+        for name, result in results["end_to_end"].items():
+            print(f"{name:<60} {result['median'] * 1000:>12.3f} {result['min'] * 1000:>10.3f}")
+
+    output = arguments.output or os.path.join(
+        "benchmarks", "results", datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "wb") as file:
+        file.write(orjson.dumps(results, option=orjson.OPT_INDENT_2))
+    print(f"\nResults written to {output}", file=sys.stderr)
+    if arguments.baseline:
+        with open(arguments.baseline, "rb") as file:
+            compare(results, orjson.loads(file.read()))
+
+
+if __name__ == "__main__":
+    main()
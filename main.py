@@ -1,10 +1,31 @@
 """The main module with all API definitions of the Explainability service"""
-from fastapi import FastAPI, Body, HTTPException, Query
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Literal
 
-from src import schema, feature_attribution, prototypes
+from fastapi import FastAPI, Body, Depends, Header, HTTPException, Query, Response
 
+from src import schema, prototypes, datasets, ingestion, formats, coalescing, metrics, storage
+from src.executor import executor, ExecutorSaturated
+from src.explanations import explain_prototypes, explain_attribution, explain_anomalies
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    """Starts the worker processes for the explanations with the service and stops them on shutdown."""
+    executor.start()
+    yield
+    executor.shutdown(wait=True)
+
+
+app = FastAPI(lifespan=lifespan)
+app.router.route_class = ingestion.ORJSONRoute
+app.add_middleware(formats.CompressionMiddleware, minimum_size=formats.COMPRESSION_MIN_BYTES, compresslevel=6)
+if metrics.enabled:
+    app.middleware("http")(metrics.timing_middleware)
+
+# registered datasets are kept in the on-disk store if it is configured, otherwise in the in-memory cache
+DATASETS = storage.store if storage.store is not None else datasets.cache
 
 
 @app.get(
@@ -41,6 +62,177 @@ async def root():
     return url_list
 
 
+@app.post(
+    "/datasets",
+    name="Register a dataset",
+    summary="Register the output of the anomaly detection for later requests",
+    description="Parses and caches the output of the anomaly detection and returns a handle for later requests.",
+    response_description="The content hash that identifies the registered dataset.",
+    responses={
+        200: {
+            "content": {
+                "application/json": {
+                    "example": {"dataset": "3f79bb7b435b05321651daefd374cdc681dc06faa65e374e38337b88ca046dea"}
+                }
+            },
+        },
+        400: {
+            "description": "Payload can not be empty or is malformed.",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Timestamps of the dataframe must be evenly spaced"}
+                }
+            },
+        },
+        413: {
+            "description": "Dataset exceeds the size of the cache.",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Dataset exceeds the size of the cache"}
+                }
+            },
+        },
+        415: {
+            "description": "Unsupported content type.",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Unsupported content type"}
+                }
+            },
+        },
+        500: {
+            "description": "Internal server error.",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Internal server error"}
+                }
+            },
+        }
+    },
+    tags=["Datasets"]
+)
+def register_dataset(
+        payload=Body(
+            default=None,
+            description="A dict of the output of anomaly-detection",
+            embed=True
+        ),
+        binary_payload: dict | None = Depends(formats.read_binary_payload),
+        accept: str | None = Header(default=None, include_in_schema=False)
+):
+    """Registers the output of the anomaly detection in the dataset cache (or the on-disk store if configured).
+
+    Args:
+        payload: The output of the anomaly detection.
+        binary_payload: The output of the anomaly detection decoded from an Arrow IPC stream or an NPZ archive.
+        accept: The Accept header that selects the response format (JSON, Arrow IPC or NPZ).
+
+    Returns:
+        The content hash that can be passed as dataset to the other endpoints.
+    """
+    try:
+        payload = binary_payload if binary_payload is not None else payload
+        if not payload:
+            raise HTTPException(status_code=400, detail="Payload can not be empty")
+        return formats.encode_response({"dataset": DATASETS.put(payload)}, accept)
+    except HTTPException:
+        raise
+    except datasets.DatasetTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
+@app.get(
+    "/datasets/stats",
+    name="Get dataset cache statistics",
+    summary="Get the utilization and counters of the dataset cache",
+    description="Returns the number of entries, the used memory and the hit, miss and eviction counters.",
+    response_description="Dict of cache statistics.",
+    responses={
+        200: {
+            "content": {
+                "application/json": {
+                    "example": {"entries": 2, "bytes": 18874368, "max_bytes": 536870912, "ttl": 3600.0,
+                                "hits": 40, "misses": 1, "evictions": 0, "expirations": 1}
+                }
+            },
+        }
+    },
+    tags=["Datasets"]
+)
+def dataset_stats():
+    """Returns the statistics of the dataset cache (or the on-disk store if configured).
+
+    Returns:
+        The utilization and the counters of the dataset cache or the number and size of the stored datasets.
+    """
+    return DATASETS.stats()
+
+
+@app.get(
+    "/coalescing/stats",
+    name="Get request coalescing statistics",
+    summary="Get the counters of the request coalescing",
+    description="Returns the number of requests, calculations, coalesced requests and cache hits.",
+    response_description="Dict of coalescing statistics.",
+    responses={
+        200: {
+            "content": {
+                "application/json": {
+                    "example": {"requests": 12, "calculations": 4, "coalesced": 6, "cache_hits": 2, "running": 0,
+                                "cached": 4, "ratio": 0.6666666666666666}
+                }
+            },
+        }
+    },
+    tags=["Explanations"]
+)
+def coalescing_stats():
+    """Returns the statistics of the request coalescing.
+
+    Returns:
+        The counters of the request coalescing and the ratio of requests that did not need an own calculation.
+    """
+    return coalescing.single_flight.stats()
+
+
+@app.get(
+    "/metrics",
+    name="Get metrics",
+    summary="Get the stage timings and counters in the Prometheus text format",
+    description="Returns histograms of the duration of each request stage per endpoint and method "
+                "as well as the counters of the dataset cache, the request coalescing and the executor. "
+                "Stage timings are only recorded if EXPLAINABILITY_METRICS is enabled.",
+    response_description="Metrics in the Prometheus text format.",
+    responses={
+        200: {
+            "content": {
+                "text/plain": {
+                    "example": 'explainability_stage_seconds_count{endpoint="/prototypes",method="averaged",'
+                               'stage="windows"} 12'
+                }
+            },
+        }
+    },
+    response_class=Response
+)
+def get_metrics():
+    """Returns the metrics of the service.
+
+    Returns:
+        The stage histograms and the counters in the Prometheus text format.
+    """
+    content = metrics.render({
+        "dataset_cache": DATASETS.stats(),
+        "coalescing": coalescing.single_flight.stats(),
+        "executor": {"workers": executor.workers, "pending": executor.pending}
+    })
+    return Response(content=content, media_type="text/plain; version=0.0.4")
+
+
 @app.post(
     "/prototypes",
     name="Get prototypes for a selected anomaly",
@@ -74,10 +266,26 @@ async def root():
             },
         },
         400: {
-            "description": "Payload can not be empty.",
+            "description": "Payload can not be empty or is not supported by the method.",
             "content": {
                 "application/json": {
-                    "example": {"detail": "Payload can not be empty"}
+                    "example": {"detail": "Timestamps of the dataframe must be evenly spaced"}
+                }
+            },
+        },
+        404: {
+            "description": "Dataset not found.",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Dataset not found"}
+                }
+            },
+        },
+        415: {
+            "description": "Unsupported content type.",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Unsupported content type"}
                 }
             },
         },
@@ -88,17 +296,88 @@ async def root():
                     "example": {"detail": "Internal server error"}
                 }
             },
+        },
+        503: {
+            "description": "Service is busy.",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Service is busy"}
+                }
+            },
+        },
+        504: {
+            "description": "Explanation timed out.",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Explanation timed out"}
+                }
+            },
         }
     },
     tags=["Prototypes"]
 )
-def calculate_prototypes(
+async def calculate_prototypes(
         anomaly: int = Query(
             description="Query parameter to select the anomaly.",
             example=0
         ),
+        method: Literal["averaged", "mask", "local", "nearest"] = Query(
+            default="averaged",
+            description="Query parameter to select the method for the prototype creation."
+        ),
+        padding: int = Query(
+            default=4,
+            ge=0,
+            description="Query parameter to select the padding (in h) on both sides of the anomaly."
+        ),
+        top_k: int | None = Query(
+            default=None,
+            ge=1,
+            description="Query parameter to create the prototypes for the k sensors with the highest attribution "
+                        "(averaged method only)."
+        ),
+        sensors: list[str] | None = Query(
+            default=None,
+            description="Query parameter to create the prototypes for the selected sensors (averaged method only)."
+        ),
+        incremental: bool = Query(
+            default=False,
+            description="Query parameter to read the prototypes from the seasonal profile of the streamed sensor data "
+                        "instead of recomputing them exactly (averaged method only)."
+        ),
+        history: Literal["all", "last", "decay", "reservoir"] = Query(
+            default="all",
+            description="Query parameter to select the weeks that contribute to the prototypes: all weeks, the last "
+                        "weeks, exponentially decayed weeks or a random sample of weeks (averaged method only)."
+        ),
+        weeks: int | None = Query(
+            default=None,
+            ge=1,
+            description="Query parameter to select the number of weeks for the last and reservoir history."
+        ),
+        half_life: float | None = Query(
+            default=None,
+            gt=0,
+            description="Query parameter to select the half-life (in weeks) for the decay history."
+        ),
+        max_points: int | None = Query(
+            default=None,
+            ge=3,
+            description="Query parameter to downsample the prototypes and the anomaly to at most this number of "
+                        "values at shared positions (Largest-Triangle-Three-Buckets, averaged and nearest methods "
+                        "only)."
+        ),
+        precision: int | None = Query(
+            default=None,
+            ge=0,
+            description="Query parameter to round the values of the response to this number of decimals."
+        ),
+        dataset: str | None = Query(
+            default=None,
+            description="Query parameter to select a registered dataset instead of sending the payload."
+        ),
         payload=Body(
-            default=...,
+            default=None,
             description="A dict of the output of anomaly-detection",
             example={
                 "payload": {
@@ -129,26 +408,69 @@ def calculate_prototypes(
                 }
             },
             embed=True
-        )
+        ),
+        binary_payload: dict | None = Depends(formats.read_binary_payload),
+        accept: str | None = Header(default=None, include_in_schema=False),
+        payload_hash: str | None = Depends(coalescing.body_hash)
 ):
     """Creates prototypes for the specified anomaly.
 
     Args:
         anomaly: The ID of the anomaly for which the prototypes are created.
+        method: The method for the prototype creation.
+        padding: The padding (in h) on both sides of the anomaly.
+        top_k: The number of sensors with the highest attribution to create the prototypes for.
+        sensors: The names of the sensors to create the prototypes for.
+        incremental: Whether to read the prototypes from the seasonal profile instead of recomputing them exactly.
+        history: The policy that selects the weeks that contribute to the prototypes.
+        weeks: The number of weeks for the last and reservoir history.
+        half_life: The half-life (in weeks) for the decay history.
+        max_points: The maximum number of values of the prototypes and the anomaly.
+        precision: The number of decimals to round the values of the response to.
+        dataset: The content hash of a registered output of the anomaly detection.
         payload: The output of the anomaly detection.
+        binary_payload: The output of the anomaly detection decoded from an Arrow IPC stream or an NPZ archive.
+        accept: The Accept header that selects the response format (JSON, Arrow IPC or NPZ).
+        payload_hash: The hash of the request body that identifies identical requests.
 
     Returns:
-        Two created prototypes and the anomaly with the same timeframe.
+        Two created prototypes and the anomaly with the same timeframe, for each sensor if several are selected,
+        the contributing weeks if a bounded history is selected and the kept positions if the values are downsampled.
     """
     try:
-        if not payload:
-            raise HTTPException(status_code=400, detail="Payload can not be empty")
-        a, b, c = prototypes.create_averaged_prototypes(anomaly - 1, payload)
-        return {"prototypes": {"prototype a": a,
-                               "prototype b": b,
-                               "anomaly": c}}
+        try:
+            # validated for all modes, so parameters that the selected mode does not use are rejected
+            policy = prototypes.HistoryPolicy(history, weeks, half_life)
+        except ValueError as error:
+            raise HTTPException(status_code=400, detail=str(error))
+        if policy.mode == "all":
+            policy = None
+        if policy is not None and (method != "averaged" or incremental):
+            raise HTTPException(status_code=400, detail="Bounded histories are only supported by the averaged method")
+        payload = load_payload(dataset, binary_payload if binary_payload is not None else payload)
+        if top_k is not None or sensors:
+            if method != "averaged":
+                raise HTTPException(status_code=400, detail="Several sensors are only supported by the averaged method")
+            if sensors and any(sensor not in payload["sensors"] for sensor in sensors):
+                raise HTTPException(status_code=400, detail="Unknown sensor")
+        if max_points is not None and method in ("local", "mask"):
+            # their anomaly window is cut off at the ends of the data, so it is not aligned with the prototypes
+            raise HTTPException(status_code=400, detail="Downsampling is only supported by the averaged and nearest "
+                                                        "methods")
+        if incremental and (method != "averaged" or top_k is not None or sensors):
+            raise HTTPException(status_code=400, detail="Incremental prototypes are only supported by the averaged "
+                                                        "method for a single sensor")
+        result = await coalescing.single_flight.run(
+            ("prototypes", dataset or payload_hash, anomaly, method, padding, top_k, tuple(sensors or ()), incremental,
+             history, weeks, half_life, max_points),
+            lambda: run_explanation(explain_prototypes, anomaly - 1, payload, method, padding, top_k, sensors,
+                                    incremental, policy, max_points, parse=dataset is None)
+        )
+        return formats.encode_response(result, accept, precision)
     except HTTPException:
         raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception:
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
@@ -173,13 +495,29 @@ def calculate_prototypes(
             },
         },
         400: {
-            "description": "Payload can not be empty.",
+            "description": "Payload can not be empty or is malformed.",
             "content": {
                 "application/json": {
                     "example": {"detail": "Payload can not be empty"}
                 }
             },
         },
+        404: {
+            "description": "Dataset not found.",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Dataset not found"}
+                }
+            },
+        },
+        415: {
+            "description": "Unsupported content type.",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Unsupported content type"}
+                }
+            },
+        },
         500: {
             "description": "Internal server error.",
             "content": {
@@ -187,17 +525,41 @@ def calculate_prototypes(
                     "example": {"detail": "Internal server error"}
                 }
             },
+        },
+        503: {
+            "description": "Service is busy.",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Service is busy"}
+                }
+            },
+        },
+        504: {
+            "description": "Explanation timed out.",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Explanation timed out"}
+                }
+            },
         }
     },
     tags=["Attributions"]
 )
-def calculate_attribution(
+async def calculate_attribution(
         anomaly: int = Query(
             description="Query parameter to select the anomaly.",
             example=0
         ),
+        method: Literal["averaged", "median", "basic", "very-basic"] = Query(
+            default="averaged",
+            description="Query parameter to select the method for the feature attribution."
+        ),
+        dataset: str | None = Query(
+            default=None,
+            description="Query parameter to select a registered dataset instead of sending the payload."
+        ),
         payload=Body(
-            default=...,
+            default=None,
             description="A dict of the output of anomaly-detection",
             example={
                 "payload": {
@@ -228,26 +590,275 @@ def calculate_attribution(
                 }
             },
             embed=True
-        )
+        ),
+        binary_payload: dict | None = Depends(formats.read_binary_payload),
+        accept: str | None = Header(default=None, include_in_schema=False),
+        payload_hash: str | None = Depends(coalescing.body_hash)
 ):
     """Calculates the feature attribution for the specified anomaly.
 
     Args:
         anomaly: The ID of the anomaly for which the prototypes are created.
+        method: The method for the feature attribution.
+        dataset: The content hash of a registered output of the anomaly detection.
         payload: The output of the anomaly detection.
+        binary_payload: The output of the anomaly detection decoded from an Arrow IPC stream or an NPZ archive.
+        accept: The Accept header that selects the response format (JSON, Arrow IPC or NPZ).
+        payload_hash: The hash of the request body that identifies identical requests.
 
     Returns:
         The calculated feature attribution for the specified anomaly.
     """
     try:
-        attribution = feature_attribution.calculate_averaged_feature_attribution(anomaly - 1, payload)
-        attribution = [{"name": payload["sensors"][i], "percent": e} for i, e in enumerate(attribution)]
-        # attribution = sorted(attribution, key=lambda x: x["percent"], reverse=True)
-        return {"attribution": attribution}
+        payload = load_payload(dataset, binary_payload if binary_payload is not None else payload)
+        result = await coalescing.single_flight.run(
+            ("feature-attribution", dataset or payload_hash, anomaly, method),
+            lambda: run_explanation(explain_attribution, anomaly - 1, payload, method, parse=dataset is None)
+        )
+        return formats.encode_response(result, accept)
     except HTTPException:
         raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception:
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
 
-schema.custom_openapi(app)
+@app.post(
+    "/explanations",
+    name="Get explanations for several anomalies",
+    summary="Get the feature attribution and prototypes for several anomalies",
+    description="Returns a list with the feature attribution and the prototypes of each selected anomaly.",
+    response_description="List of feature attributions and prototypes.",
+    responses={
+        200: {
+            "content": {
+                "application/json": {
+                    "example": {
+                        "explanations": [
+                            {
+                                "anomaly": 1,
+                                "attribution": [
+                                    {'name': 'Wasser.1 Diff', 'percent': 82.65603968422548},
+                                    {'name': 'Elektrizität.1 Diff', 'percent': 17.343960315774527}
+                                ],
+                                "prototypes": {
+                                    "prototype a": [0.01675, 0.07375, 0.0315, 0.049, 0.034],
+                                    "prototype b": [0.004, 0.00275, 0.0, 0.0, 0.0],
+                                    "anomaly": [0.0055, 0.0, 0.0, 0.4355, 0.09325]
+                                }
+                            }
+                        ]
+                    }
+                }
+            },
+        },
+        400: {
+            "description": "Payload can not be empty or is not supported by the method.",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Timestamps of the dataframe must be evenly spaced"}
+                }
+            },
+        },
+        404: {
+            "description": "Dataset not found.",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Dataset not found"}
+                }
+            },
+        },
+        415: {
+            "description": "Unsupported content type.",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Unsupported content type"}
+                }
+            },
+        },
+        500: {
+            "description": "Internal server error.",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Internal server error"}
+                }
+            },
+        },
+        503: {
+            "description": "Service is busy.",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Service is busy"}
+                }
+            },
+        },
+        504: {
+            "description": "Explanation timed out.",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Explanation timed out"}
+                }
+            },
+        }
+    },
+    tags=["Explanations"]
+)
+async def calculate_explanations(
+        anomalies: list[int] | None = Query(
+            default=None,
+            description="Query parameter to select the anomalies. All anomalies are explained if omitted.",
+            example=[1, 2]
+        ),
+        padding: int = Query(
+            default=4,
+            ge=0,
+            description="Query parameter to select the padding (in h) on both sides of the anomaly."
+        ),
+        dataset: str | None = Query(
+            default=None,
+            description="Query parameter to select a registered dataset instead of sending the payload."
+        ),
+        payload=Body(
+            default=None,
+            description="A dict of the output of anomaly-detection",
+            example={
+                "payload": {
+                    "deep-error": [
+                        [0.01572980009, 0.01217999305, 0.01153012265],
+                        [0.01572980009, 0.01217999305, 0.01153012265]
+                    ],
+                    "dataframe": {
+                        "Wasser.1 Diff": {
+                            "2020-07-31T20:00:00": 1.4,
+                            "2020-07-31T20:15:00": 1.4,
+                            "2020-07-31T20:30:00": 1.3
+                        },
+                        "Electricity.1 Diff": {
+                            "2020-07-31T20:00:00": 1.5,
+                            "2020-07-31T20:15:00": 1.6,
+                            "2020-07-31T20:30:00": 1.7
+                        }
+                    },
+                    "sensors": ["Wasser.1 Diff", "Elektrizität.1 Diff"],
+                    "algo": 2,
+                    "timestamps": ["2020-03-14T11:00:00", "2020-03-14T11:15:00", "2020-03-14T11:30:00"],
+                    "anomalies": [
+                        {"timestamp": "2021-12-21T09:45:00", "type": "Area"},
+                        {"timestamp": "2021-12-22T09:45:00", "type": "Area"}
+                    ],
+                    "error": [0.03145960019416866, 0.024359986113175414, 0.023060245303469007]
+                }
+            },
+            embed=True
+        ),
+        binary_payload: dict | None = Depends(formats.read_binary_payload),
+        accept: str | None = Header(default=None, include_in_schema=False),
+        payload_hash: str | None = Depends(coalescing.body_hash)
+):
+    """Calculates the feature attribution and the prototypes for several anomalies at once.
+
+    The payload is only parsed once and shared between all selected anomalies.
+
+    Args:
+        anomalies: The IDs of the anomalies to be explained. Defaults to all anomalies.
+        padding: The padding (in h) on both sides of the anomalies.
+        dataset: The content hash of a registered output of the anomaly detection.
+        payload: The output of the anomaly detection.
+        binary_payload: The output of the anomaly detection decoded from an Arrow IPC stream or an NPZ archive.
+        accept: The Accept header that selects the response format (JSON, Arrow IPC or NPZ).
+        payload_hash: The hash of the request body that identifies identical requests.
+
+    Returns:
+        The feature attribution and the prototypes for each selected anomaly.
+    """
+    try:
+        payload = load_payload(dataset, binary_payload if binary_payload is not None else payload)
+        selected = [a - 1 for a in anomalies] if anomalies else list(range(len(payload["anomalies"])))
+        result = await coalescing.single_flight.run(
+            ("explanations", dataset or payload_hash, tuple(selected), padding),
+            lambda: run_explanation(explain_anomalies, selected, payload, padding, parse=dataset is None)
+        )
+        return formats.encode_response(result, accept)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
+async def run_explanation(function, *args, parse: bool = False) -> dict:
+    """Runs an explanation function in the executor and translates its errors to HTTP errors.
+
+    With worker processes, a payload sent with the request is parsed (in a thread) once the task was admitted,
+    since its arrays are copied to the worker much faster than the nested dicts of the JSON payload.
+    With enabled metrics, the stage timings collected in the worker are added to the timings of the request.
+
+    Args:
+        function: The explanation function.
+        *args: The arguments of the function.
+        parse: Whether the output of the anomaly detection among the arguments was sent with the request.
+
+    Returns:
+        The result of the function.
+
+    Raises:
+        HTTPException: The executor is saturated (503) or the explanation timed out (504).
+    """
+    prepare = parse_payload if parse and executor.workers > 0 else None
+    try:
+        if not metrics.enabled:
+            return await executor.run(function, *args, prepare=prepare)
+        # rejected tasks were never computed, so they must not count as compute samples
+        with metrics.stage("compute", ignore=(ExecutorSaturated,)):
+            result, timings = await executor.run(metrics.collect, function, *args, prepare=prepare)
+        metrics.merge(timings)
+        return result
+    except ExecutorSaturated:
+        raise HTTPException(status_code=503, detail="Service is busy",
+                            headers={"Retry-After": str(executor.retry_after)})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Explanation timed out")
+
+
+def parse_payload(args: tuple) -> tuple:
+    """Parses the output of the anomaly detection among the arguments of an explanation function.
+
+    The output of the anomaly detection is the only dict among the arguments of the explanation functions.
+
+    Args:
+        args: The arguments of the explanation function.
+
+    Returns:
+        The arguments with the parsed output of the anomaly detection.
+    """
+    return tuple(datasets.parse_anomaly_data(arg) if isinstance(arg, dict) else arg for arg in args)
+
+
+def load_payload(dataset: str | None, payload: dict | None) -> dict:
+    """Returns the output of the anomaly detection either from the dataset cache or the request body.
+
+    Args:
+        dataset: The content hash of a registered output of the anomaly detection.
+        payload: The output of the anomaly detection sent with the request.
+
+    Returns:
+        The output of the anomaly detection.
+
+    Raises:
+        HTTPException: The dataset is not registered or no payload was sent.
+    """
+    if dataset is not None:
+        with metrics.stage("cache"):
+            anomaly_data = DATASETS.get(dataset)
+        if anomaly_data is None:
+            raise HTTPException(status_code=404, detail="Dataset not found")
+        return anomaly_data
+    if not payload:
+        raise HTTPException(status_code=400, detail="Payload can not be empty")
+    return payload
+
+
+# the schema is generated on the first request of the documentation (or read from the file generated at build time)
+app.openapi = lambda: schema.custom_openapi(app)
@@ -0,0 +1,111 @@
+"""Contains the coalescing of concurrent identical explanation requests"""
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Hashable
+
+from fastapi import Request
+
+
+class SingleFlight:
+    """Coalesces concurrent calculations with the same key into a single one and caches their results briefly.
+
+    Concurrent requests with the same key await the calculation that was started first.
+    Successful results are served from a small cache for repeated requests within the TTL.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        """Initializes the coalescing without any calculations.
+
+        Args:
+            ttl: The time (in seconds) a result is served from the cache.
+            max_entries: The maximum number of cached results.
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.requests = 0
+        self.calculations = 0
+        self.coalesced = 0
+        self.cache_hits = 0
+        self._running = {}
+        self._results = OrderedDict()
+
+    async def run(self, key: Hashable, calculation: Callable[[], Awaitable]):
+        """Returns the result of the calculation for the key, either cached, from a running or from a new calculation.
+
+        A new calculation runs as separate task, so it is not cancelled if the request that started it is cancelled.
+
+        Args:
+            key: The key that identifies identical calculations.
+            calculation: A function that starts the calculation.
+
+        Returns:
+            The result of the calculation.
+        """
+        self.requests += 1
+        cached = self._results.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            self.cache_hits += 1
+            self._results.move_to_end(key)
+            return cached[1]
+        if cached is not None:
+            del self._results[key]
+        task = self._running.get(key)
+        if task is None:
+            self.calculations += 1
+            task = asyncio.ensure_future(self._calculate(key, calculation))
+            self._running[key] = task
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        """Returns the counters of the coalescing.
+
+        Returns:
+            A dict with the number of requests, calculations, coalesced requests, cache hits and the coalescing ratio.
+        """
+        return {"requests": self.requests, "calculations": self.calculations, "coalesced": self.coalesced,
+                "cache_hits": self.cache_hits, "running": len(self._running), "cached": len(self._results),
+                "ratio": (self.coalesced + self.cache_hits) / self.requests if self.requests else 0.0}
+
+    async def _calculate(self, key: Hashable, calculation: Callable[[], Awaitable]):
+        """Runs the calculation and caches its result.
+
+        Args:
+            key: The key that identifies identical calculations.
+            calculation: A function that starts the calculation.
+
+        Returns:
+            The result of the calculation.
+        """
+        try:
+            result = await calculation()
+            self._results[key] = (time.monotonic() + self.ttl, result)
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+            return result
+        finally:
+            del self._running[key]
+
+
+async def body_hash(request: Request) -> str | None:
+    """Calculates the hash of the request body to identify identical payloads.
+
+    Args:
+        request: The incoming request.
+
+    Returns:
+        The hex digest of the SHA-256 hash or None if the body is empty.
+    """
+    body = await request.body()
+    return hashlib.sha256(body).hexdigest() if body else None
+
+
+single_flight = SingleFlight(
+    ttl=float(os.environ.get("EXPLAINABILITY_RESULT_TTL", 10)),
+    max_entries=int(os.environ.get("EXPLAINABILITY_RESULT_ENTRIES", 256))
+)
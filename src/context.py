@@ -0,0 +1,144 @@
+"""Contains the shared context of the calculations for a single output of the anomaly detection"""
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+from . import feature_attribution as ft
+from . import ingestion
+from . import metrics
+from . import prototypes
+
+
+class ExplanationContext:
+    """Lazily derives and memoizes the intermediate results of the explanations of an anomaly detection output.
+
+    The dataframe, its time resolution, the deep error and its prefix sums, the series of each sensor,
+    the feature attribution of each anomaly and the sensor selected for each anomaly are calculated on first use,
+    so they are calculated only once for all explanations of a request or a batch sharing the context.
+    For a dataset from the on-disk store, the series and the time resolution are taken from the stored files,
+    so the dataframe is not built for the averaged prototypes.
+    """
+
+    def __init__(self, anomaly_data: dict):
+        """Initializes the context without calculating anything.
+
+        Args:
+            anomaly_data: The output of the anomaly detection.
+        """
+        self.anomaly_data = anomaly_data
+        self._attributions = {}
+        self._sensors = {}
+        self._series = {}
+
+    @cached_property
+    def dataframe(self) -> pd.DataFrame:
+        """The dataframe of the anomaly detection output."""
+        return ingestion.load_dataframe(self.anomaly_data)
+
+    @cached_property
+    def frequency(self) -> int:
+        """The number of values per hour."""
+        if "series" in self.anomaly_data:
+            timestamps = self.anomaly_data["timestamps"]
+            return np.timedelta64(1, "h") // (timestamps[1] - timestamps[0])
+        return prototypes.fetch_frequency(self.dataframe)
+
+    @cached_property
+    def deep_error(self) -> np.ndarray:
+        """The deep error as contiguous 2-D array (sensors x timestamps)."""
+        return ft.fetch_deep_error(self.anomaly_data)
+
+    @cached_property
+    def prefix_sums(self) -> np.ndarray:
+        """The prefix sums of the deep error for each sensor with a leading zero column."""
+        if "deep-error-prefix-sums" in self.anomaly_data:
+            return self.anomaly_data["deep-error-prefix-sums"]
+        return ft.calculate_prefix_sums(self.deep_error)
+
+    @cached_property
+    def minute_of_week_index(self) -> tuple[np.ndarray, np.ndarray]:
+        """The sorted minutes of the week of all timestamps and the positions of the timestamps in that order."""
+        return prototypes.fetch_minute_of_week_index(self.anomaly_data, self.dataframe)
+
+    def series(self, sensor: int) -> np.ndarray:
+        """Returns the values of a sensor.
+
+        Args:
+            sensor: The index of the sensor.
+
+        Returns:
+            The values of the sensor for all timestamps (memory-mapped for a dataset from the on-disk store).
+        """
+        if "series" in self.anomaly_data:
+            return self.anomaly_data["series"][sensor]
+        if sensor not in self._series:
+            self._series[sensor] = self.dataframe.loc[:, self.anomaly_data["sensors"][sensor]].to_numpy()
+        return self._series[sensor]
+
+    def attributions(self, anomalies: list[int], method: str = "averaged") -> list[list[float]]:
+        """Returns the feature attribution of several anomalies.
+
+        Only the attributions of anomalies that were not calculated with the same method before are calculated,
+        all at once.
+
+        Args:
+            anomalies: The IDs of the anomalies.
+            method: The name of the feature attribution method.
+
+        Returns:
+            A list of percentages for each anomaly that determine the influence of each feature on the anomaly.
+        """
+        calculated = self._attributions.setdefault(method, {})
+        missing = [anomaly for anomaly in dict.fromkeys(anomalies) if anomaly not in calculated]
+        if missing:
+            results = ft.FEATURE_ATTRIBUTION_BATCHES[method](missing, self.anomaly_data, self)
+            calculated.update(zip(missing, results))
+        return [calculated[anomaly] for anomaly in anomalies]
+
+    def sensor(self, anomaly: int) -> int:
+        """Returns the sensor with the highest averaged feature attribution for the anomaly.
+
+        Args:
+            anomaly: The ID of the anomaly (starting at 0).
+
+        Returns:
+            The sensor responsible for the anomaly or the first if no feature attribution data is present.
+        """
+        if anomaly not in self._sensors:
+            if len(self.deep_error):
+                with metrics.stage("fetch_sensor"):
+                    attribution = self.attributions([anomaly])[0]
+                self._sensors[anomaly] = attribution.index(max(attribution))
+            else:
+                self._sensors[anomaly] = 0
+        return self._sensors[anomaly]
+
+    def top_sensors(self, anomaly: int, k: int) -> list[int]:
+        """Returns the sensors with the highest averaged feature attribution for the anomaly.
+
+        Args:
+            anomaly: The ID of the anomaly (starting at 0).
+            k: The maximum number of sensors.
+
+        Returns:
+            The k sensors most responsible for the anomaly in descending order of their attribution
+            or the first k sensors if no feature attribution data is present.
+        """
+        if not len(self.deep_error):
+            return list(range(min(k, len(self.anomaly_data["sensors"]))))
+        attribution = np.asarray(self.attributions([anomaly])[0])
+        return np.argsort(-attribution, kind="stable")[:k].tolist()
+
+
+def fetch_context(anomaly_data: dict, context: ExplanationContext | None = None) -> ExplanationContext:
+    """Returns the given context or a new one for the anomaly detection output.
+
+    Args:
+        anomaly_data: The output of the anomaly detection.
+        context: An already existing context for the anomaly detection output (optional).
+
+    Returns:
+        The context for the anomaly detection output.
+    """
+    return context if context is not None else ExplanationContext(anomaly_data)
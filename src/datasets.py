@@ -0,0 +1,318 @@
+"""Contains the cache for registered outputs of the anomaly detection"""
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+import orjson
+import pandas as pd
+
+from . import feature_attribution as ft
+from . import ingestion
+from . import prototypes
+from .executor import executor
+
+
+class DatasetTooLarge(Exception):
+    """Raised if a dataset exceeds the memory budget of the cache."""
+
+
+class DatasetCache:
+    """A thread-safe LRU cache for parsed outputs of the anomaly detection.
+
+    Entries are addressed by the content hash of the original payload. The cache is bounded by the estimated
+    memory size of its entries and removes entries that have not been accessed within the TTL.
+    If a shared directory is configured, the arrays of the entries are kept in memory-mapped files in it
+    (see SharedAnomalyData), so the worker processes map them instead of receiving a copy with every task.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float, shared_directory: str | None = None):
+        """Initializes an empty cache.
+
+        Args:
+            max_bytes: The memory budget (in bytes) for all cached entries.
+            ttl: The time (in seconds) after which an entry that has not been accessed is removed.
+            shared_directory: The directory for the memory-mapped files of the entries (optional).
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.shared_directory = shared_directory
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._directory = None
+
+    def put(self, anomaly_data: dict) -> str:
+        """Parses and registers the output of the anomaly detection.
+
+        Args:
+            anomaly_data: The output of the anomaly detection.
+
+        Returns:
+            The content hash that identifies the registered output.
+
+        Raises:
+            DatasetTooLarge: The parsed output exceeds the memory budget of the cache.
+        """
+        key = content_hash(anomaly_data)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._entries[key][2] = time.monotonic()
+                return key
+        parsed = precompute_anomaly_data(parse_anomaly_data(anomaly_data))
+        size = estimate_size(parsed)
+        if size > self.max_bytes:
+            raise DatasetTooLarge("Dataset exceeds the size of the cache")
+        if self.shared_directory is not None:
+            parsed = self._share(parsed)
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = [parsed, size, time.monotonic()]
+                self.size += size
+            self._evict()
+        return key
+
+    def get(self, key: str) -> dict | None:
+        """Returns the parsed output of the anomaly detection for the specified content hash.
+
+        Args:
+            key: The content hash returned during the registration.
+
+        Returns:
+            The parsed output of the anomaly detection or None if it is not (or no longer) cached.
+        """
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            entry[2] = time.monotonic()
+            return entry[0]
+
+    def stats(self) -> dict:
+        """Returns the counters and the current utilization of the cache.
+
+        Returns:
+            A dict with the number of entries, the used and available bytes, and the hit, miss and eviction counters.
+        """
+        with self._lock:
+            self._expire()
+            return {"entries": len(self._entries), "bytes": self.size, "max_bytes": self.max_bytes,
+                    "ttl": self.ttl, "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions, "expirations": self.expirations}
+
+    def _share(self, parsed: dict) -> dict:
+        """Moves the arrays of a parsed output of the anomaly detection to memory-mapped files.
+
+        The directory of the cache is created in the shared directory on first use and removed on exit.
+
+        Args:
+            parsed: The parsed output of the anomaly detection.
+
+        Returns:
+            The shared output or the parsed output as is if the files could not be written (e.g. the shared
+            directory is full), in which case it is copied to the worker processes with every task.
+        """
+        try:
+            with self._lock:
+                if self._directory is None:
+                    self._directory = tempfile.mkdtemp(prefix="explainability-", dir=self.shared_directory)
+                    weakref.finalize(self, shutil.rmtree, self._directory, True)
+            return share_anomaly_data(parsed, self._directory)
+        except OSError:
+            return parsed
+
+    def _expire(self):
+        """Removes all entries that have not been accessed within the TTL."""
+        now = time.monotonic()
+        for key in [k for k, entry in self._entries.items() if now - entry[2] > self.ttl]:
+            self.size -= self._entries.pop(key)[1]
+            self.expirations += 1
+
+    def _evict(self):
+        """Removes expired entries and the least recently used entries until the memory budget is met."""
+        self._expire()
+        while self.size > self.max_bytes and self._entries:
+            self.size -= self._entries.popitem(last=False)[1][1]
+            self.evictions += 1
+
+
+class SharedAnomalyData(dict):
+    """The parsed output of the anomaly detection with its arrays in memory-mapped files.
+
+    Contains the same entries as the parsed output. Is pickled as reference to its files (with the small entries, like
+    the sensors and the anomalies), so it can be passed to worker processes without copying the arrays.
+    """
+
+    def __init__(self, path: str, entries: dict, columns: list[str] | None):
+        """Maps the arrays of a shared output.
+
+        Args:
+            path: The directory of the files.
+            entries: The entries that are not stored in the files.
+            columns: The columns of the dataframe if its values are stored in the files.
+        """
+        self.path = path
+        self.entries = entries
+        self.columns = columns
+        arrays = {name[:-4]: np.load(os.path.join(path, name), mmap_mode="r") for name in os.listdir(path)}
+        super().__init__(entries)
+        if columns is not None:
+            self["dataframe"] = ingestion.build_dataframe_from_arrays(arrays.pop("dataframe-index"),
+                                                                      arrays.pop("dataframe-values"), columns)
+        if "minutes-of-week" in arrays:
+            self["minute-of-week-index"] = arrays.pop("minutes-of-week"), arrays.pop("minute-of-week-positions")
+        self.update(arrays)
+
+    def __reduce__(self):
+        return SharedAnomalyData, (self.path, self.entries, self.columns)
+
+
+def share_anomaly_data(parsed: dict, directory: str) -> SharedAnomalyData:
+    """Writes the arrays of a parsed output of the anomaly detection to memory-mapped files.
+
+    The files are removed as soon as the returned output is no longer referenced in this process (e.g. after it was
+    evicted from the cache and the last task using it has finished), worker processes that mapped them before keep
+    their mapping until they release it.
+
+    Args:
+        parsed: The parsed output of the anomaly detection.
+        directory: The directory in which a subdirectory for the files is created.
+
+    Returns:
+        The shared output of the anomaly detection.
+
+    Raises:
+        OSError: The files could not be written.
+    """
+    entries = dict(parsed)
+    arrays = {}
+    columns = None
+    df = entries["dataframe"]
+    if isinstance(df.index, pd.DatetimeIndex) and df.index.tz is None and (df.dtypes == float).all():
+        del entries["dataframe"]
+        arrays["dataframe-index"] = df.index.values.astype("datetime64[ns]")
+        arrays["dataframe-values"] = df.to_numpy(dtype=float).T
+        columns = list(df.columns)
+    arrays["minutes-of-week"], arrays["minute-of-week-positions"] = entries.pop("minute-of-week-index")
+    if not isinstance(entries["timestamps"], np.ndarray):
+        try:
+            entries["timestamps"] = np.array(entries["timestamps"], dtype="datetime64[ns]")
+        except (TypeError, ValueError):
+            pass
+    for key in [key for key, value in entries.items() if isinstance(value, np.ndarray) and value.dtype != object]:
+        arrays[key] = entries.pop(key)
+    path = tempfile.mkdtemp(dir=directory)
+    try:
+        for name, array in arrays.items():
+            np.save(os.path.join(path, f"{name}.npy"), array)
+        shared = SharedAnomalyData(path, entries, columns)
+    except BaseException:
+        shutil.rmtree(path, ignore_errors=True)
+        raise
+    weakref.finalize(shared, shutil.rmtree, path, True)
+    return shared
+
+
+def content_hash(anomaly_data: dict) -> str:
+    """Calculates a hash of the output of the anomaly detection that does not depend on the key order.
+
+    Outputs that were decoded from a binary format are hashed based on their arrays.
+
+    Args:
+        anomaly_data: The output of the anomaly detection.
+
+    Returns:
+        The hex digest of the SHA-256 hash.
+    """
+    if not isinstance(anomaly_data["dataframe"], pd.DataFrame):
+        return hashlib.sha256(orjson.dumps(anomaly_data, option=orjson.OPT_SORT_KEYS)).hexdigest()
+    digest = hashlib.sha256()
+    df = anomaly_data["dataframe"]
+    for array in (df.index.values, df.to_numpy(), anomaly_data["deep-error"], anomaly_data["error"],
+                  anomaly_data["timestamps"]):
+        digest.update(np.ascontiguousarray(array).view(np.uint8))
+    digest.update(orjson.dumps({key: anomaly_data[key] for key in ("sensors", "anomalies", "algo")},
+                               option=orjson.OPT_SORT_KEYS))
+    return digest.hexdigest()
+
+
+def parse_anomaly_data(anomaly_data: dict) -> dict:
+    """Converts the output of the anomaly detection to its NumPy and pandas representation.
+
+    The dataframe is converted to a pandas DataFrame with a datetime index and the errors to NumPy arrays.
+    All other entries are kept as is. Further intermediate results (e.g. the prefix sums of the deep error) are only
+    derived by the ExplanationContext of the methods that use them.
+
+    Args:
+        anomaly_data: The output of the anomaly detection.
+
+    Returns:
+        The parsed output of the anomaly detection.
+    """
+    parsed = dict(anomaly_data)
+    parsed["dataframe"] = ingestion.load_dataframe(anomaly_data)
+    parsed["deep-error"] = np.array(anomaly_data["deep-error"], dtype=float)
+    parsed["error"] = np.array(anomaly_data["error"], dtype=float)
+    return parsed
+
+
+def precompute_anomaly_data(parsed: dict) -> dict:
+    """Adds the prefix sums of the deep error and the minute-of-week index of the dataframe to a parsed output.
+
+    Used for registered datasets, so these are calculated once for all requests of the dataset instead of once per
+    request (see ExplanationContext).
+
+    Args:
+        parsed: The parsed output of the anomaly detection.
+
+    Returns:
+        The parsed output with the precomputed intermediate results.
+    """
+    parsed["deep-error-prefix-sums"] = ft.calculate_prefix_sums(parsed["deep-error"])
+    parsed["minute-of-week-index"] = prototypes.calculate_minute_of_week_index(parsed["dataframe"].index)
+    return parsed
+
+
+def estimate_size(parsed: dict) -> int:
+    """Estimates the memory size of the parsed output of the anomaly detection.
+
+    Args:
+        parsed: The parsed output of the anomaly detection with the precomputed intermediate results.
+
+    Returns:
+        The estimated size in bytes.
+    """
+    size = int(parsed["dataframe"].memory_usage(index=True, deep=True).sum())
+    size += parsed["deep-error"].nbytes + parsed["deep-error-prefix-sums"].nbytes + parsed["error"].nbytes
+    size += sum(e.nbytes for e in parsed["minute-of-week-index"])
+    if isinstance(parsed["timestamps"], np.ndarray):
+        size += parsed["timestamps"].nbytes
+    else:
+        size += sum(sys.getsizeof(e) for e in parsed["timestamps"]) + sys.getsizeof(parsed["timestamps"])
+    return size
+
+
+SHARED_DIR = os.environ.get("EXPLAINABILITY_SHARED_DIR",
+                            "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir())
+
+cache = DatasetCache(
+    max_bytes=int(os.environ.get("EXPLAINABILITY_CACHE_BYTES", 512 * 1024 * 1024)),
+    ttl=float(os.environ.get("EXPLAINABILITY_CACHE_TTL", 3600)),
+    # without worker processes, the entries are only used by the service process and do not have to be shared
+    shared_directory=SHARED_DIR if executor.workers > 0 else None
+)
@@ -0,0 +1,62 @@
+"""Contains the shape-preserving downsampling of the prototype and anomaly windows"""
+import numpy as np
+
+
+def lttb_positions(values: list[list], max_points: int) -> np.ndarray:
+    """Selects the positions that preserve the shape of several series of the same length.
+
+    Uses Largest-Triangle-Three-Buckets (LTTB): the first and the last position are always kept, the positions in
+    between are split into max_points - 2 buckets. For each bucket, the position that spans the largest triangle with
+    the previously selected position and the average of the next bucket is selected. The areas of all series are added
+    up (each series scaled to its range), so the selected positions are shared by all series. Missing values (None or
+    NaN) do not contribute to the area.
+
+    Args:
+        values: The series, e.g. the prototypes and the anomaly of a timeframe.
+        max_points: The maximum number of positions (at least 3).
+
+    Returns:
+        The ascending selected positions (all positions if the series are not longer than max_points).
+
+    Raises:
+        ValueError: The series do not have the same length.
+    """
+    if len({len(e) for e in values}) > 1:
+        raise ValueError("Only series of the same length can be downsampled at shared positions")
+    series = np.array(values, dtype=float).reshape(len(values), -1)
+    length = series.shape[1]
+    if length <= max_points:
+        return np.arange(length)
+    low, high = np.nanmin(series, axis=1, keepdims=True), np.nanmax(series, axis=1, keepdims=True)
+    scale = np.where(high > low, high - low, 1.0)
+    series = np.nan_to_num((series - low) / scale)
+
+    edges = np.linspace(1, length - 1, max_points - 1).astype(np.int64)
+    positions = np.empty(max_points, dtype=np.int64)
+    positions[0], positions[-1] = 0, length - 1
+    selected = 0
+    for bucket in range(max_points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else length
+        next_x = (end + next_end - 1) / 2
+        next_y = series[:, end:next_end].mean(axis=1, keepdims=True)
+        x = np.arange(start, end)
+        y = series[:, start:end]
+        previous = series[:, selected:selected + 1]
+        areas = np.abs((selected - next_x) * (y - previous) - (selected - x) * (next_y - previous)).sum(axis=0)
+        selected = start + int(np.argmax(areas))
+        positions[bucket + 1] = selected
+    return positions
+
+
+def take(values: list, positions: np.ndarray) -> list:
+    """Takes the values at the selected positions.
+
+    Args:
+        values: The values of a series.
+        positions: The selected positions.
+
+    Returns:
+        The values at the positions (missing values are kept as None).
+    """
+    return [values[position] for position in positions.tolist()]
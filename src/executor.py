@@ -0,0 +1,143 @@
+"""Contains the process pool for the CPU-bound explanation work"""
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable
+
+
+class ExecutorSaturated(Exception):
+    """Raised if the queue of the executor is full."""
+
+
+class ExplanationExecutor:
+    """Runs CPU-bound explanation work in a pool of worker processes with a bounded queue.
+
+    With zero workers, the work is run in a thread pool instead, while the queue bound and the timeout still apply.
+    A task counts as pending until it has finished, also if its result was abandoned after the timeout.
+    The start method selects how the worker processes are created: "spawn" imports all modules again in each worker,
+    "forkserver" imports the preloaded modules once in a server process that forks the workers and "fork" copies the
+    already initialized service process (only safe while it does not run other threads). Therefore, "fork" is only
+    used for the first pool; a pool that replaces a broken one is started with "forkserver" instead.
+    """
+
+    def __init__(self, workers: int, queue_depth: int, timeout: float, retry_after: int,
+                 start_method: str = "spawn", preload: list[str] | None = None):
+        """Initializes the executor without starting the worker processes.
+
+        Args:
+            workers: The number of worker processes.
+            queue_depth: The number of tasks that may wait for a free worker.
+            timeout: The time (in seconds) after which a task is abandoned.
+            retry_after: The time (in seconds) clients should wait before retrying if the queue is full.
+            start_method: The multiprocessing start method of the worker processes.
+            preload: The modules the fork server imports before forking the workers (optional).
+        """
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.start_method = start_method
+        self.preload = preload or []
+        self.pending = 0
+        self._pool = None
+        self._started = False
+        self._threads = ThreadPoolExecutor(thread_name_prefix="explanation")
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Starts the worker processes."""
+        if self.workers > 0 and self._pool is None:
+            # once the service runs, it has further threads (e.g. of the thread pools), which must not be forked
+            start_method = "forkserver" if self.start_method == "fork" and self._started else self.start_method
+            context = multiprocessing.get_context(start_method)
+            if start_method == "forkserver":
+                context.set_forkserver_preload(self.preload)
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=context)
+            self._started = True
+            for _ in range(self.workers):
+                self._pool.submit(os.getpid)
+
+    def shutdown(self, wait: bool = False):
+        """Stops the worker processes and cancels all waiting tasks.
+
+        Args:
+            wait: Whether to wait until the running tasks are finished and the worker processes have exited.
+                Forked workers do not notice the end of the service process, so the service waits for them on shutdown.
+        """
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+            self._pool = None
+
+    async def run(self, function: Callable, *args, prepare: Callable[[tuple], tuple] | None = None):
+        """Runs the function with the given arguments in a worker.
+
+        Tasks that exceed the timeout are cancelled if they did not start yet, otherwise their result is discarded.
+
+        Args:
+            function: A picklable (module level) function.
+            *args: The picklable arguments of the function.
+            prepare: A function that converts the arguments before they are passed to the worker (optional).
+                It is called in a thread of the service process once the task was admitted to the queue.
+
+        Returns:
+            The result of the function.
+
+        Raises:
+            ExecutorSaturated: All workers are busy and the queue is full.
+            asyncio.TimeoutError: The task did not finish within the timeout.
+        """
+        with self._lock:
+            if self.pending >= max(self.workers, 1) + self.queue_depth:
+                raise ExecutorSaturated("Too many pending explanation tasks")
+            self.pending += 1
+        try:
+            if prepare is not None:
+                args = await asyncio.to_thread(prepare, args)
+            pool = None
+            if self.workers > 0:
+                self.start()
+                pool = self._pool
+                task = pool.submit(function, *args)
+            else:
+                task = self._threads.submit(function, *args)
+        except BaseException as error:
+            self._finished(None)
+            if isinstance(error, BrokenProcessPool):
+                self._discard(pool)
+            raise
+        # the callback runs when the task has finished (or was cancelled before it started), not on the timeout
+        task.add_done_callback(self._finished)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(task), self.timeout)
+        except BrokenProcessPool:
+            # a crashed worker breaks the whole pool, so a new one is started for the next tasks
+            self._discard(pool)
+            raise
+
+    def _discard(self, pool: ProcessPoolExecutor):
+        """Stops a broken pool unless it was already replaced (e.g. by an earlier task of the same pool).
+
+        Args:
+            pool: The broken pool.
+        """
+        if self._pool is pool:
+            self._pool = None
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _finished(self, _: Future | None):
+        """Releases the slot of a task once it has finished (called from the thread that completes its future)."""
+        with self._lock:
+            self.pending -= 1
+
+
+executor = ExplanationExecutor(
+    workers=int(os.environ.get("EXPLAINABILITY_WORKERS", os.cpu_count() or 1)),
+    queue_depth=int(os.environ.get("EXPLAINABILITY_QUEUE_DEPTH", 16)),
+    timeout=float(os.environ.get("EXPLAINABILITY_TIMEOUT", 30)),
+    retry_after=int(os.environ.get("EXPLAINABILITY_RETRY_AFTER", 1)),
+    start_method=os.environ.get("EXPLAINABILITY_START_METHOD", "spawn"),
+    preload=[module for module in os.environ.get("EXPLAINABILITY_PRELOAD", "src.explanations").split(",") if module]
+)
@@ -0,0 +1,123 @@
+"""Contains the explanation functions that are run in the worker processes"""
+from . import downsampling, feature_attribution, metrics, prototypes
+from .context import ExplanationContext
+
+PROTOTYPE_METHODS = {
+    "averaged": prototypes.create_averaged_prototypes,
+    "mask": prototypes.create_averaged_prototypes_mask,
+    "local": prototypes.create_local_prototypes,
+    "nearest": prototypes.create_nearest_prototypes
+}
+
+FEATURE_ATTRIBUTION_METHODS = {
+    "averaged": feature_attribution.calculate_averaged_feature_attribution,
+    "median": feature_attribution.calculate_median_feature_attribution,
+    "basic": feature_attribution.calculate_basic_feature_attribution,
+    "very-basic": feature_attribution.calculate_very_basic_feature_attribution
+}
+
+
+def explain_prototypes(anomaly: int, anomaly_data: dict, method: str = "averaged", padding: int = 4,
+                       top_k: int | None = None, sensors: list[str] | None = None, incremental: bool = False,
+                       history: prototypes.HistoryPolicy | None = None, max_points: int | None = None) -> dict:
+    """Creates the prototypes for the specified anomaly (runs in a worker process).
+
+    Args:
+        anomaly: The ID of the anomaly (starting at 0).
+        anomaly_data: The output of the anomaly detection.
+        method: The name of the method for the prototype creation.
+        padding: The padding (in h) on both sides of the anomaly.
+        top_k: The number of sensors with the highest attribution to create the averaged prototypes for (optional).
+        sensors: The names of the sensors to create the averaged prototypes for (optional).
+        incremental: Whether to read the averaged prototypes from the seasonal profile of the sensor.
+        history: The policy that selects the weeks that contribute to the averaged prototypes (optional).
+        max_points: The maximum number of values of the prototypes and the anomaly (optional).
+
+    Returns:
+        The response with two created prototypes and the anomaly with the same timeframe,
+        for each sensor if several are selected, the contributing weeks if a history policy is selected
+        and the kept positions of the timeframe if the values are downsampled.
+    """
+    context = ExplanationContext(anomaly_data)
+    if top_k is not None or sensors:
+        if sensors:
+            selected = [anomaly_data["sensors"].index(sensor) for sensor in sensors]
+        else:
+            selected = context.top_sensors(anomaly, top_k)
+        windows = prototypes.create_averaged_prototypes_sensors(anomaly, anomaly_data, selected, padding, context,
+                                                                history)
+        response = {"prototypes": [{"sensor": anomaly_data["sensors"][sensor],
+                                    "prototype a": a,
+                                    "prototype b": b,
+                                    "anomaly": c} for sensor, (a, b, c) in zip(selected, windows)]}
+    else:
+        if incremental:
+            a, b, c = prototypes.create_averaged_prototypes(anomaly, anomaly_data, padding, context, incremental=True)
+        elif history is not None:
+            a, b, c = prototypes.create_averaged_prototypes(anomaly, anomaly_data, padding, context, history=history)
+        else:
+            a, b, c = PROTOTYPE_METHODS[method](anomaly, anomaly_data, padding, context)
+        response = {"prototypes": {"prototype a": a,
+                                   "prototype b": b,
+                                   "anomaly": c}}
+    if history is not None:
+        response["weeks"] = prototypes.fetch_history_weeks(anomaly, anomaly_data, padding, history, context)
+    if max_points is not None:
+        downsample_prototypes(response, max_points)
+    return response
+
+
+def downsample_prototypes(response: dict, max_points: int):
+    """Downsamples the prototypes and the anomaly of a response in place, at positions shared by all series.
+
+    Args:
+        response: The response of explain_prototypes.
+        max_points: The maximum number of values of each series.
+    """
+    entries = response["prototypes"] if isinstance(response["prototypes"], list) else [response["prototypes"]]
+    keys = ("prototype a", "prototype b", "anomaly")
+    with metrics.stage("downsample"):
+        positions = downsampling.lttb_positions([entry[key] for entry in entries for key in keys], max_points)
+        for entry in entries:
+            for key in keys:
+                entry[key] = downsampling.take(entry[key], positions)
+    response["positions"] = positions.tolist()
+
+
+def explain_attribution(anomaly: int, anomaly_data: dict, method: str = "averaged") -> dict:
+    """Calculates the feature attribution for the specified anomaly (runs in a worker process).
+
+    Args:
+        anomaly: The ID of the anomaly (starting at 0).
+        anomaly_data: The output of the anomaly detection.
+        method: The name of the method for the feature attribution.
+
+    Returns:
+        The response with the calculated feature attribution.
+    """
+    attribution = FEATURE_ATTRIBUTION_METHODS[method](anomaly, anomaly_data)
+    attribution = [{"name": anomaly_data["sensors"][i], "percent": e} for i, e in enumerate(attribution)]
+    # attribution = sorted(attribution, key=lambda x: x["percent"], reverse=True)
+    return {"attribution": attribution}
+
+
+def explain_anomalies(anomalies: list[int], anomaly_data: dict, padding: int = 4) -> dict:
+    """Calculates the feature attribution and the prototypes for several anomalies (runs in a worker process).
+
+    Args:
+        anomalies: The IDs of the anomalies (starting at 0).
+        anomaly_data: The output of the anomaly detection.
+        padding: The padding (in h) on both sides of the anomalies.
+
+    Returns:
+        The response with the feature attribution and the prototypes for each anomaly.
+    """
+    context = ExplanationContext(anomaly_data)
+    attributions = context.attributions(anomalies)
+    windows = prototypes.create_averaged_prototypes_batch(anomalies, anomaly_data, padding, context=context)
+    return {"explanations": [
+        {"anomaly": anomaly + 1,
+         "attribution": [{"name": anomaly_data["sensors"][i], "percent": e} for i, e in enumerate(attribution)],
+         "prototypes": {"prototype a": a, "prototype b": b, "anomaly": c}}
+        for anomaly, attribution, (a, b, c) in zip(anomalies, attributions, windows)
+    ]}
@@ -1,21 +1,44 @@
 """Contains all functions related to the feature attribution"""
+import numpy as np
 
+from . import context as ctx
+from . import metrics
 
-def calculate_very_basic_feature_attribution(anomaly: int, anomaly_data: dict) -> list[float]:
+
+def calculate_very_basic_feature_attribution(anomaly: int, anomaly_data: dict,
+                                             context: "ctx.ExplanationContext | None" = None) -> list[float]:
     """Calculates a feature attribution based on the specified anomaly and the output of the anomaly detection.
 
     Args:
         anomaly: The ID of the anomaly.
         anomaly_data: The output of the anomaly detection.
+        context: The shared context of the anomaly detection output (optional).
 
     Returns:
         A percentage for each feature that determines its influence on the detected anomaly.
     """
-    anomaly_index = anomaly_data["anomalies"][anomaly]["index"]
-    return [anomaly_data["deep-error"][i][anomaly_index] / anomaly_data["error"][anomaly_index] * 100 for i in range(len(anomaly_data["sensors"]))]
+    return ctx.fetch_context(anomaly_data, context).attributions([anomaly], "very-basic")[0]
+
+
+def calculate_very_basic_feature_attribution_batch(anomalies: list[int], anomaly_data: dict,
+                                                   context: "ctx.ExplanationContext | None" = None
+                                                   ) -> list[list[float]]:
+    """Calculates the very basic feature attribution for several anomalies at once.
+
+    Args:
+        anomalies: The IDs of the anomalies.
+        anomaly_data: The output of the anomaly detection.
+        context: The shared context of the anomaly detection output (optional).
 
+    Returns:
+        A list of percentages for each anomaly that determine the influence of each feature on the anomaly.
+    """
+    indices = [anomaly_data["anomalies"][anomaly]["index"] for anomaly in anomalies]
+    return _point_feature_attribution(indices, anomaly_data, context)
 
-def calculate_basic_feature_attribution(anomaly: int, anomaly_data: dict) -> list[float]:
+
+def calculate_basic_feature_attribution(anomaly: int, anomaly_data: dict,
+                                        context: "ctx.ExplanationContext | None" = None) -> list[float]:
     """Calculates a feature attribution based on the specified anomaly and the output of the anomaly detection.
 
     Uses the middle of the anomaly area for the feature attribution
@@ -23,15 +46,51 @@ def calculate_basic_feature_attribution(anomaly: int, anomaly_data: dict) -> lis
     Args:
         anomaly: The ID of the anomaly.
         anomaly_data: The output of the anomaly detection.
+        context: The shared context of the anomaly detection output (optional).
 
     Returns:
         A percentage for each feature that determines its influence on the detected anomaly.
     """
-    anomaly_index = anomaly_data["anomalies"][anomaly]["index"] + anomaly_data["anomalies"][anomaly]["length"] // 2
-    return [anomaly_data["deep-error"][i][anomaly_index] / anomaly_data["error"][anomaly_index] * 100 for i in range(len(anomaly_data["sensors"]))]
+    return ctx.fetch_context(anomaly_data, context).attributions([anomaly], "basic")[0]
+
 
+def calculate_basic_feature_attribution_batch(anomalies: list[int], anomaly_data: dict,
+                                              context: "ctx.ExplanationContext | None" = None) -> list[list[float]]:
+    """Calculates the basic feature attribution for several anomalies at once.
 
-def calculate_averaged_feature_attribution(anomaly: int, anomaly_data: dict) -> list[float]:
+    Args:
+        anomalies: The IDs of the anomalies.
+        anomaly_data: The output of the anomaly detection.
+        context: The shared context of the anomaly detection output (optional).
+
+    Returns:
+        A list of percentages for each anomaly that determine the influence of each feature on the anomaly.
+    """
+    indices = [anomaly_data["anomalies"][anomaly]["index"] + anomaly_data["anomalies"][anomaly]["length"] // 2
+               for anomaly in anomalies]
+    return _point_feature_attribution(indices, anomaly_data, context)
+
+
+def _point_feature_attribution(indices: list[int], anomaly_data: dict,
+                               context: "ctx.ExplanationContext | None") -> list[list[float]]:
+    """Calculates the share of each feature in the error at single timestamps.
+
+    Args:
+        indices: The index of the timestamp for each anomaly.
+        anomaly_data: The output of the anomaly detection.
+        context: The shared context of the anomaly detection output (optional).
+
+    Returns:
+        A list of percentages for each timestamp that determine the influence of each feature on the error.
+    """
+    with metrics.stage("attribution"):
+        deep_error = ctx.fetch_context(anomaly_data, context).deep_error
+        error = np.array([anomaly_data["error"][index] for index in indices], dtype=float)
+        return (deep_error[:, indices] / error * 100).T.tolist()
+
+
+def calculate_averaged_feature_attribution(anomaly: int, anomaly_data: dict,
+                                           context: "ctx.ExplanationContext | None" = None) -> list[float]:
     """Calculates results feature attribution based on the specified anomaly and the output of the anomaly detection.
 
     Uses the averaged results of the anomaly area for the feature attribution
@@ -39,22 +98,44 @@ def calculate_averaged_feature_attribution(anomaly: int, anomaly_data: dict) ->
     Args:
         anomaly: The ID of the anomaly.
         anomaly_data: The output of the anomaly detection.
+        context: The shared context of the anomaly detection output (optional).
 
     Returns:
         A percentage for each feature that determines its influence on the detected anomaly.
     """
-    anomaly_index = anomaly_data["anomalies"][anomaly]["index"]
-    anomaly_length = anomaly_data["anomalies"][anomaly]["length"]
-    results = []
-    for i in range(len(anomaly_data["sensors"])):
-        sensor_percentages = []
-        for j in range(anomaly_index, anomaly_index + anomaly_length):
-            sensor_percentages.append(anomaly_data["deep-error"][i][j])
-        results.append(sum(sensor_percentages) / len(sensor_percentages))
-    return [(e / sum(results)) * 100 for e in results]
-
-
-def calculate_median_feature_attribution(anomaly: int, anomaly_data: dict) -> list[float]:
+    return ctx.fetch_context(anomaly_data, context).attributions([anomaly], "averaged")[0]
+
+
+def calculate_averaged_feature_attribution_batch(anomalies: list[int], anomaly_data: dict,
+                                                 context: "ctx.ExplanationContext | None" = None
+                                                 ) -> list[list[float]]:
+    """Calculates the averaged feature attribution for several anomalies at once.
+
+    The means of all anomaly areas are derived from the prefix sums of the deep error, so each area costs a
+    constant amount of work per sensor regardless of its length. A missing value (NaN) makes all following prefix sums
+    missing, so the areas of these sensors are averaged directly instead (missing if the area contains a missing value).
+
+    Args:
+        anomalies: The IDs of the anomalies.
+        anomaly_data: The output of the anomaly detection.
+        context: The shared context of the anomaly detection output (optional).
+
+    Returns:
+        A list of percentages for each anomaly that determine the influence of each feature on the anomaly.
+    """
+    with metrics.stage("attribution"):
+        context = ctx.fetch_context(anomaly_data, context)
+        prefix_sums = context.prefix_sums
+        starts = np.array([anomaly_data["anomalies"][anomaly]["index"] for anomaly in anomalies], dtype=int)
+        lengths = np.array([anomaly_data["anomalies"][anomaly]["length"] for anomaly in anomalies], dtype=int)
+        results = (prefix_sums[:, starts + lengths] - prefix_sums[:, starts]) / lengths
+        for sensor, i in zip(*np.nonzero(np.isnan(results))):
+            results[sensor, i] = context.deep_error[sensor, starts[i]:starts[i] + lengths[i]].mean()
+        return (results / results.sum(axis=0) * 100).T.tolist()
+
+
+def calculate_median_feature_attribution(anomaly: int, anomaly_data: dict,
+                                         context: "ctx.ExplanationContext | None" = None) -> list[float]:
     """Calculates a feature attribution based on the specified anomaly and the output of the anomaly detection.
 
     Uses the median values of the anomaly area for the feature attribution
@@ -62,16 +143,72 @@ def calculate_median_feature_attribution(anomaly: int, anomaly_data: dict) -> li
     Args:
         anomaly: The ID of the anomaly.
         anomaly_data: The output of the anomaly detection.
+        context: The shared context of the anomaly detection output (optional).
 
     Returns:
         A percentage for each feature that determines its influence on the detected anomaly.
     """
-    anomaly_index = anomaly_data["anomalies"][anomaly]["index"]
-    anomaly_length = anomaly_data["anomalies"][anomaly]["length"]
-    results = []
-    for i in range(len(anomaly_data["sensors"])):
-        sensor_percentages = []
-        for j in range(anomaly_index, anomaly_index + anomaly_length):
-            sensor_percentages.append(anomaly_data["deep-error"][i][j])
-        results.append(sorted(sensor_percentages)[len(sensor_percentages) // 2])
-    return [(e / sum(results)) * 100 for e in results]
+    return ctx.fetch_context(anomaly_data, context).attributions([anomaly], "median")[0]
+
+
+def calculate_median_feature_attribution_batch(anomalies: list[int], anomaly_data: dict,
+                                               context: "ctx.ExplanationContext | None" = None
+                                               ) -> list[list[float]]:
+    """Calculates the median feature attribution for several anomalies at once.
+
+    Uses a partition-based selection of the (upper) median of each anomaly area instead of sorting it.
+    The median of an area with a missing value (NaN) is missing.
+
+    Args:
+        anomalies: The IDs of the anomalies.
+        anomaly_data: The output of the anomaly detection.
+        context: The shared context of the anomaly detection output (optional).
+
+    Returns:
+        A list of percentages for each anomaly that determine the influence of each feature on the anomaly.
+    """
+    with metrics.stage("attribution"):
+        deep_error = ctx.fetch_context(anomaly_data, context).deep_error
+        attributions = []
+        for anomaly in anomalies:
+            anomaly_index = anomaly_data["anomalies"][anomaly]["index"]
+            anomaly_length = anomaly_data["anomalies"][anomaly]["length"]
+            area = deep_error[:, anomaly_index:anomaly_index + anomaly_length]
+            results = np.partition(area, anomaly_length // 2, axis=1)[:, anomaly_length // 2]
+            results[np.isnan(area).any(axis=1)] = np.nan
+            attributions.append((results / results.sum() * 100).tolist())
+        return attributions
+
+
+def fetch_deep_error(anomaly_data: dict) -> np.ndarray:
+    """Returns the deep error of the anomaly detection as contiguous 2-D array (sensors x timestamps).
+
+    Args:
+        anomaly_data: The output of the anomaly detection.
+
+    Returns:
+        The deep error without a copy if it is already present as such an array.
+    """
+    return np.ascontiguousarray(anomaly_data["deep-error"], dtype=float)
+
+
+def calculate_prefix_sums(deep_error: np.ndarray) -> np.ndarray:
+    """Calculates the prefix sums of the deep error for each sensor.
+
+    Args:
+        deep_error: The deep error as 2-D array (sensors x timestamps).
+
+    Returns:
+        The prefix sums (sensors x timestamps + 1) with a leading zero column.
+    """
+    prefix_sums = np.zeros((deep_error.shape[0], deep_error.shape[1] + 1))
+    np.cumsum(deep_error, axis=1, out=prefix_sums[:, 1:])
+    return prefix_sums
+
+
+FEATURE_ATTRIBUTION_BATCHES = {
+    "averaged": calculate_averaged_feature_attribution_batch,
+    "median": calculate_median_feature_attribution_batch,
+    "basic": calculate_basic_feature_attribution_batch,
+    "very-basic": calculate_very_basic_feature_attribution_batch
+}
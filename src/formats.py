@@ -0,0 +1,288 @@
+"""Contains all functions related to the binary payload and response formats"""
+import email.message
+import io
+import json
+import os
+
+import numpy as np
+import orjson
+import pyarrow as pa
+from fastapi import HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, GZipResponder, IdentityResponder
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from . import ingestion
+from . import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+JSON = "application/json"
+ARROW = "application/vnd.apache.arrow.stream"
+NPZ = "application/x-npz"
+
+COMPRESSION_MIN_BYTES = int(os.environ.get("EXPLAINABILITY_COMPRESSION_MIN_BYTES", 1024))
+
+
+async def read_binary_payload(request: Request) -> dict | None:
+    """Decodes an Arrow IPC stream or an NPZ archive sent as request body.
+
+    JSON bodies are left to the endpoint, so None is returned for them.
+
+    Args:
+        request: The incoming request.
+
+    Returns:
+        The output of the anomaly detection with an already parsed dataframe or None for JSON bodies.
+
+    Raises:
+        HTTPException: The content type is not supported or the body can not be decoded.
+    """
+    content_type = media_type(request.headers.get("content-type"))
+    if content_type is None or content_type == JSON or content_type.endswith("+json"):
+        return None
+    if content_type not in (ARROW, NPZ):
+        raise HTTPException(status_code=415, detail="Unsupported content type")
+    body = await request.body()
+    try:
+        with metrics.stage("decode"):
+            return decode_arrow(body) if content_type == ARROW else decode_npz(body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Payload can not be decoded")
+
+
+def decode_npz(body: bytes) -> dict:
+    """Decodes the output of the anomaly detection from an NPZ archive.
+
+    The archive contains the arrays "index" (datetime64, defaults to "timestamps"), "values" (sensors x timestamps),
+    "sensors", "deep-error" (sensors x timestamps), "error", "timestamps" (datetime64), "anomaly-index" and
+    "anomaly-length", and optionally "anomaly-timestamp", "anomaly-type" and "algo".
+
+    Args:
+        body: The NPZ archive.
+
+    Returns:
+        The output of the anomaly detection with an already parsed dataframe.
+    """
+    with np.load(io.BytesIO(body), allow_pickle=False) as archive:
+        arrays = {key: archive[key] for key in archive.files}
+    sensors = arrays["sensors"].tolist()
+    timestamps = arrays["timestamps"].astype("datetime64[ns]")
+    anomalies = [{"index": int(index), "length": int(length)}
+                 for index, length in zip(arrays["anomaly-index"], arrays["anomaly-length"])]
+    for key in ("timestamp", "type"):
+        if f"anomaly-{key}" in arrays:
+            for anomaly, value in zip(anomalies, arrays[f"anomaly-{key}"].astype(str).tolist()):
+                anomaly[key] = value
+    return {
+        "dataframe": ingestion.build_dataframe_from_arrays(
+            arrays["index"].astype("datetime64[ns]") if "index" in arrays else timestamps, arrays["values"], sensors
+        ),
+        "deep-error": np.ascontiguousarray(arrays["deep-error"], dtype=float),
+        "error": np.asarray(arrays["error"], dtype=float),
+        "sensors": sensors,
+        "algo": arrays["algo"].item() if "algo" in arrays else None,
+        "timestamps": timestamps,
+        "anomalies": anomalies,
+    }
+
+
+def decode_arrow(body: bytes) -> dict:
+    """Decodes the output of the anomaly detection from an Arrow IPC stream.
+
+    The stream contains a "timestamp" column, one float column per sensor, one "deep-error/<sensor>" column per sensor
+    and an "error" column. The anomalies and the algorithm are stored as JSON in the schema metadata
+    under the keys "anomalies" and "algo".
+
+    Args:
+        body: The Arrow IPC stream.
+
+    Returns:
+        The output of the anomaly detection with an already parsed dataframe.
+    """
+    table = pa.ipc.open_stream(pa.py_buffer(body)).read_all().combine_chunks()
+    metadata = table.schema.metadata or {}
+    sensors = [name for name in table.column_names
+               if name not in ("timestamp", "error") and not name.startswith("deep-error/")]
+    timestamps = table.column("timestamp").to_numpy().astype("datetime64[ns]")
+    values = np.stack([table.column(sensor).to_numpy() for sensor in sensors])
+    return {
+        "dataframe": ingestion.build_dataframe_from_arrays(timestamps, values, sensors),
+        "deep-error": np.stack([table.column(f"deep-error/{sensor}").to_numpy() for sensor in sensors]).astype(float),
+        "error": table.column("error").to_numpy(),
+        "sensors": sensors,
+        "algo": json.loads(metadata.get(b"algo", b"null")),
+        "timestamps": timestamps,
+        "anomalies": json.loads(metadata.get(b"anomalies", b"[]")),
+    }
+
+
+def encode_response(result: dict, accept: str | None, precision: int | None = None) -> Response:
+    """Encodes the result of an endpoint in the format requested by the Accept header.
+
+    Nested dicts are flattened into arrays named by their "/"-separated path,
+    lists of flat dicts become one array per key.
+    NPZ responses contain these arrays, Arrow IPC responses a table with a single row and one column per array.
+    JSON responses are encoded with orjson, which serializes NumPy arrays natively and NaN as null.
+
+    Args:
+        result: The result of the endpoint.
+        accept: The Accept header of the request.
+        precision: The number of decimals to round the floats of the result to (optional).
+
+    Returns:
+        The response with the encoded result.
+    """
+    media_types = [media_type(e) for e in (accept or "").split(",")]
+    with metrics.stage("serialize"):
+        if precision is not None:
+            result = round_floats(result, precision)
+        if ARROW in media_types:
+            table = pa.table({key: [value] for key, value in flatten(result)})
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            return Response(content=sink.getvalue().to_pybytes(), media_type=ARROW)
+        if NPZ in media_types:
+            buffer = io.BytesIO()
+            np.savez(buffer, **{key: to_array(value) for key, value in flatten(result)})
+            return Response(content=buffer.getvalue(), media_type=NPZ)
+        return Response(content=orjson.dumps(result, default=jsonable_encoder, option=orjson.OPT_SERIALIZE_NUMPY),
+                        media_type=JSON)
+
+
+def round_floats(value, precision: int):
+    """Rounds the floats of a (nested) result.
+
+    Lists of numbers are rounded at once as NumPy arrays, missing values become NaN (encoded as null).
+
+    Args:
+        value: The (nested) result.
+        precision: The number of decimals.
+
+    Returns:
+        The result with rounded floats.
+    """
+    if isinstance(value, dict):
+        return {k: round_floats(v, precision) for k, v in value.items()}
+    if isinstance(value, list):
+        if any(isinstance(e, (dict, list, str)) for e in value):
+            return [round_floats(e, precision) for e in value]
+        if all(isinstance(e, int) for e in value):
+            return value
+        return np.round(np.array(value, dtype=float), precision)
+    if isinstance(value, np.ndarray) and value.dtype.kind == "f":
+        return np.round(value, precision)
+    if isinstance(value, float):
+        return round(value, precision)
+    return value
+
+
+class BrotliResponder(IdentityResponder):
+    """Streams the response body through a Brotli compressor (only used if the brotli package is installed)."""
+
+    content_encoding = "br"
+
+    def __init__(self, app: ASGIApp, minimum_size: int, **kwargs):
+        super().__init__(app, minimum_size, **kwargs)
+        self._compressor = None
+
+    async def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        if self._compressor is None:
+            self._compressor = brotli.Compressor(quality=4)
+        with metrics.stage("compress"):
+            compressed = self._compressor.process(body)
+            return compressed + (self._compressor.flush() if more_body else self._compressor.finish())
+
+
+class MeasuredGZipResponder(GZipResponder):
+    """Streams the response body through a gzip compressor and measures the compression as stage of the request."""
+
+    async def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        with metrics.stage("compress"):
+            return await super().apply_compression(body, more_body=more_body)
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """Compresses response bodies of at least minimum_size bytes with Brotli (if installed) or gzip, as accepted by
+    the client.
+
+    Extends the GZipMiddleware of Starlette, so the body is streamed through the compressor instead of being buffered,
+    and smaller bodies (e.g. of /metrics) are sent unchanged.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        header = Headers(scope=scope).get("accept-encoding", "")
+        encodings = [e.split(";")[0].strip().lower() for e in header.split(",")]
+        if brotli is not None and "br" in encodings:
+            responder = BrotliResponder(self.app, self.minimum_size, exclude_content_types=self.exclude_content_types)
+        elif "gzip" in encodings:
+            responder = MeasuredGZipResponder(self.app, self.minimum_size, compresslevel=self.compresslevel,
+                                              thread_minimum_size=self.thread_minimum_size,
+                                              exclude_content_types=self.exclude_content_types)
+        else:
+            responder = IdentityResponder(self.app, self.minimum_size, exclude_content_types=self.exclude_content_types)
+        await responder(scope, receive, send)
+
+
+def flatten(value, key: str = ""):
+    """Flattens a nested result into arrays named by their path.
+
+    Args:
+        value: The (nested) result.
+        key: The path of the value.
+
+    Yields:
+        The path and the list or scalar of each leaf.
+    """
+    if isinstance(value, dict):
+        for k, v in value.items():
+            yield from flatten(v, f"{key}/{k}" if key else k)
+    elif isinstance(value, list) and value and all(isinstance(e, dict) for e in value):
+        if all(not isinstance(v, (dict, list)) for e in value for v in e.values()):
+            for k in value[0]:
+                yield f"{key}/{k}", [e[k] for e in value]
+        else:
+            for i, e in enumerate(value):
+                yield from flatten(e, f"{key}/{i}")
+    else:
+        yield key, value
+
+
+def to_array(value) -> np.ndarray:
+    """Converts a leaf of a flattened result to a NumPy array.
+
+    Args:
+        value: A list or scalar.
+
+    Returns:
+        The array, with missing values of numeric lists converted to NaN.
+    """
+    if isinstance(value, list) and any(e is None for e in value):
+        return np.array(value, dtype=float)
+    return np.array(value)
+
+
+def media_type(header: str | None) -> str | None:
+    """Extracts the media type without parameters from a Content-Type or Accept entry.
+
+    Args:
+        header: The header value.
+
+    Returns:
+        The lower-case media type or None if the header is missing.
+    """
+    if not header:
+        return None
+    message = email.message.Message()
+    message["content-type"] = header.strip()
+    return message.get_content_type()
@@ -0,0 +1,104 @@
+"""Contains all functions related to parsing the output of the anomaly detection"""
+from typing import Callable
+
+import numpy as np
+import orjson
+import pandas as pd
+from fastapi import Request
+from fastapi.routing import APIRoute
+
+from . import metrics
+
+
+class ORJSONRequest(Request):
+    """A request that decodes its JSON body with orjson instead of the standard library."""
+
+    async def json(self):
+        """Returns the decoded JSON body of the request.
+
+        Returns:
+            The decoded JSON body.
+        """
+        if not hasattr(self, "_json"):
+            body = await self.body()
+            with metrics.stage("decode"):
+                self._json = orjson.loads(body)
+        return self._json
+
+
+class ORJSONRoute(APIRoute):
+    """A route that passes ORJSONRequests to its endpoint."""
+
+    def get_route_handler(self) -> Callable:
+        """Returns the route handler that wraps the incoming request.
+
+        Returns:
+            The route handler of the endpoint.
+        """
+        original_route_handler = super().get_route_handler()
+
+        async def route_handler(request: Request):
+            return await original_route_handler(ORJSONRequest(request.scope, request.receive))
+
+        return route_handler
+
+
+def load_dataframe(anomaly_data: dict) -> pd.DataFrame:
+    """Returns the dataframe of the anomaly detection output with a datetime index.
+
+    A dataframe that was already parsed (e.g. for a registered dataset) is returned as is.
+    For a dataset from the on-disk store, the dataframe is built from the series of all sensors
+    (which loads them completely into memory).
+
+    Args:
+        anomaly_data: The output of the anomaly detection.
+
+    Returns:
+        The dataframe with one float column per sensor.
+    """
+    if "series" in anomaly_data:
+        with metrics.stage("dataframe"):
+            return build_dataframe_from_arrays(np.asarray(anomaly_data["timestamps"]), np.stack(anomaly_data["series"]),
+                                               anomaly_data["sensors"])
+    if isinstance(anomaly_data["dataframe"], pd.DataFrame):
+        return anomaly_data["dataframe"]
+    with metrics.stage("dataframe"):
+        return build_dataframe(anomaly_data["dataframe"])
+
+
+def build_dataframe(dataframe: dict) -> pd.DataFrame:
+    """Builds the dataframe from the nested dict of the anomaly detection output.
+
+    The series of each sensor is read straight into a float array (missing values become NaN) and the timestamps are
+    parsed only once.
+    Falls back to pandas if the sensors do not share the same timestamps.
+
+    Args:
+        dataframe: A dict with a dict of timestamps and values for each sensor.
+
+    Returns:
+        The dataframe with one float column per sensor and a datetime index.
+    """
+    series = list(dataframe.values())
+    keys = list(series[0].keys()) if series else []
+    if not all(list(e.keys()) == keys for e in series[1:]):
+        df = pd.DataFrame(dataframe)
+        return build_dataframe_from_arrays(pd.to_datetime(df.index.values).values, df.to_numpy().T, list(df.columns))
+    values = np.empty((len(series), len(keys)))
+    for i, e in enumerate(series):
+        values[i] = list(e.values())
+    return build_dataframe_from_arrays(np.array(keys, dtype="datetime64[ns]"), values, list(dataframe.keys()))
+
+
+def build_dataframe_from_arrays(index: np.ndarray, values: np.ndarray, columns: list[str]) -> pd.DataFrame:
+    """Builds the dataframe from the already parsed timestamps and values.
+
+    Args:
+        index: The timestamps as datetime64 array.
+        values: The values as 2-D float array (sensors x timestamps).
+        columns: The names of the sensors.
+
+    Returns:
+        The dataframe with one float column per sensor and a datetime index, sharing the memory of values if possible.
+    """
+    return pd.DataFrame(np.asarray(values, dtype=float).T, index=pd.DatetimeIndex(index), columns=columns, copy=False)
@@ -0,0 +1,218 @@
+"""Contains the per-stage timing instrumentation of the explanation requests"""
+import os
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+from typing import Callable, get_args
+
+from fastapi import Request, Response
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# statistics that only ever increase are exposed as counters, all others as gauges
+COUNTERS = {"hits", "misses", "evictions", "expirations", "requests", "calculations", "coalesced", "cache_hits"}
+
+DESCRIPTIONS = {
+    "entries": "Number of stored entries.",
+    "bytes": "Size of the stored entries in bytes.",
+    "max_bytes": "Memory budget of the entries in bytes.",
+    "ttl": "Time in seconds after which an unused entry is removed.",
+    "hits": "Number of lookups of a stored entry.",
+    "misses": "Number of lookups of a missing entry.",
+    "evictions": "Number of entries removed to meet the memory budget.",
+    "expirations": "Number of entries removed after the TTL.",
+    "requests": "Number of requests.",
+    "calculations": "Number of calculations started.",
+    "coalesced": "Number of requests that awaited a running calculation.",
+    "cache_hits": "Number of requests answered from the result cache.",
+    "running": "Number of running calculations.",
+    "cached": "Number of cached results.",
+    "ratio": "Share of the requests that did not need an own calculation.",
+    "workers": "Number of worker processes.",
+    "pending": "Number of running and waiting tasks."
+}
+
+enabled = os.environ.get("EXPLAINABILITY_METRICS", "0").lower() not in ("0", "false", "no", "")
+
+_timings: ContextVar[dict | None] = ContextVar("timings", default=None)
+_no_stage = nullcontext()
+_histograms = {}
+_methods = {}
+
+
+class _Stage:
+    """Measures the duration of a stage and adds it to the timings of the current request."""
+
+    __slots__ = ("timings", "name", "ignore", "start")
+
+    def __init__(self, timings: dict, name: str, ignore: tuple[type[BaseException], ...]):
+        self.timings = timings
+        self.name = name
+        self.ignore = ignore
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, error_type, *_):
+        if error_type is None or not issubclass(error_type, self.ignore):
+            self.timings[self.name] = self.timings.get(self.name, 0.0) + time.perf_counter() - self.start
+
+
+def stage(name: str, ignore: tuple[type[BaseException], ...] = ()):
+    """Returns a context manager that measures the duration of a stage of the current request.
+
+    Durations of repeated stages are summed up. Nothing is measured if no timings are collected for the current request.
+
+    Args:
+        name: The name of the stage.
+        ignore: The exceptions that end the stage without recording its duration (e.g. if the stage did not start).
+
+    Returns:
+        The context manager for the stage.
+    """
+    timings = _timings.get()
+    if timings is None:
+        return _no_stage
+    return _Stage(timings, name, ignore)
+
+
+def collect(function: Callable, *args) -> tuple:
+    """Calls the function and collects the timings of its stages (used in worker processes).
+
+    Args:
+        function: The function to call.
+        *args: The arguments of the function.
+
+    Returns:
+        The result of the function and the timings of its stages.
+    """
+    timings = {}
+    token = _timings.set(timings)
+    try:
+        return function(*args), timings
+    finally:
+        _timings.reset(token)
+
+
+def merge(timings: dict):
+    """Adds the timings collected in a worker process to the timings of the current request.
+
+    Args:
+        timings: The durations of the stages.
+    """
+    current = _timings.get()
+    if current is not None:
+        for name, duration in timings.items():
+            current[name] = current.get(name, 0.0) + duration
+
+
+async def timing_middleware(request: Request, call_next: Callable) -> Response:
+    """Collects the stage timings of a request, records them and reports them in the Server-Timing header.
+
+    Args:
+        request: The incoming request.
+        call_next: The next handler of the request.
+
+    Returns:
+        The response with the Server-Timing header.
+    """
+    timings = {}
+    token = _timings.set(timings)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        _timings.reset(token)
+    timings["total"] = time.perf_counter() - start
+    route = request.scope.get("route")
+    observe(route.path if route is not None else "unmatched", method_label(route, request.query_params.get("method")),
+            timings)
+    response.headers["Server-Timing"] = ", ".join(f"{name};dur={duration * 1000:.3f}"
+                                                  for name, duration in timings.items())
+    return response
+
+
+def method_label(route, method: str | None) -> str:
+    """Returns the method label of a request, limited to the methods accepted by its route.
+
+    The accepted methods are read from the Literal type of the method query parameter of the route, so arbitrary values
+    of the parameter do not create new series.
+
+    Args:
+        route: The matched route of the request (None if no route matched).
+        method: The value of the method query parameter (None if it was omitted).
+
+    Returns:
+        The method, "default" if it was omitted or "other" if the route does not accept it.
+    """
+    if method is None:
+        return "default"
+    if route is None:
+        return "other"
+    if route.path not in _methods:
+        parameters = getattr(getattr(route, "dependant", None), "query_params", [])
+        _methods[route.path] = {value for parameter in parameters if parameter.name == "method"
+                                for value in get_args(parameter.field_info.annotation)}
+    return method if method in _methods[route.path] else "other"
+
+
+def observe(endpoint: str, method: str, timings: dict):
+    """Records the stage timings of a request in the histograms.
+
+    Args:
+        endpoint: The path of the endpoint.
+        method: The explanation method of the request.
+        timings: The durations of the stages.
+    """
+    for name, duration in timings.items():
+        histogram = _histograms.get((endpoint, method, name))
+        if histogram is None:
+            histogram = _histograms[(endpoint, method, name)] = [[0] * len(BUCKETS), 0.0, 0]
+        for i, bound in enumerate(BUCKETS):
+            if duration <= bound:
+                histogram[0][i] += 1
+        histogram[1] += duration
+        histogram[2] += 1
+
+
+def render(counters: dict[str, dict]) -> str:
+    """Renders the stage histograms and further counters in the Prometheus text format.
+
+    Statistics listed in COUNTERS are rendered as counters (with the suffix _total), all others as gauges.
+
+    Args:
+        counters: The name prefix and the statistics of further components (e.g. the dataset cache).
+
+    Returns:
+        The metrics in the Prometheus text format.
+    """
+    lines = ["# HELP explainability_stage_seconds Duration of the stages of the explanation requests.",
+             "# TYPE explainability_stage_seconds histogram"]
+    for (endpoint, method, name), (buckets, total, count) in sorted(_histograms.items()):
+        labels = f'endpoint="{escape(endpoint)}",method="{escape(method)}",stage="{escape(name)}"'
+        for bound, value in zip(BUCKETS, buckets):
+            lines.append(f'explainability_stage_seconds_bucket{{{labels},le="{bound}"}} {value}')
+        lines.append(f'explainability_stage_seconds_bucket{{{labels},le="+Inf"}} {count}')
+        lines.append(f"explainability_stage_seconds_sum{{{labels}}} {total}")
+        lines.append(f"explainability_stage_seconds_count{{{labels}}} {count}")
+    for prefix, stats in counters.items():
+        for key, value in stats.items():
+            kind = "counter" if key in COUNTERS else "gauge"
+            name = f"explainability_{prefix}_{key}_total" if kind == "counter" else f"explainability_{prefix}_{key}"
+            lines.append(f"# HELP {name} {DESCRIPTIONS.get(key, key.replace('_', ' ').capitalize() + '.')}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name} {float(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def escape(value: str) -> str:
+    """Escapes a label value for the Prometheus text format.
+
+    Args:
+        value: The label value.
+
+    Returns:
+        The value with escaped backslashes, double quotes and line feeds.
+    """
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,245 @@
+"""Contains the incremental seasonal profiles of streamed sensor data"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from . import context as ctx
+
+MIN_VALUE = 1e-9
+
+_OFFSET = 2 ** 30
+_SLOT_SHIFT = 2 ** 32
+
+
+class SeasonalProfile:
+    """The running profile of a single sensor for each slot of the week (position of a value modulo one week).
+
+    The mean of each slot is exact, as the sum and the number of its values are kept.
+    The quantiles of each slot are estimated with a logarithmic bucket sketch (like DDSketch): a value x is counted in
+    the bucket i with gamma^(i-1) < |x| <= gamma^i, where gamma = (1 + accuracy) / (1 - accuracy), and estimated as
+    2 * gamma^i / (gamma + 1). Therefore, each estimated value has a relative error of at most the accuracy
+    (|estimate - x| <= accuracy * |x|), values with |x| <= MIN_VALUE are estimated as 0. Quantiles between two values
+    are interpolated like np.median, so the error of the median is at most the accuracy times the mean magnitude of the
+    two middle values. The number of buckets per slot is bounded by the number of weeks and the range of the values.
+    """
+
+    def __init__(self, week_length: int, accuracy: float):
+        """Initializes an empty profile.
+
+        Args:
+            week_length: The number of values per week (slots).
+            accuracy: The relative accuracy of the quantile estimates.
+        """
+        self.week_length = week_length
+        self.accuracy = accuracy
+        self.length = 0
+        self.last = None
+        self.tail = None
+        self.sums = np.zeros(week_length)
+        self.counts = np.zeros(week_length, dtype=np.int64)
+        self.sketches = [{} for _ in range(week_length)]
+        self._gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = np.log(self._gamma)
+
+    def update(self, series: np.ndarray, timestamps):
+        """Adds the values of the series that were appended since the last update.
+
+        The work only depends on the number of appended values.
+
+        Args:
+            series: The complete values of the sensor, starting with the values of earlier updates.
+            timestamps: The timestamps of the values.
+        """
+        values = series[self.length:]
+        slots = np.arange(self.length, len(series)) % self.week_length
+        valid = np.isfinite(values)
+        values, slots = values[valid], slots[valid]
+        np.add.at(self.sums, slots, values)
+        np.add.at(self.counts, slots, 1)
+        keys, counts = np.unique(slots * _SLOT_SHIFT + self._codes(values) + _SLOT_SHIFT // 2, return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            sketch = self.sketches[key // _SLOT_SHIFT]
+            code = key % _SLOT_SHIFT - _SLOT_SHIFT // 2
+            sketch[code] = sketch.get(code, 0) + count
+        self.length = len(series)
+        self.last = str(timestamps[len(series) - 1]) if len(series) else None
+        self.tail = fingerprint(series[max(self.length - self.week_length, 0):self.length])
+
+    def follows(self, series: np.ndarray, timestamps) -> bool:
+        """Checks whether the series continues the values of the earlier updates.
+
+        Only the timestamp of the last value and the last week of values of the earlier updates are compared,
+        so the check does not depend on the length of the series.
+
+        Args:
+            series: The complete values of the sensor.
+            timestamps: The timestamps of the complete values of the sensor.
+
+        Returns:
+            True if the series contains the last timestamp and the last week of values of the earlier updates
+            at the same positions.
+        """
+        if self.length == 0:
+            return True
+        if len(timestamps) < self.length or str(timestamps[self.length - 1]) != self.last:
+            return False
+        return fingerprint(series[max(self.length - self.week_length, 0):self.length]) == self.tail
+
+    def mean(self, slots: np.ndarray) -> np.ndarray:
+        """Returns the mean of each slot.
+
+        Args:
+            slots: The slots of the week.
+
+        Returns:
+            The mean of all values of each slot.
+        """
+        return self.sums[slots] / self.counts[slots]
+
+    def quantile(self, slots: np.ndarray, q: float) -> np.ndarray:
+        """Returns the estimated quantile of each slot.
+
+        Args:
+            slots: The slots of the week.
+            q: The quantile (between 0 and 1).
+
+        Returns:
+            The estimated quantile of all values of each slot.
+        """
+        return np.array([self._quantile(self.sketches[slot], self.counts[slot], q) for slot in slots.tolist()])
+
+    def median(self, slots: np.ndarray) -> np.ndarray:
+        """Returns the estimated median of each slot.
+
+        Args:
+            slots: The slots of the week.
+
+        Returns:
+            The estimated median of all values of each slot.
+        """
+        return self.quantile(slots, 0.5)
+
+    def _quantile(self, sketch: dict, count: int, q: float) -> float:
+        """Estimates a quantile from the bucket counts of a slot.
+
+        Args:
+            sketch: The number of values of each bucket (ordered by the value of the bucket).
+            count: The total number of values.
+            q: The quantile (between 0 and 1).
+
+        Returns:
+            The estimated quantile or NaN if the slot has no values.
+        """
+        if count == 0:
+            return np.nan
+        rank = q * (count - 1)
+        lower, upper = int(np.floor(rank)), int(np.ceil(rank))
+        estimates = []
+        seen = 0
+        for code in sorted(sketch):
+            seen += sketch[code]
+            while len(estimates) < 2 and seen > (lower, upper)[len(estimates)]:
+                estimates.append(self._value(code))
+        return estimates[0] + (estimates[1] - estimates[0]) * (rank - lower)
+
+    def _codes(self, values: np.ndarray) -> np.ndarray:
+        """Calculates the bucket codes of the values, which are ordered like the values.
+
+        Args:
+            values: The values.
+
+        Returns:
+            The signed bucket index (shifted by an offset) or 0 for values close to zero.
+        """
+        magnitudes = np.abs(values)
+        nonzero = magnitudes > MIN_VALUE
+        exponents = np.ceil(np.log(np.where(nonzero, magnitudes, 1.0)) / self._log_gamma).astype(np.int64)
+        return np.where(nonzero, np.sign(values).astype(np.int64) * (exponents + _OFFSET), 0)
+
+    def _value(self, code: int) -> float:
+        """Estimates the value of a bucket.
+
+        Args:
+            code: The bucket code.
+
+        Returns:
+            The estimated value with a relative error of at most the accuracy.
+        """
+        if code == 0:
+            return 0.0
+        return float(np.sign(code)) * 2 * self._gamma ** (abs(code) - _OFFSET) / (self._gamma + 1)
+
+
+class ProfileStore:
+    """A thread-safe LRU store of the seasonal profiles of streamed sensor data.
+
+    The profiles of a stream are addressed by its sensors, its first timestamp, its time resolution and a fingerprint of
+    the first week of values of the sensor, so outputs of the anomaly detection that append values to an earlier output
+    only add the appended values, while streams with the same sensors and start (e.g. of two buildings) are kept apart.
+    A profile is rebuilt if the output does not continue the timestamps and values of the earlier outputs.
+
+    The store lives in the process that calculates the prototypes, so each worker process keeps its own store. Requests
+    of a stream that reach different workers build the same profile in each of them, which multiplies both the work of
+    the first requests and the memory of the profiles by the number of workers.
+    """
+
+    def __init__(self, max_entries: int, accuracy: float):
+        """Initializes an empty store.
+
+        Args:
+            max_entries: The maximum number of profiles.
+            accuracy: The relative accuracy of the quantile estimates.
+        """
+        self.max_entries = max_entries
+        self.accuracy = accuracy
+        self._profiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def fetch(self, anomaly_data: dict, sensor: int, context: "ctx.ExplanationContext") -> SeasonalProfile:
+        """Returns the profile of a sensor updated with all values of the output of the anomaly detection.
+
+        Args:
+            anomaly_data: The output of the anomaly detection.
+            sensor: The index of the sensor.
+            context: The shared context of the anomaly detection output.
+
+        Returns:
+            The up-to-date profile of the sensor.
+        """
+        timestamps = anomaly_data["timestamps"]
+        series = context.series(sensor)
+        week_length = 168 * context.frequency
+        key = (tuple(anomaly_data["sensors"]), str(timestamps[0]), context.frequency, sensor,
+               fingerprint(series[:week_length]))
+        with self._lock:
+            profile = self._profiles.get(key)
+            if profile is None or not profile.follows(series, timestamps):
+                profile = SeasonalProfile(week_length, self.accuracy)
+                self._profiles[key] = profile
+            self._profiles.move_to_end(key)
+            while len(self._profiles) > self.max_entries:
+                self._profiles.popitem(last=False)
+            if profile.length < len(timestamps):
+                profile.update(series, timestamps)
+            return profile
+
+
+def fingerprint(values: np.ndarray) -> str:
+    """Calculates a fingerprint of the values of a sensor.
+
+    Args:
+        values: The values.
+
+    Returns:
+        The hex digest of the SHA-256 hash of the values as float64.
+    """
+    return hashlib.sha256(np.ascontiguousarray(values, dtype=float).view(np.uint8)).hexdigest()
+
+
+store = ProfileStore(
+    max_entries=int(os.environ.get("EXPLAINABILITY_PROFILE_ENTRIES", 64)),
+    accuracy=float(os.environ.get("EXPLAINABILITY_PROFILE_ACCURACY", 0.01))
+)
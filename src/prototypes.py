@@ -1,11 +1,79 @@
 """Contains all functions related to the prototype creation"""
 import numpy as np
 import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
 
-from . import feature_attribution as ft
+from . import context as ctx
+from . import metrics
+from . import profiles
 
+HISTORY_MODES = ("all", "last", "decay", "reservoir")
 
-def create_local_prototypes(anomaly: int, anomaly_data: dict) -> tuple[list, list, list]:
+
+class HistoryPolicy:
+    """Selects (and weights) the weekly windows that contribute to the averaged prototypes.
+
+    - "all": All weeks with equal weights.
+    - "last": The last N weeks.
+    - "decay": Exponentially decayed weights with the specified half-life (in weeks). Weeks with a weight below
+      MIN_WEIGHT are left out, so at most ceil(half_life * log2(1 / MIN_WEIGHT)) weeks contribute.
+    - "reservoir": A uniform random sample of N weeks (reproducible through the seed).
+
+    Except for "all", the number of contributing weeks (and thus the cost) is bounded by the policy.
+    """
+
+    MIN_WEIGHT = 1e-3
+
+    def __init__(self, mode: str = "all", weeks: int | None = None, half_life: float | None = None, seed: int = 0):
+        """Initializes the policy.
+
+        Args:
+            mode: The name of the policy.
+            weeks: The number of weeks for "last" and "reservoir".
+            half_life: The half-life (in weeks) for "decay".
+            seed: The seed of the random sample for "reservoir".
+
+        Raises:
+            ValueError: The mode is unknown, its parameter is missing or a parameter of another mode is specified.
+        """
+        if mode not in HISTORY_MODES:
+            raise ValueError(f"Unknown history policy {mode}")
+        if mode in ("last", "reservoir") and (weeks is None or weeks < 1):
+            raise ValueError(f"The history policy {mode} requires a positive number of weeks")
+        if mode == "decay" and (half_life is None or half_life <= 0):
+            raise ValueError("The history policy decay requires a positive half-life")
+        if mode not in ("last", "reservoir") and weeks is not None:
+            raise ValueError(f"The history policy {mode} does not use a number of weeks")
+        if mode != "decay" and half_life is not None:
+            raise ValueError(f"The history policy {mode} does not use a half-life")
+        self.mode = mode
+        self.weeks = weeks
+        self.half_life = half_life
+        self.seed = seed
+
+    def select(self, count: int) -> tuple[np.ndarray, np.ndarray | None]:
+        """Selects the contributing weeks out of all available weeks (ordered from the oldest to the latest).
+
+        Args:
+            count: The number of available weeks.
+
+        Returns:
+            The ascending positions of the contributing weeks and their weights (None for equal weights).
+        """
+        if self.mode == "last":
+            return np.arange(max(count - self.weeks, 0), count), None
+        if self.mode == "reservoir":
+            rng = np.random.default_rng(self.seed)
+            return np.sort(rng.choice(count, min(self.weeks, count), replace=False)), None
+        if self.mode == "decay":
+            horizon = int(np.ceil(self.half_life * np.log2(1 / self.MIN_WEIGHT)))
+            positions = np.arange(max(count - horizon, 0), count)
+            return positions, 0.5 ** ((count - 1 - positions) / self.half_life)
+        return np.arange(count), None
+
+
+def create_local_prototypes(anomaly: int, anomaly_data: dict, padding: int = 4,
+                            context: "ctx.ExplanationContext | None" = None) -> tuple[list, list, list]:
     """Creates prototypes for the specified anomaly.
 
     Generates two similar timeframes based on the surrounding weeks.
@@ -14,30 +82,35 @@ def create_local_prototypes(anomaly: int, anomaly_data: dict) -> tuple[list, lis
     Args:
         anomaly: The ID of the anomaly.
         anomaly_data: The output of the anomaly detection.
+        padding (default=4): The timedelta (in 'h') to be used on both sides of the anomaly timestamp.
+        context: The shared context of the anomaly detection output (optional).
 
     Returns:
         Two created prototypes and the anomaly with the same timeframe.
     """
     sensors = anomaly_data["sensors"]
     anomaly_timestamp = np.datetime64(anomaly_data["timestamps"][anomaly_data["anomalies"][anomaly]["index"]])
-    df = pd.DataFrame(anomaly_data["dataframe"])
-    df.index = pd.to_datetime(df.index.values)
-    time_delta = np.timedelta64(4, 'h')
+    context = ctx.fetch_context(anomaly_data, context)
+    df = context.dataframe
+    time_delta = np.timedelta64(padding, 'h')
     one_week = np.timedelta64(7, 'D')
     two_weeks = np.timedelta64(14, 'D')
-    sensor = fetch_sensor(anomaly, anomaly_data)
+    sensor = context.sensor(anomaly)
     selected_sensor = sensors[sensor]
-    if anomaly_timestamp - two_weeks > df.index[0]:
-        a = df.loc[((anomaly_timestamp - two_weeks - time_delta) <= df.index) & (df.index <= (anomaly_timestamp - two_weeks + time_delta)), [selected_sensor]]
-        b = df.loc[((anomaly_timestamp - one_week - time_delta) <= df.index) & (df.index <= (anomaly_timestamp - one_week + time_delta)), [selected_sensor]]
-    else:
-        a = df.loc[((anomaly_timestamp + two_weeks - time_delta) <= df.index) & (df.index <= (anomaly_timestamp + two_weeks + time_delta)), [selected_sensor]]
-        b = df.loc[((anomaly_timestamp + one_week - time_delta) <= df.index) & (df.index <= (anomaly_timestamp + one_week + time_delta)), [selected_sensor]]
-    c = df.loc[((anomaly_timestamp - time_delta) <= df.index) & (df.index <= (anomaly_timestamp + time_delta)), [selected_sensor]]
+    with metrics.stage("windows"):
+        if anomaly_timestamp - two_weeks > df.index[0]:
+            a = df.loc[((anomaly_timestamp - two_weeks - time_delta) <= df.index) & (df.index <= (anomaly_timestamp - two_weeks + time_delta)), [selected_sensor]]
+            b = df.loc[((anomaly_timestamp - one_week - time_delta) <= df.index) & (df.index <= (anomaly_timestamp - one_week + time_delta)), [selected_sensor]]
+        else:
+            a = df.loc[((anomaly_timestamp + two_weeks - time_delta) <= df.index) & (df.index <= (anomaly_timestamp + two_weeks + time_delta)), [selected_sensor]]
+            b = df.loc[((anomaly_timestamp + one_week - time_delta) <= df.index) & (df.index <= (anomaly_timestamp + one_week + time_delta)), [selected_sensor]]
+        c = df.loc[((anomaly_timestamp - time_delta) <= df.index) & (df.index <= (anomaly_timestamp + time_delta)), [selected_sensor]]
     return [e for e in a[selected_sensor]], [e for e in b[selected_sensor]], [e for e in c[selected_sensor]]
 
 
-def create_averaged_prototypes(anomaly: int, anomaly_data: dict, padding: int = 4) -> tuple[list, list, list]:
+def create_averaged_prototypes(anomaly: int, anomaly_data: dict, padding: int = 4,
+                               context: "ctx.ExplanationContext | None" = None, incremental: bool = False,
+                               history: HistoryPolicy | None = None) -> tuple[list, list, list]:
     """Creates averaged prototypes for the specified anomaly.
 
     The first two additional timeframes act as an example based explanation for the expected behaviour.
@@ -45,16 +118,122 @@ def create_averaged_prototypes(anomaly: int, anomaly_data: dict, padding: int =
     Uses an index based approach to get all related timeframes.
     Calculates one window each with mean and median values.
 
+    In the incremental mode, the windows are read from the seasonal profile of the sensor, which only needs to add the
+    values appended since an earlier output of the same stream. Its mean covers all values of each slot of the week
+    (not only complete windows) and its median is estimated within the accuracy of the profile.
+
     Args:
         anomaly: The ID of the anomaly (starting at 0).
         anomaly_data: The output of the anomaly detection.
         padding: The timedelta (in "h") to be used as padding for extending the resulting timeframe on both sides.
+        context: The shared context of the anomaly detection output (optional).
+        incremental: Whether to read the windows from the seasonal profile instead of recomputing them exactly.
+        history: The policy that selects the contributing weeks (defaults to all weeks).
 
     Returns:
         Two averaged prototypes (mean and median) and the anomaly with the same timeframe.
     """
-    df = pd.DataFrame(anomaly_data["dataframe"])
-    frequency = np.timedelta64(1, "h") // (np.datetime64(df.index[1]) - np.datetime64(df.index[0]))
+    context = ctx.fetch_context(anomaly_data, context)
+    sensor = context.sensor(anomaly)
+    series = context.series(sensor)
+    if incremental:
+        profile = profiles.store.fetch(anomaly_data, sensor, context)
+        return _profile_windows(anomaly, anomaly_data, profile, series, context.frequency, padding)
+    return _averaged_windows(anomaly, anomaly_data, series, context.frequency, padding, history)
+
+
+def create_averaged_prototypes_batch(anomalies: list[int], anomaly_data: dict, padding: int = 4,
+                                     sensors: list[int] | None = None,
+                                     context: "ctx.ExplanationContext | None" = None,
+                                     history: HistoryPolicy | None = None) -> list[tuple[list, list, list]]:
+    """Creates averaged prototypes for several anomalies of the same anomaly detection output.
+
+    Works like create_averaged_prototypes, but the dataframe, its time resolution and the series of each
+    selected sensor are only derived once and shared by all anomalies (through the shared context).
+
+    Args:
+        anomalies: The IDs of the anomalies (starting at 0).
+        anomaly_data: The output of the anomaly detection.
+        padding: The timedelta (in "h") to be used as padding for extending the resulting timeframe on both sides.
+        sensors: The sensor to use for each anomaly. Determined with the shared context if not specified.
+        context: The shared context of the anomaly detection output (optional).
+        history: The policy that selects the contributing weeks (defaults to all weeks).
+
+    Returns:
+        Two averaged prototypes (mean and median) and the anomaly with the same timeframe for each anomaly.
+    """
+    context = ctx.fetch_context(anomaly_data, context)
+    if sensors is None:
+        sensors = [context.sensor(anomaly) for anomaly in anomalies]
+    return [_averaged_windows(anomaly, anomaly_data, context.series(sensor), context.frequency, padding, history)
+            for anomaly, sensor in zip(anomalies, sensors)]
+
+
+def create_averaged_prototypes_sensors(anomaly: int, anomaly_data: dict, sensors: list[int], padding: int = 4,
+                                       context: "ctx.ExplanationContext | None" = None,
+                                       history: HistoryPolicy | None = None) -> list[tuple[list, list, list]]:
+    """Creates averaged prototypes of several sensors for the specified anomaly.
+
+    Works like create_averaged_prototypes, but the weekly windows of all sensors are reduced at once
+    as a single sensors x weeks x window array.
+
+    Args:
+        anomaly: The ID of the anomaly (starting at 0).
+        anomaly_data: The output of the anomaly detection.
+        sensors: The sensors to create the prototypes for.
+        padding: The timedelta (in "h") to be used as padding for extending the resulting timeframe on both sides.
+        context: The shared context of the anomaly detection output (optional).
+        history: The policy that selects the contributing weeks (defaults to all weeks).
+
+    Returns:
+        Two averaged prototypes (mean and median) and the anomaly with the same timeframe for each sensor.
+    """
+    context = ctx.fetch_context(anomaly_data, context)
+    values = [context.series(sensor) for sensor in sensors]
+    return _averaged_windows_stack(anomaly, anomaly_data, values, context.frequency, padding, history)
+
+
+def fetch_history_weeks(anomaly: int, anomaly_data: dict, padding: int = 4,
+                        history: HistoryPolicy | None = None,
+                        context: "ctx.ExplanationContext | None" = None) -> list[dict]:
+    """Determines the weeks that contribute to the averaged prototypes of the specified anomaly.
+
+    Args:
+        anomaly: The ID of the anomaly (starting at 0).
+        anomaly_data: The output of the anomaly detection.
+        padding: The timedelta (in "h") to be used as padding for extending the resulting timeframe on both sides.
+        history: The policy that selects the contributing weeks (defaults to all weeks).
+        context: The shared context of the anomaly detection output (optional).
+
+    Returns:
+        The first timestamp of the window of each contributing week and its (normalized) weight.
+    """
+    context = ctx.fetch_context(anomaly_data, context)
+    starts, weights = _weekly_windows(anomaly, anomaly_data, context.frequency, padding, history)[:2]
+    weights = np.full(len(starts), 1.0) if weights is None else weights
+    timestamps = anomaly_data["timestamps"]
+    return [{"start": pd.Timestamp(timestamps[start]).isoformat(), "weight": weight}
+            for start, weight in zip(starts.tolist(), (weights / weights.sum()).tolist())]
+
+
+def _weekly_windows(anomaly: int, anomaly_data: dict, frequency: int, padding: int,
+                    history: HistoryPolicy | None) -> tuple[np.ndarray, np.ndarray | None, int, int]:
+    """Determines the weekly windows of the averaged prototypes for a single anomaly.
+
+    Args:
+        anomaly: The ID of the anomaly (starting at 0).
+        anomaly_data: The output of the anomaly detection.
+        frequency: The number of values per hour.
+        padding: The timedelta (in "h") to be used as padding for extending the resulting timeframe on both sides.
+        history: The policy that selects the contributing weeks (defaults to all weeks).
+
+    Returns:
+        The start index and the weight (None for equal weights) of each contributing window,
+        the first index of the padded anomaly window (may be negative) and the length of the windows.
+
+    Raises:
+        ValueError: There is no complete weekly window.
+    """
     padding *= frequency
     week_length = 168 * frequency
     anomaly_index = anomaly_data["anomalies"][anomaly]["index"]
@@ -62,99 +241,352 @@ def create_averaged_prototypes(anomaly: int, anomaly_data: dict, padding: int =
     anomaly_low_bound = anomaly_index - padding
     low_bound = anomaly_low_bound % week_length
     w_length = 2 * padding + anomaly_length
-    sensor = fetch_sensor(anomaly, anomaly_data)
-
-    df = df.loc[:, anomaly_data["sensors"][sensor]]
-    indices = range(low_bound, len(anomaly_data["timestamps"]) - w_length, week_length)
-    windows = np.swapaxes(np.array([df.iloc[i:i + w_length] for i in indices]), 0, 1)
-
-    avg_window = [np.average(e) for e in windows]
-    median_window = [np.median(e) for e in windows]
-    anomaly_window = [None] * abs(anomaly_low_bound) if anomaly_low_bound < 0 else []
-    anomaly_window.extend(df.iloc[max(anomaly_low_bound, 0):min(anomaly_low_bound + w_length, len(df.index))].tolist())
-    if anomaly_low_bound + w_length > len(df.index):
-        anomaly_window.extend([None] * anomaly_low_bound + w_length - len(df.index))
+    starts = range(low_bound, len(anomaly_data["timestamps"]) - w_length, week_length)
+    if len(starts) == 0:
+        raise ValueError("Not enough data for averaged prototypes")
+    positions, weights = (history or HistoryPolicy()).select(len(starts))
+    return low_bound + positions * week_length, weights, anomaly_low_bound, w_length
+
+
+def _averaged_windows(anomaly: int, anomaly_data: dict, series: np.ndarray, frequency: int,
+                      padding: int, history: HistoryPolicy | None = None) -> tuple[list, list, list]:
+    """Calculates the mean and median window and the anomaly window for a single anomaly.
+
+    Args:
+        anomaly: The ID of the anomaly (starting at 0).
+        anomaly_data: The output of the anomaly detection.
+        series: The values of the sensor selected for the anomaly.
+        frequency: The number of values per hour.
+        padding: The timedelta (in "h") to be used as padding for extending the resulting timeframe on both sides.
+        history: The policy that selects the contributing weeks (defaults to all weeks).
+
+    Returns:
+        Two averaged prototypes (mean and median) and the anomaly with the same timeframe.
+    """
+    return _averaged_windows_stack(anomaly, anomaly_data, [series], frequency, padding, history)[0]
+
+
+def _averaged_windows_stack(anomaly: int, anomaly_data: dict, values: list[np.ndarray], frequency: int,
+                            padding: int, history: HistoryPolicy | None = None) -> list[tuple[list, list, list]]:
+    """Calculates the mean and median window and the anomaly window of several sensors for a single anomaly.
+
+    Only the weekly windows are read from the values, so memory-mapped values are only loaded partially.
+
+    Args:
+        anomaly: The ID of the anomaly (starting at 0).
+        anomaly_data: The output of the anomaly detection.
+        values: The values of each sensor.
+        frequency: The number of values per hour.
+        padding: The timedelta (in "h") to be used as padding for extending the resulting timeframe on both sides.
+        history: The policy that selects the contributing weeks (defaults to all weeks).
+
+    Returns:
+        Two averaged prototypes (mean and median) and the anomaly with the same timeframe for each sensor.
+    """
+    with metrics.stage("windows"):
+        starts, weights, anomaly_low_bound, w_length = _weekly_windows(anomaly, anomaly_data, frequency, padding,
+                                                                       history)
+        # strided views of the weekly windows of each sensor, stacked to a sensors x weeks x w_length array
+        if history is None or history.mode == "all":
+            step = starts[1] - starts[0] if len(starts) > 1 else 1
+            windows = np.stack([sliding_window_view(series, w_length)[starts[0]::step][:len(starts)]
+                                for series in values])
+        else:
+            windows = np.stack([sliding_window_view(series, w_length)[starts] for series in values])
+
+        if weights is None:
+            avg_windows = np.mean(windows, axis=1).tolist()
+            median_windows = np.median(windows, axis=1).tolist()
+        else:
+            avg_windows = np.average(windows, axis=1, weights=weights).tolist()
+            median_windows = _weighted_median(windows, weights).tolist()
+        anomaly_windows = [_anomaly_window(series, anomaly_low_bound, w_length) for series in values]
+    return list(zip(avg_windows, median_windows, anomaly_windows))
+
+
+def _weighted_median(windows: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """Calculates the weighted median of the weekly windows.
+
+    Args:
+        windows: The weekly windows (sensors x weeks x w_length).
+        weights: The weight of each week.
+
+    Returns:
+        The smallest value of each sensor and position whose cumulative weight reaches half of the total weight.
+    """
+    order = np.argsort(windows, axis=1, kind="stable")
+    cumulative = np.cumsum(weights[order], axis=1)
+    index = (cumulative < cumulative[:, -1:] / 2).sum(axis=1, keepdims=True)
+    return np.take_along_axis(np.take_along_axis(windows, order, axis=1), index, axis=1)[:, 0]
+
+
+def _profile_windows(anomaly: int, anomaly_data: dict, profile: "profiles.SeasonalProfile", series: np.ndarray,
+                     frequency: int, padding: int) -> tuple[list, list, list]:
+    """Reads the mean and median window from the seasonal profile and calculates the anomaly window.
+
+    Args:
+        anomaly: The ID of the anomaly (starting at 0).
+        anomaly_data: The output of the anomaly detection.
+        profile: The seasonal profile of the sensor selected for the anomaly.
+        series: The values of the sensor selected for the anomaly.
+        frequency: The number of values per hour.
+        padding: The timedelta (in "h") to be used as padding for extending the resulting timeframe on both sides.
+
+    Returns:
+        Two averaged prototypes (mean and estimated median) and the anomaly with the same timeframe.
+    """
+    padding *= frequency
+    anomaly_low_bound = anomaly_data["anomalies"][anomaly]["index"] - padding
+    w_length = 2 * padding + anomaly_data["anomalies"][anomaly]["length"]
+
+    with metrics.stage("windows"):
+        slots = np.arange(anomaly_low_bound, anomaly_low_bound + w_length) % profile.week_length
+        if not profile.counts[slots].all():
+            raise ValueError("Not enough data for averaged prototypes")
+        avg_window = profile.mean(slots).tolist()
+        median_window = profile.median(slots).tolist()
+        anomaly_window = _anomaly_window(series, anomaly_low_bound, w_length)
     return avg_window, median_window, anomaly_window
 
 
-def create_averaged_prototypes_mask(anomaly: int, anomaly_data: dict, padding: int = 4) -> tuple[list, list, list]:
+def _anomaly_window(series: np.ndarray, low_bound: int, w_length: int) -> list:
+    """Cuts the padded anomaly window out of the series.
+
+    Args:
+        series: The values of the sensor.
+        low_bound: The index of the first value of the window (may be negative).
+        w_length: The length of the window.
+
+    Returns:
+        The values of the window, with None for the part outside the series.
+    """
+    anomaly_window = [None] * abs(low_bound) if low_bound < 0 else []
+    anomaly_window.extend(series[max(low_bound, 0):min(low_bound + w_length, len(series))].tolist())
+    if low_bound + w_length > len(series):
+        anomaly_window.extend([None] * (low_bound + w_length - len(series)))
+    return anomaly_window
+
+
+def create_averaged_prototypes_mask(anomaly: int, anomaly_data: dict, padding: int = 4,
+                                    context: "ctx.ExplanationContext | None" = None) -> tuple[list, list, list]:
     """Creates averaged prototypes for the specified anomaly.
 
-    A mask with similar timeframes (based on the day and time) is applied to the dataframe
-    and the remaining values are averaged to create an explanatory example for expected behavior
+    Similar timeframes (based on the day and time) are looked up in the minute-of-week index of the dataframe
+    and averaged to create an explanatory example for expected behavior.
+    Timeframes that wrap around the end of a week or a year are supported. Only timeframes that lie completely within
+    the data are averaged, partial timeframes at the start and the end of the data are left out.
 
     Args:
         anomaly: The ID of the anomaly.
         anomaly_data: The output of the anomaly detection.
-        padding (default=4): The timedelta (in 'h') to be used as padding for extending the returned timeframe. 
+        padding (default=4): The timedelta (in 'h') to be used as padding for extending the returned timeframe.
+        context: The shared context of the anomaly detection output (optional).
 
     Returns:
         Two averaged prototypes (mean and median) and the anomaly with the same timeframe.
     """
-    sensors = anomaly_data["sensors"]
     anomaly_timestamp = np.datetime64(anomaly_data["timestamps"][anomaly_data["anomalies"][anomaly]["index"]])
     anomaly_span = anomaly_data["anomalies"][anomaly]["length"]
-    
-    df = pd.DataFrame(anomaly_data["dataframe"])
-    df.index = pd.to_datetime(df.index.values)
+
+    context = ctx.fetch_context(anomaly_data, context)
+    timestamps = context.dataframe.index.values
 
     # calculate the timedelta between two tuples and multiply by anomaly-length to get timeframe of anomaly
-    time_diff = df.iloc[:2].index.to_series().diff().astype('timedelta64[m]')[-1]
-    anomaly_length = ((anomaly_span-1)*time_diff).astype('timedelta64[m]')
+    time_diff = timestamps[1] - timestamps[0]
+    anomaly_length = (anomaly_span - 1) * time_diff
     time_padding = np.timedelta64(padding, 'h')
+    len_frame = 2 * padding * context.frequency + anomaly_span
 
-    sensor = fetch_sensor(anomaly, anomaly_data)
-    selected_sensor = sensors[sensor]
-    
-    time_start = (anomaly_timestamp - time_padding).astype(object)
-    weekday_start = time_start.weekday()
-    time_start_minutes = (time_start.hour+(weekday_start*24))*60+time_start.minute
-    time_end = (anomaly_timestamp + anomaly_length + time_padding).astype(object)
-    weekday_end = time_end.weekday()
-    time_end_minutes = (time_end.hour+(weekday_end*24))*60+time_end.minute
-    
-    # mask data with the same weekday(s) in the same period of time +- timedelta
-    a = df.loc[
-        ((weekday_end >= weekday_start) &
-            ((df.index.weekday >= weekday_start) & 
-             (df.index.weekday <= weekday_end) &
-             (((df.index.hour+(df.index.weekday*24))*60+df.index.minute >= time_start_minutes) &
-              ((df.index.hour+(df.index.weekday*24))*60+df.index.minute <= time_end_minutes))))
-        |
-        ((time_start.isocalendar().week < time_end.isocalendar().week) &  # TODO: year can also be different
-            (((df.index.weekday >= weekday_start) &
-             ((df.index.hour+(df.index.weekday*24))*60+df.index.minute >= time_start_minutes))
-            |
-            (((df.index.weekday <= weekday_end) &
-             ((df.index.hour+(df.index.weekday*24))*60+df.index.minute <= time_end_minutes))))),
-        [selected_sensor]
-    ]
-    
-    np_a = a.to_numpy()
-    len_frame = 2 * padding * (np.timedelta64(1, 'h') // time_diff.astype('timedelta64[m]')) + anomaly_span
-    np_a = np.swapaxes(np.reshape(np_a, (len(np_a) // len_frame, len_frame)), 0, 1)
-    
-    a = [np.average(e) for e in np_a]
-    b = [np.median(e) for e in np_a]
-    c = df.loc[((anomaly_timestamp - time_padding) <= df.index) & (df.index <= (anomaly_timestamp + anomaly_length + time_padding)), [selected_sensor]]
-
-    return a, b, [e for e in c[selected_sensor]]
+    series = context.series(context.sensor(anomaly))
 
+    with metrics.stage("windows"):
+        # look up all timeframes that start at the same minute of the week as the padded anomaly
+        time_start = pd.Timestamp(anomaly_timestamp - time_padding)
+        time_start_minutes = (time_start.hour + (time_start.weekday() * 24)) * 60 + time_start.minute
+        minutes, positions = context.minute_of_week_index
+        starts = positions[np.searchsorted(minutes, time_start_minutes, "left"):
+                           np.searchsorted(minutes, time_start_minutes, "right")]
+        starts = starts[starts + len_frame <= len(series)]
+        if len(starts) == 0:
+            raise ValueError("Not enough data for averaged prototypes")
+        windows = sliding_window_view(series, len_frame)[starts]
+
+        a = np.mean(windows, axis=0).tolist()
+        b = np.median(windows, axis=0).tolist()
+        c = series[np.searchsorted(timestamps, anomaly_timestamp - time_padding, "left"):
+                   np.searchsorted(timestamps, anomaly_timestamp + anomaly_length + time_padding, "right")]
+
+    return a, b, c.tolist()
 
-def fetch_sensor(anomaly, anomaly_data) -> int:
-    """Determines the sensor for the prototype creation.
 
-    If no values for the feature attribution are present the first sensor will be returned.
+def create_nearest_prototypes(anomaly: int, anomaly_data: dict, padding: int = 4,
+                              context: "ctx.ExplanationContext | None" = None) -> tuple[list, list, list]:
+    """Creates prototypes from the historical windows that are most similar to the neighbourhood of the anomaly.
+
+    Unlike the other methods, the windows are not taken at fixed weekly offsets, so shifted schedules and holidays are
+    matched as well. The similarity is the z-normalized euclidean distance, calculated for all windows at once with
+    the FFT (MASS). Windows that overlap the anomaly or an already selected window are excluded.
+    If the padded timeframe crosses the start or the end of the data, only its part within the data is matched and the
+    prototypes are aligned with the anomaly window, so their values also belong to the same positions.
 
     Args:
         anomaly: The ID of the anomaly (starting at 0).
         anomaly_data: The output of the anomaly detection.
+        padding: The timedelta (in "h") to be used as padding for extending the resulting timeframe on both sides.
+        context: The shared context of the anomaly detection output (optional).
 
     Returns:
-        The sensor responsible for the anomaly or the first if no feature attribution data is present.
+        The two most similar windows and the anomaly with the same timeframe.
+    """
+    context = ctx.fetch_context(anomaly_data, context)
+    series = np.asarray(context.series(context.sensor(anomaly)), dtype=float)
+    padding *= context.frequency
+    anomaly_index = anomaly_data["anomalies"][anomaly]["index"]
+    anomaly_length = anomaly_data["anomalies"][anomaly]["length"]
+    anomaly_low_bound = anomaly_index - padding
+    w_length = 2 * padding + anomaly_length
+
+    with metrics.stage("windows"):
+        start = max(anomaly_low_bound, 0)
+        end = min(anomaly_low_bound + w_length, len(series))
+        starts = find_nearest_windows(series, start, end - start, 2,
+                                      (anomaly_index, anomaly_index + anomaly_length))
+        # a match of the clipped query starts at the same offset into its timeframe as the query
+        a, b = (_anomaly_window(series, i - (start - anomaly_low_bound), w_length) for i in starts)
+        c = _anomaly_window(series, anomaly_low_bound, w_length)
+    return a, b, c
+
+
+def find_nearest_windows(series: np.ndarray, start: int, length: int, k: int,
+                         excluded: tuple[int, int] | None = None) -> list[int]:
+    """Finds the windows of the series that are most similar to the window at the start index.
+
+    Args:
+        series: The values of a sensor.
+        start: The index of the first value of the query window.
+        length: The length of the windows.
+        k: The number of windows.
+        excluded: A range [begin, end) of the series that the windows must not overlap (defaults to the query window).
+
+    Returns:
+        The start indices of the k most similar windows that overlap neither each other nor the excluded range,
+        ordered by their distance.
+
+    Raises:
+        ValueError: The series does not contain enough windows.
+    """
+    distances = calculate_distance_profile(series, series[start:start + length])
+    begin, end = excluded if excluded is not None else (start, start + length)
+    distances[max(begin - length + 1, 0):max(end, 0)] = np.inf
+    starts = []
+    for _ in range(k):
+        i = int(np.argmin(distances))
+        if not np.isfinite(distances[i]):
+            raise ValueError("Not enough data for nearest prototypes")
+        starts.append(i)
+        distances[max(i - length + 1, 0):i + length] = np.inf
+    return starts
+
+
+def calculate_distance_profile(series: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """Calculates the z-normalized euclidean distance between the query and each window of the series (MASS).
+
+    The sliding dot products of all windows are calculated with a single FFT convolution and the means and standard
+    deviations of all windows with running updates, so the calculation takes O(n log n) instead of O(n * m).
+    The distance does not change if the series or the query are shifted, so both are centered first. Otherwise, the
+    dot products and the deviations of values far from zero (e.g. cumulative meter readings) lose their precision.
+
+    Args:
+        series: The values of a sensor (n).
+        query: The query window (m).
+
+    Returns:
+        The distance of each window (n - m + 1),
+        infinite for windows or queries without variance or with missing values.
+    """
+    n, m = len(series), len(query)
+    if m < 2 or n < m:
+        raise ValueError("Not enough data for nearest prototypes")
+    finite = np.isfinite(series)
+    missing = np.concatenate(([0], np.cumsum(~finite)))
+    # the running deviations of constant windows are not exactly zero, so these windows are found by their value changes
+    changes = np.concatenate(([0], np.cumsum(series[1:] != series[:-1])))
+    series = np.where(finite, series - (series[finite].mean() if finite.any() else 0.0), 0.0)
+    query = query - query.mean()
+    size = 1 << (n + m - 1).bit_length()
+    dot_products = np.fft.irfft(np.fft.rfft(series, size) * np.fft.rfft(query[::-1], size), size)[m - 1:n]
+    # the mean and the squared deviations of each window are updated from the previous window (like Welford's method),
+    # so their rounding errors do not grow with the magnitude of the values
+    differences = series[m:] - series[:-m]
+    means = np.concatenate(([0.0], np.cumsum(differences))) / m + series[:m].mean()
+    squares = ((series[:m] - means[0]) ** 2).sum() + np.concatenate(
+        ([0.0], np.cumsum(differences * (series[m:] - means[1:] + series[:-m] - means[:-1]))))
+    deviations = np.sqrt(np.maximum(squares / m, 0.0))
+    query_deviation = query.std()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # the dot products with the centered query do not depend on the means of the windows
+        correlations = dot_products / (m * deviations * query_deviation)
+        distances = np.sqrt(np.maximum(2 * m * (1 - correlations), 0.0))
+    distances[~np.isfinite(distances) | (changes[m - 1:] == changes[:n - m + 1]) | (np.ptp(query) == 0)
+              | (missing[m:] - missing[:-m] > 0)] = np.inf
+    return distances
+
+
+def fetch_minute_of_week_index(anomaly_data: dict, df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the minute-of-week index of the dataframe.
+
+    Uses the index that was precomputed for a registered dataset if present.
+
+    Args:
+        anomaly_data: The output of the anomaly detection.
+        df: The dataframe of the anomaly detection output.
+
+    Returns:
+        The sorted minutes of the week of all timestamps and the positions of the timestamps in that order.
+    """
+    if "minute-of-week-index" in anomaly_data:
+        return anomaly_data["minute-of-week-index"]
+    return calculate_minute_of_week_index(df.index)
+
+
+def calculate_minute_of_week_index(index: pd.DatetimeIndex) -> tuple[np.ndarray, np.ndarray]:
+    """Calculates the minute-of-week index of the timestamps.
+
+    The positions of all timestamps with the same minute of the week can be found with a range lookup
+    (np.searchsorted) in the sorted minutes and are in ascending order.
+
+    Args:
+        index: The timestamps of the dataframe.
+
+    Returns:
+        The sorted minutes of the week of all timestamps and the positions of the timestamps in that order.
+    """
+    minutes = ((index.weekday * 24 + index.hour) * 60 + index.minute).to_numpy()
+    positions = np.argsort(minutes, kind="stable")
+    return minutes[positions], positions
+
+
+def fetch_sensor(anomaly, anomaly_data) -> int:
+    """Determines the sensor responsible for the anomaly (see ExplanationContext.sensor)."""
+    return ctx.ExplanationContext(anomaly_data).sensor(anomaly)
+
+
+def fetch_frequency(df: pd.DataFrame) -> int:
+    """Determines the time resolution of the data.
+
+    The methods that take their windows at fixed offsets (averaged, mask and nearest) require evenly spaced timestamps,
+    so they are checked here.
+
+    Args:
+        df: The dataframe of the anomaly detection output.
+
+    Returns:
+        The number of values per hour.
+
+    Raises:
+        ValueError: The timestamps of the dataframe are not evenly spaced.
     """
-    if anomaly_data["deep-error"]:
-        feature_attribution = ft.calculate_averaged_feature_attribution(anomaly, anomaly_data)
-        return feature_attribution.index(max(feature_attribution))
-    else:
-        return 0
+    steps = np.diff(df.index.values)
+    if len(steps) > 1 and (steps != steps[0]).any():
+        raise ValueError("Timestamps of the dataframe must be evenly spaced")
+    return np.timedelta64(1, "h") // (np.datetime64(df.index[1]) - np.datetime64(df.index[0]))
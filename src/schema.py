@@ -1,10 +1,19 @@
 """Contains the top level description of the service for OpenAPI"""
+import os
+import sys
+
+import orjson
 from fastapi.openapi.utils import get_openapi
 
+SCHEMA_FILE = os.environ.get("EXPLAINABILITY_OPENAPI_FILE")
+
 
 def custom_openapi(app):
     """Defines the top level description of the service for OpenAPI.
 
+    The schema is generated on first use, or read from the file generated at build time (see write_openapi)
+    if EXPLAINABILITY_OPENAPI_FILE is set and the file exists.
+
     Args:
         app: The current FastAPI instance.
 
@@ -15,6 +24,26 @@ def custom_openapi(app):
     if app.openapi_schema:
         return app.openapi_schema
 
+    # schema generated at build time
+    if SCHEMA_FILE and os.path.isfile(SCHEMA_FILE):
+        with open(SCHEMA_FILE, "rb") as file:
+            app.openapi_schema = orjson.loads(file.read())
+        return app.openapi_schema
+
+    # cache
+    app.openapi_schema = build_openapi(app)
+    return app.openapi_schema
+
+
+def build_openapi(app) -> dict:
+    """Generates the OpenAPI schema with the top level description of the service.
+
+    Args:
+        app: The current FastAPI instance.
+
+    Returns:
+        The OpenAPI schema.
+    """
     # top-level api schema
     openapi_schema = get_openapi(
         title="Explainability API",
@@ -25,7 +54,22 @@ def custom_openapi(app):
     openapi_schema["info"]["x-logo"] = {
         "url": "https://user-images.githubusercontent.com/61744142/188621988-a3d82a34-c2b3-4084-bae9-6b35fdf8ba9b.png"
     }
+    return openapi_schema
 
-    # cache
-    app.openapi_schema = openapi_schema
-    return app.openapi_schema
+
+def write_openapi(app, path: str):
+    """Generates the OpenAPI schema and writes it to a file, so it does not have to be generated at runtime.
+
+    Args:
+        app: The current FastAPI instance.
+        path: The path of the JSON file.
+    """
+    with open(path, "wb") as file:
+        file.write(orjson.dumps(build_openapi(app)))
+
+
+if __name__ == "__main__":
+    # python -m src.schema <path> (from the repository root, e.g. during the image build)
+    import main
+
+    write_openapi(main.app, sys.argv[1])
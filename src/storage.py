@@ -0,0 +1,280 @@
+"""Contains the memory-mapped on-disk store for registered outputs of the anomaly detection"""
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+import orjson
+
+from . import datasets
+from . import ingestion
+
+_KEY = re.compile(r"[0-9a-f]{64}")
+
+
+class EvenTimestamps:
+    """The evenly spaced timestamps of a stored dataset, calculated on access instead of being kept in memory."""
+
+    def __init__(self, start: np.datetime64, step: np.timedelta64, length: int):
+        """Initializes the timestamps.
+
+        Args:
+            start: The first timestamp.
+            step: The time between two timestamps.
+            length: The number of timestamps.
+        """
+        self.start = start
+        self.step = step
+        self.length = length
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, index: int) -> np.datetime64:
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("Timestamp index out of range")
+        return self.start + index * self.step
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        return self.start + np.arange(self.length) * self.step
+
+
+class StoredAnomalyData(dict):
+    """The output of the anomaly detection backed by the memory-mapped files of a stored dataset.
+
+    Contains the same entries as a parsed output of the anomaly detection, except that the values of each sensor are
+    available as "series" instead of a dataframe. Is pickled as reference to its files, so it can be passed to worker
+    processes without copying the data.
+    """
+
+    def __init__(self, directory: str, key: str):
+        """Opens the files of a stored dataset.
+
+        Args:
+            directory: The directory of the store.
+            key: The content hash of the dataset.
+        """
+        self.directory = directory
+        self.key = key
+        path = os.path.join(directory, key)
+        with open(os.path.join(path, "meta.json"), "rb") as file:
+            meta = orjson.loads(file.read())
+        sensors, length, rows = meta["sensors"], meta["length"], meta["deep-error-sensors"]
+        super().__init__({
+            "sensors": sensors,
+            "algo": meta["algo"],
+            "anomalies": meta["anomalies"],
+            "timestamps": EvenTimestamps(np.datetime64(meta["start"], "ns"), np.timedelta64(meta["step"], "ns"),
+                                         length),
+            "series": [_open(path, f"sensor-{i}.f8", (length,)) for i in range(len(sensors))],
+            "deep-error": _open(path, "deep-error.f8", (rows, length)),
+            "deep-error-prefix-sums": _open(path, "deep-error-prefix-sums.f8", (rows, length + 1)),
+            "error": _open(path, "error.f8", (length,))
+        })
+
+    def __reduce__(self):
+        return StoredAnomalyData, (self.directory, self.key)
+
+
+class HistoryStore:
+    """A store that keeps registered outputs of the anomaly detection as memory-mapped files on disk.
+
+    Each dataset is stored in a directory named by its content hash with one fixed-stride float64 file per sensor,
+    the deep error (sensors x timestamps), its prefix sums, the error and a small metadata index (meta.json).
+    Only the pages of the files that are read by a calculation are loaded into memory.
+    The size of the store on disk is limited: after each registration, the least recently used datasets (by the
+    modification time of their directory, which is updated on each access) are deleted until the budget is met.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        """Initializes the store and creates its directory if necessary.
+
+        Args:
+            directory: The directory of the store.
+            max_bytes: The maximum size of the stored datasets on disk in bytes.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def put(self, anomaly_data: dict) -> str:
+        """Writes the output of the anomaly detection to the store.
+
+        Args:
+            anomaly_data: The output of the anomaly detection.
+
+        Returns:
+            The content hash that identifies the stored output.
+
+        Raises:
+            ValueError: The timestamps of the dataframe are not evenly spaced or do not match the timestamps,
+                the deep error or the error.
+            DatasetTooLarge: The stored output exceeds the size of the store.
+        """
+        key = datasets.content_hash(anomaly_data)
+        path = os.path.join(self.directory, key)
+        if _touch(path):
+            return key
+        df = ingestion.load_dataframe(anomaly_data)
+        index = df.index.values.astype("datetime64[ns]")
+        steps = np.diff(index)
+        if len(index) < 2 or (steps != steps[0]).any():
+            raise ValueError("Timestamps of the dataframe must be evenly spaced")
+        sensors = anomaly_data["sensors"]
+        # the stored timestamps are derived from the dataframe, so they have to be the same as the sent ones
+        timestamps = np.asarray(anomaly_data["timestamps"], dtype="datetime64[ns]")
+        if timestamps.shape != index.shape or (timestamps != index).any():
+            raise ValueError("Timestamps must match the timestamps of the dataframe")
+        deep_error = np.asarray(anomaly_data["deep-error"], dtype=float)
+        if deep_error.size == 0:
+            # outputs without feature attribution data have no deep error
+            deep_error = deep_error.reshape(0, len(index))
+        elif deep_error.shape != (len(sensors), len(index)):
+            raise ValueError(f"Deep error must have the shape {len(sensors)} x {len(index)} (sensors x timestamps)")
+        error = np.asarray(anomaly_data["error"], dtype=float)
+        if error.shape != index.shape:
+            raise ValueError(f"Error must have {len(index)} values (one per timestamp)")
+        temporary = tempfile.mkdtemp(dir=self.directory)
+        try:
+            for i, sensor in enumerate(sensors):
+                df[sensor].to_numpy(dtype=float).tofile(os.path.join(temporary, f"sensor-{i}.f8"))
+            deep_error.tofile(os.path.join(temporary, "deep-error.f8"))
+            with open(os.path.join(temporary, "deep-error-prefix-sums.f8"), "wb") as file:
+                for row in deep_error:
+                    np.concatenate(([0.0], np.cumsum(row))).tofile(file)
+            error.tofile(os.path.join(temporary, "error.f8"))
+            with open(os.path.join(temporary, "meta.json"), "wb") as file:
+                file.write(orjson.dumps({
+                    "sensors": sensors, "algo": anomaly_data.get("algo"), "anomalies": anomaly_data["anomalies"],
+                    "start": int(index[0].astype(np.int64)), "step": int(steps[0].astype(np.int64)),
+                    "length": len(index), "deep-error-sensors": len(deep_error)
+                }))
+            if _size(temporary) > self.max_bytes:
+                raise datasets.DatasetTooLarge("Dataset exceeds the size of the store")
+            os.rename(temporary, path)
+        except OSError:
+            shutil.rmtree(temporary, ignore_errors=True)
+            if not os.path.isdir(path):
+                raise
+        except datasets.DatasetTooLarge:
+            shutil.rmtree(temporary, ignore_errors=True)
+            raise
+        self._evict(key)
+        return key
+
+    def get(self, key: str) -> StoredAnomalyData | None:
+        """Opens the stored output of the anomaly detection for the specified content hash.
+
+        Args:
+            key: The content hash returned during the registration.
+
+        Returns:
+            The memory-mapped output of the anomaly detection or None if it is not stored.
+        """
+        if not _KEY.fullmatch(key) or not _touch(os.path.join(self.directory, key)):
+            return None
+        try:
+            return StoredAnomalyData(self.directory, key)
+        except FileNotFoundError:
+            # evicted in the meantime
+            return None
+
+    def stats(self) -> dict:
+        """Returns the number of stored datasets, their size on disk and the eviction counter.
+
+        Returns:
+            A dict with the number of entries, the used and available bytes, and the eviction counter.
+        """
+        entries = self._entries()
+        return {"entries": len(entries), "bytes": sum(size for _, _, size in entries), "max_bytes": self.max_bytes,
+                "evictions": self.evictions}
+
+    def _entries(self) -> list[tuple[float, str, int]]:
+        """Lists the stored datasets.
+
+        Returns:
+            The last access time, the path and the size in bytes of each stored dataset.
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if _KEY.fullmatch(entry.name):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path, _size(entry.path)))
+                except FileNotFoundError:
+                    pass
+        return entries
+
+    def _evict(self, key: str):
+        """Deletes the least recently used datasets until the store fits into its budget.
+
+        Args:
+            key: The content hash of the dataset that was just stored and is kept.
+        """
+        with self._lock:
+            entries = sorted(self._entries())
+            size = sum(size for _, _, size in entries)
+            for _, path, entry_size in entries:
+                if size <= self.max_bytes:
+                    break
+                if os.path.basename(path) == key:
+                    continue
+                # open memory maps of the deleted files stay valid until they are closed
+                shutil.rmtree(path, ignore_errors=True)
+                size -= entry_size
+                self.evictions += 1
+
+
+def _touch(path: str) -> bool:
+    """Marks a stored dataset as recently used.
+
+    Args:
+        path: The directory of the dataset.
+
+    Returns:
+        Whether the dataset is stored.
+    """
+    try:
+        os.utime(path)
+        return os.path.isdir(path)
+    except FileNotFoundError:
+        return False
+
+
+def _size(path: str) -> int:
+    """Determines the size of a stored dataset on disk.
+
+    Args:
+        path: The directory of the dataset.
+
+    Returns:
+        The size of its files in bytes.
+    """
+    return sum(file.stat().st_size for file in os.scandir(path))
+
+
+def _open(path: str, name: str, shape: tuple) -> np.ndarray:
+    """Opens a stored array as read-only memory map.
+
+    Args:
+        path: The directory of the dataset.
+        name: The file name of the array.
+        shape: The shape of the array.
+
+    Returns:
+        The memory-mapped array (or an empty array, which can not be mapped).
+    """
+    if 0 in shape:
+        return np.empty(shape)
+    return np.memmap(os.path.join(path, name), dtype=np.float64, mode="r", shape=shape)
+
+
+store = HistoryStore(
+    os.environ["EXPLAINABILITY_STORAGE_DIR"],
+    max_bytes=int(os.environ.get("EXPLAINABILITY_STORAGE_BYTES", 16 * 1024 * 1024 * 1024))
+) if os.environ.get("EXPLAINABILITY_STORAGE_DIR") else None
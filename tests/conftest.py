@@ -0,0 +1,18 @@
+"""Configures the service for the tests before main is imported"""
+import os
+
+import pytest
+
+# the explanations run in threads of the test process, so the tests do not depend on the start of worker processes
+os.environ.setdefault("EXPLAINABILITY_WORKERS", "0")
+
+
+@pytest.fixture(scope="module")
+def client():
+    """Returns a client of the service that is started for the tests of a module."""
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as client:
+        yield client
@@ -0,0 +1,113 @@
+"""Tests the coalescing of concurrent identical explanation requests"""
+import asyncio
+
+import orjson
+import pytest
+
+from benchmarks.payloads import generate_anomaly_data
+from src import coalescing
+
+
+class Calculation:
+    """Counts its calls and returns once it is released."""
+
+    def __init__(self, result=None, error: Exception | None = None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self.released = None
+
+    async def __call__(self):
+        self.calls += 1
+        await self.released.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+async def run_concurrently(single_flight: coalescing.SingleFlight, calculation: Calculation, keys: list) -> list:
+    calculation.released = asyncio.Event()
+    tasks = [asyncio.ensure_future(single_flight.run(key, calculation)) for key in keys]
+    await asyncio.sleep(0)
+    calculation.released.set()
+    return await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def test_concurrent_identical_requests_share_one_calculation():
+    single_flight = coalescing.SingleFlight(ttl=60, max_entries=8)
+    calculation = Calculation(result={"value": 1})
+    results = asyncio.run(run_concurrently(single_flight, calculation, ["a"] * 6))
+    assert calculation.calls == 1
+    assert all(result is results[0] for result in results)
+    stats = single_flight.stats()
+    assert {k: stats[k] for k in ("requests", "calculations", "coalesced", "cache_hits", "running")} == {
+        "requests": 6, "calculations": 1, "coalesced": 5, "cache_hits": 0, "running": 0}
+
+
+def test_different_keys_are_calculated_separately():
+    single_flight = coalescing.SingleFlight(ttl=60, max_entries=8)
+    calculation = Calculation(result=1)
+    asyncio.run(run_concurrently(single_flight, calculation, ["a", "b", "a", ("c", 1)]))
+    assert calculation.calls == 3
+
+
+def test_results_are_cached_within_the_ttl(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(coalescing.time, "monotonic", lambda: now[0])
+    single_flight = coalescing.SingleFlight(ttl=10, max_entries=8)
+    calculation = Calculation(result=1)
+    asyncio.run(run_concurrently(single_flight, calculation, ["a"]))
+    asyncio.run(run_concurrently(single_flight, calculation, ["a"]))
+    assert calculation.calls == 1
+    assert single_flight.stats()["cache_hits"] == 1
+    now[0] = 11.0
+    asyncio.run(run_concurrently(single_flight, calculation, ["a"]))
+    assert calculation.calls == 2
+
+
+def test_the_cache_is_bounded():
+    single_flight = coalescing.SingleFlight(ttl=60, max_entries=2)
+    calculation = Calculation(result=1)
+    for key in ("a", "b", "c"):
+        asyncio.run(run_concurrently(single_flight, calculation, [key]))
+    assert single_flight.stats()["cached"] == 2
+    asyncio.run(run_concurrently(single_flight, calculation, ["a"]))
+    assert calculation.calls == 4
+
+
+def test_errors_are_shared_but_not_cached():
+    single_flight = coalescing.SingleFlight(ttl=60, max_entries=8)
+    calculation = Calculation(error=ValueError("failed"))
+    results = asyncio.run(run_concurrently(single_flight, calculation, ["a"] * 3))
+    assert calculation.calls == 1
+    assert all(isinstance(result, ValueError) for result in results)
+    asyncio.run(run_concurrently(single_flight, calculation, ["a"]))
+    assert calculation.calls == 2
+
+
+def test_a_cancelled_request_does_not_cancel_the_calculation():
+    single_flight = coalescing.SingleFlight(ttl=60, max_entries=8)
+    calculation = Calculation(result=1)
+
+    async def scenario():
+        calculation.released = asyncio.Event()
+        first = asyncio.ensure_future(single_flight.run("a", calculation))
+        second = asyncio.ensure_future(single_flight.run("a", calculation))
+        await asyncio.sleep(0)
+        first.cancel()
+        calculation.released.set()
+        return await second
+
+    assert asyncio.run(scenario()) == 1
+    assert calculation.calls == 1
+
+
+@pytest.mark.parametrize("url", ["/feature-attribution?anomaly=1", "/prototypes?anomaly=1"])
+def test_identical_requests_are_answered_from_the_cache(client, url: str):
+    body = orjson.dumps({"payload": generate_anomaly_data(sensors=2, weeks=3, anomalies=1, seed=9)})
+    before = coalescing.single_flight.stats()
+    responses = [client.post(url, content=body, headers={"Content-Type": "application/json"}) for _ in range(3)]
+    after = coalescing.single_flight.stats()
+    assert all(response.json() == responses[0].json() for response in responses)
+    assert after["calculations"] - before["calculations"] == 1
+    assert after["cache_hits"] - before["cache_hits"] == 2
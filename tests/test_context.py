@@ -0,0 +1,75 @@
+"""Tests that the intermediate results of the explanations are derived lazily and only once"""
+import pytest
+
+import main
+from benchmarks.payloads import generate_anomaly_data
+from src import datasets, explanations, prototypes
+from src import feature_attribution as ft
+from src.context import ExplanationContext
+
+
+class Counter:
+    """Counts the calls of a wrapped function."""
+
+    def __init__(self, function):
+        self.function = function
+        self.calls = 0
+
+    def __call__(self, *args):
+        self.calls += 1
+        return self.function(*args)
+
+
+@pytest.fixture
+def counters(monkeypatch) -> dict[str, Counter]:
+    counters = {"prefix_sums": Counter(ft.calculate_prefix_sums),
+                "minute_of_week_index": Counter(prototypes.calculate_minute_of_week_index)}
+    monkeypatch.setattr(ft, "calculate_prefix_sums", counters["prefix_sums"])
+    monkeypatch.setattr(prototypes, "calculate_minute_of_week_index", counters["minute_of_week_index"])
+    return counters
+
+
+@pytest.fixture(scope="module")
+def anomaly_data() -> dict:
+    return generate_anomaly_data(sensors=3, weeks=3, anomalies=3, seed=6)
+
+
+def calls(counters: dict[str, Counter]) -> dict[str, int]:
+    return {name: counter.calls for name, counter in counters.items()}
+
+
+def test_parsing_does_not_derive_intermediate_results(anomaly_data: dict, counters: dict[str, Counter]):
+    args = main.parse_payload((0, anomaly_data, "median"))
+    assert "deep-error-prefix-sums" not in args[1]
+    assert "minute-of-week-index" not in args[1]
+    explanations.explain_attribution(*args)
+    assert calls(counters) == {"prefix_sums": 0, "minute_of_week_index": 0}
+
+
+@pytest.mark.parametrize("method, expected", [
+    ("local", {"prefix_sums": 1, "minute_of_week_index": 0}),
+    ("mask", {"prefix_sums": 1, "minute_of_week_index": 1}),
+    ("averaged", {"prefix_sums": 1, "minute_of_week_index": 0})
+])
+def test_prototypes_derive_only_the_used_results(anomaly_data: dict, counters: dict[str, Counter], method: str,
+                                                 expected: dict[str, int]):
+    explanations.explain_prototypes(*main.parse_payload((1, anomaly_data, method)))
+    assert calls(counters) == expected
+
+
+def test_intermediate_results_are_shared_by_all_anomalies(anomaly_data: dict, counters: dict[str, Counter]):
+    parsed = datasets.parse_anomaly_data(anomaly_data)
+    context = ExplanationContext(parsed)
+    for anomaly in range(3):
+        prototypes.create_averaged_prototypes_mask(anomaly, parsed, context=context)
+    explanations.explain_anomalies([0, 1, 2], parsed)
+    assert calls(counters) == {"prefix_sums": 2, "minute_of_week_index": 1}
+
+
+def test_registered_datasets_are_derived_once(anomaly_data: dict, counters: dict[str, Counter]):
+    cache = datasets.DatasetCache(max_bytes=1 << 30, ttl=60)
+    parsed = cache.get(cache.put(anomaly_data))
+    for method in ("averaged", "mask"):
+        for anomaly in range(3):
+            explanations.explain_prototypes(anomaly, parsed, method)
+    assert calls(counters) == {"prefix_sums": 1, "minute_of_week_index": 1}
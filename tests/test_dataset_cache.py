@@ -0,0 +1,94 @@
+"""Tests the LRU, TTL and memory budget of the dataset cache"""
+import pickle
+
+import numpy as np
+import pytest
+
+from benchmarks.payloads import generate_anomaly_data
+from src import datasets
+
+
+class Clock:
+    """A manually advanced replacement of the time module."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(datasets, "time", clock)
+    return clock
+
+
+@pytest.fixture(scope="module")
+def payloads() -> list[dict]:
+    return [generate_anomaly_data(sensors=1, weeks=2, anomalies=1, seed=seed) for seed in range(4)]
+
+
+@pytest.fixture(scope="module")
+def size(payloads: list[dict]) -> int:
+    return max(datasets.estimate_size(datasets.precompute_anomaly_data(datasets.parse_anomaly_data(payload)))
+               for payload in payloads)
+
+
+def test_registration_is_idempotent(payloads: list[dict], size: int, clock: Clock):
+    cache = datasets.DatasetCache(max_bytes=10 * size, ttl=60)
+    key = cache.put(payloads[0])
+    assert cache.put(payloads[0]) == key
+    assert len(key) == 64
+    assert cache.stats()["entries"] == 1
+    assert cache.get(key)["sensors"] == payloads[0]["sensors"]
+    assert cache.get("0" * 64) is None
+    assert {k: cache.stats()[k] for k in ("hits", "misses")} == {"hits": 1, "misses": 1}
+
+
+def test_least_recently_used_entries_are_evicted(payloads: list[dict], size: int, clock: Clock):
+    cache = datasets.DatasetCache(max_bytes=int(2.5 * size), ttl=60)
+    a, b = cache.put(payloads[0]), cache.put(payloads[1])
+    assert cache.get(a) is not None
+    c = cache.put(payloads[2])
+    assert cache.get(b) is None
+    assert cache.get(a) is not None
+    assert cache.get(c) is not None
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["evictions"] == 1
+    assert stats["bytes"] <= stats["max_bytes"]
+
+
+def test_unused_entries_expire_after_the_ttl(payloads: list[dict], size: int, clock: Clock):
+    cache = datasets.DatasetCache(max_bytes=10 * size, ttl=60)
+    a, b = cache.put(payloads[0]), cache.put(payloads[1])
+    clock.now = 50.0
+    assert cache.get(a) is not None
+    clock.now = 100.0
+    assert cache.get(a) is not None
+    assert cache.get(b) is None
+    stats = cache.stats()
+    assert stats["entries"] == 1
+    assert stats["expirations"] == 1
+    clock.now = 200.0
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["bytes"] == 0
+
+
+def test_datasets_larger_than_the_budget_are_rejected(payloads: list[dict], size: int, clock: Clock):
+    cache = datasets.DatasetCache(max_bytes=size // 2, ttl=60)
+    with pytest.raises(datasets.DatasetTooLarge):
+        cache.put(payloads[0])
+    assert cache.stats()["entries"] == 0
+
+
+def test_shared_entries_are_passed_by_reference(payloads: list[dict], size: int, clock: Clock, tmp_path):
+    cache = datasets.DatasetCache(max_bytes=10 * size, ttl=60, shared_directory=str(tmp_path))
+    entry = cache.get(cache.put(payloads[0]))
+    assert isinstance(entry, datasets.SharedAnomalyData)
+    assert len(pickle.dumps(entry)) < 10_000
+    restored = pickle.loads(pickle.dumps(entry))
+    np.testing.assert_array_equal(restored["dataframe"].to_numpy(), entry["dataframe"].to_numpy())
+    np.testing.assert_array_equal(restored["deep-error"], entry["deep-error"])
@@ -0,0 +1,76 @@
+"""Tests the shape-preserving downsampling of the prototype and anomaly windows"""
+import numpy as np
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+
+from benchmarks.payloads import generate_anomaly_data
+from src import downsampling
+
+
+@pytest.fixture(scope="module")
+def body() -> bytes:
+    return orjson.dumps({"payload": generate_anomaly_data(sensors=3, weeks=4, anomalies=3, seed=2)})
+
+
+@pytest.mark.parametrize("length, max_points", [(10, 3), (100, 7), (1000, 50), (33, 32)])
+def test_positions_keep_the_endpoints_and_the_point_count(length: int, max_points: int):
+    rng = np.random.default_rng(length)
+    positions = downsampling.lttb_positions([rng.normal(size=length).tolist(), rng.normal(size=length).tolist()],
+                                            max_points)
+    assert len(positions) == max_points
+    assert positions[0] == 0
+    assert positions[-1] == length - 1
+    assert (np.diff(positions) > 0).all()
+
+
+def test_short_series_are_not_downsampled():
+    assert downsampling.lttb_positions([[1.0, 2.0, 3.0], [3.0, 2.0, 1.0]], 3).tolist() == [0, 1, 2]
+    assert downsampling.lttb_positions([[1.0, 2.0]], 5).tolist() == [0, 1]
+
+
+def test_positions_keep_the_peak():
+    values = [0.0] * 50
+    values[17] = 10.0
+    assert 17 in downsampling.lttb_positions([values], 5).tolist()
+
+
+def test_missing_values_are_kept():
+    values = [None, None, 1.0, 4.0, 2.0, 8.0, 3.0, 5.0, None]
+    positions = downsampling.lttb_positions([values, list(range(9))], 4)
+    assert downsampling.take(values, positions) == [values[i] for i in positions.tolist()]
+    assert downsampling.take(values, positions)[0] is None
+
+
+def test_series_of_different_lengths_are_rejected():
+    with pytest.raises(ValueError):
+        downsampling.lttb_positions([[1.0, 2.0, 3.0, 4.0], [1.0, 2.0, 3.0]], 3)
+
+
+@pytest.mark.parametrize("url", [
+    "/prototypes?anomaly=1&max_points=20",
+    "/prototypes?anomaly=2&method=nearest&max_points=12",
+    "/prototypes?anomaly=3&top_k=2&max_points=10"
+])
+def test_endpoint_downsamples_to_shared_positions(client: TestClient, body: bytes, url: str):
+    max_points = int(url.rsplit("=", 1)[1])
+    full = client.post(url.rsplit("&", 1)[0], content=body, headers={"Content-Type": "application/json"}).json()
+    response = client.post(url, content=body, headers={"Content-Type": "application/json"})
+    assert response.status_code == 200
+    result = response.json()
+    positions = result["positions"]
+    assert len(positions) == max_points
+    entries = result["prototypes"] if isinstance(result["prototypes"], list) else [result["prototypes"]]
+    full_entries = full["prototypes"] if isinstance(full["prototypes"], list) else [full["prototypes"]]
+    assert positions[0] == 0
+    assert positions[-1] == len(full_entries[0]["anomaly"]) - 1
+    for entry, full_entry in zip(entries, full_entries):
+        for key in ("prototype a", "prototype b", "anomaly"):
+            assert entry[key] == [full_entry[key][i] for i in positions]
+
+
+@pytest.mark.parametrize("method", ["local", "mask"])
+def test_endpoint_rejects_downsampling_of_unaligned_methods(client: TestClient, body: bytes, method: str):
+    response = client.post(f"/prototypes?anomaly=1&method={method}&max_points=10", content=body,
+                           headers={"Content-Type": "application/json"})
+    assert response.status_code == 400
@@ -0,0 +1,104 @@
+"""Tests the backpressure and the timeout of the explanation executor"""
+import asyncio
+import threading
+import time
+
+import orjson
+import pytest
+
+import main
+from benchmarks.payloads import generate_anomaly_data
+from src import metrics
+from src.executor import ExecutorSaturated, ExplanationExecutor
+
+
+def wait(event: threading.Event) -> str:
+    event.wait(5)
+    return "done"
+
+
+def generate_body(seed: int) -> bytes:
+    # a separate payload for each test, so the results are not served by the result cache of the request coalescing
+    return orjson.dumps({"payload": generate_anomaly_data(sensors=2, weeks=2, anomalies=1, seed=seed)})
+
+
+def test_tasks_beyond_the_queue_are_rejected():
+    executor = ExplanationExecutor(workers=0, queue_depth=2, timeout=5, retry_after=3)
+    event = threading.Event()
+
+    async def scenario():
+        tasks = [asyncio.ensure_future(executor.run(wait, event)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        assert executor.pending == 3
+        with pytest.raises(ExecutorSaturated):
+            await executor.run(wait, event)
+        event.set()
+        return await asyncio.gather(*tasks)
+
+    assert asyncio.run(scenario()) == ["done"] * 3
+    assert executor.pending == 0
+
+
+def test_timed_out_tasks_keep_their_slot_until_they_finish():
+    executor = ExplanationExecutor(workers=0, queue_depth=0, timeout=0.05, retry_after=1)
+    event = threading.Event()
+
+    async def scenario():
+        with pytest.raises(asyncio.TimeoutError):
+            await executor.run(wait, event)
+        assert executor.pending == 1
+        with pytest.raises(ExecutorSaturated):
+            await executor.run(wait, event)
+        event.set()
+        for _ in range(100):
+            if executor.pending == 0:
+                break
+            await asyncio.sleep(0.01)
+
+    asyncio.run(scenario())
+    assert executor.pending == 0
+
+
+def test_saturation_returns_503_with_retry_after(client, monkeypatch):
+    monkeypatch.setattr(main.executor, "queue_depth", 0)
+    monkeypatch.setattr(main.executor, "retry_after", 7)
+    monkeypatch.setattr(main.executor, "pending", 1)
+    response = client.post("/feature-attribution?anomaly=1", content=generate_body(11),
+                           headers={"Content-Type": "application/json"})
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "7"
+    assert response.json() == {"detail": "Service is busy"}
+
+
+def test_rejected_tasks_record_no_compute_time(monkeypatch):
+    monkeypatch.setattr(metrics, "enabled", True)
+    monkeypatch.setattr(main.executor, "queue_depth", 0)
+    monkeypatch.setattr(main.executor, "pending", 1)
+
+    async def scenario():
+        timings = {}
+        metrics._timings.set(timings)
+        with pytest.raises(main.HTTPException) as error:
+            await main.run_explanation(wait, threading.Event())
+        assert error.value.status_code == 503
+        return timings
+
+    assert asyncio.run(scenario()) == {}
+
+
+def test_timeout_returns_504(client, monkeypatch):
+    event = threading.Event()
+
+    def slow(*args):
+        event.wait(5)
+        return {}
+
+    monkeypatch.setattr(main.executor, "timeout", 0.05)
+    monkeypatch.setattr(main, "explain_attribution", slow)
+    start = time.perf_counter()
+    response = client.post("/feature-attribution?anomaly=1", content=generate_body(12),
+                           headers={"Content-Type": "application/json"})
+    event.set()
+    assert response.status_code == 504
+    assert response.json() == {"detail": "Explanation timed out"}
+    assert time.perf_counter() - start < 2
@@ -0,0 +1,118 @@
+"""Tests that the vectorized feature attribution matches the original loop implementation"""
+import numpy as np
+import pytest
+
+from benchmarks.payloads import generate_anomaly_data
+from src import datasets
+from src import feature_attribution as ft
+from src.context import ExplanationContext
+
+METHODS = {
+    "averaged": ft.calculate_averaged_feature_attribution,
+    "median": ft.calculate_median_feature_attribution,
+    "basic": ft.calculate_basic_feature_attribution,
+    "very-basic": ft.calculate_very_basic_feature_attribution
+}
+
+
+def loop_very_basic(anomaly: int, anomaly_data: dict) -> list[float]:
+    anomaly_index = anomaly_data["anomalies"][anomaly]["index"]
+    return [anomaly_data["deep-error"][i][anomaly_index] / anomaly_data["error"][anomaly_index] * 100
+            for i in range(len(anomaly_data["sensors"]))]
+
+
+def loop_basic(anomaly: int, anomaly_data: dict) -> list[float]:
+    anomaly_index = anomaly_data["anomalies"][anomaly]["index"] + anomaly_data["anomalies"][anomaly]["length"] // 2
+    return [anomaly_data["deep-error"][i][anomaly_index] / anomaly_data["error"][anomaly_index] * 100
+            for i in range(len(anomaly_data["sensors"]))]
+
+
+def loop_averaged(anomaly: int, anomaly_data: dict) -> list[float]:
+    anomaly_index = anomaly_data["anomalies"][anomaly]["index"]
+    anomaly_length = anomaly_data["anomalies"][anomaly]["length"]
+    results = []
+    for i in range(len(anomaly_data["sensors"])):
+        sensor_percentages = []
+        for j in range(anomaly_index, anomaly_index + anomaly_length):
+            sensor_percentages.append(anomaly_data["deep-error"][i][j])
+        results.append(sum(sensor_percentages) / len(sensor_percentages))
+    return [(e / sum(results)) * 100 for e in results]
+
+
+def loop_median(anomaly: int, anomaly_data: dict) -> list[float]:
+    anomaly_index = anomaly_data["anomalies"][anomaly]["index"]
+    anomaly_length = anomaly_data["anomalies"][anomaly]["length"]
+    results = []
+    for i in range(len(anomaly_data["sensors"])):
+        sensor_percentages = []
+        for j in range(anomaly_index, anomaly_index + anomaly_length):
+            sensor_percentages.append(anomaly_data["deep-error"][i][j])
+        if any(np.isnan(sensor_percentages)):
+            # sorted() has no defined order with NaN values, so the median of an area with a missing value is missing
+            results.append(np.nan)
+            continue
+        results.append(sorted(sensor_percentages)[len(sensor_percentages) // 2])
+    return [(e / sum(results)) * 100 for e in results]
+
+
+LOOPS = {
+    "averaged": loop_averaged,
+    "median": loop_median,
+    "basic": loop_basic,
+    "very-basic": loop_very_basic
+}
+
+
+def generate_payload(seed: int, missing: float) -> dict:
+    """Generates an output of the anomaly detection with anomalies of varying lengths and missing deep errors.
+
+    Args:
+        seed: The seed of the random values.
+        missing: The share of the deep errors that are replaced by NaN.
+
+    Returns:
+        The output of the anomaly detection in the JSON format.
+    """
+    anomaly_data = generate_anomaly_data(sensors=4, weeks=2, anomalies=6, anomaly_length=9, seed=seed)
+    rng = np.random.default_rng(seed)
+    deep_error = np.array(anomaly_data["deep-error"])
+    deep_error[rng.random(deep_error.shape) < missing] = np.nan
+    anomaly_data["deep-error"] = deep_error.tolist()
+    for anomaly in anomaly_data["anomalies"]:
+        anomaly["length"] = int(rng.integers(1, 10))
+    return anomaly_data
+
+
+@pytest.fixture(scope="module", params=[(1, 0.0), (2, 0.0), (3, 0.001), (4, 0.02)],
+                ids=["seed-1", "seed-2", "missing-0.1%", "missing-2%"])
+def anomaly_data(request) -> dict:
+    return generate_payload(*request.param)
+
+
+@pytest.mark.parametrize("method", list(METHODS))
+def test_single_matches_loop(anomaly_data: dict, method: str):
+    parsed = datasets.parse_anomaly_data(anomaly_data)
+    for anomaly in range(len(anomaly_data["anomalies"])):
+        expected = LOOPS[method](anomaly, anomaly_data)
+        np.testing.assert_allclose(METHODS[method](anomaly, parsed), expected, rtol=1e-9, equal_nan=True)
+
+
+@pytest.mark.parametrize("method", list(METHODS))
+def test_batch_matches_loop(anomaly_data: dict, method: str):
+    parsed = datasets.parse_anomaly_data(anomaly_data)
+    anomalies = list(range(len(anomaly_data["anomalies"])))[::-1]
+    expected = [LOOPS[method](anomaly, anomaly_data) for anomaly in anomalies]
+    np.testing.assert_allclose(ft.FEATURE_ATTRIBUTION_BATCHES[method](anomalies, parsed), expected, rtol=1e-9,
+                               equal_nan=True)
+    np.testing.assert_allclose(ExplanationContext(parsed).attributions(anomalies, method), expected, rtol=1e-9,
+                               equal_nan=True)
+
+
+@pytest.mark.parametrize("method", list(METHODS))
+def test_registered_dataset_matches_loop(anomaly_data: dict, method: str):
+    cache = datasets.DatasetCache(max_bytes=1 << 30, ttl=60)
+    parsed = cache.get(cache.put(anomaly_data))
+    anomalies = list(range(len(anomaly_data["anomalies"])))
+    expected = [LOOPS[method](anomaly, anomaly_data) for anomaly in anomalies]
+    np.testing.assert_allclose(ExplanationContext(parsed).attributions(anomalies, method), expected, rtol=1e-9,
+                               equal_nan=True)
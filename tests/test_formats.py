@@ -0,0 +1,175 @@
+"""Tests that the JSON, NPZ and Arrow IPC payloads and responses of the explanation endpoints are equivalent"""
+import io
+import json
+
+import numpy as np
+import orjson
+import pyarrow as pa
+import pytest
+from fastapi.testclient import TestClient
+
+from benchmarks.payloads import generate_anomaly_data
+from src import formats
+
+URLS = [
+    "/prototypes?anomaly=1",
+    "/prototypes?anomaly=2&method=mask",
+    "/prototypes?anomaly=3&method=local",
+    "/prototypes?anomaly=1&method=nearest",
+    "/prototypes?anomaly=2&top_k=2",
+    "/prototypes?anomaly=1&history=last&weeks=2&max_points=12",
+    "/feature-attribution?anomaly=1",
+    "/feature-attribution?anomaly=2&method=median",
+    "/feature-attribution?anomaly=3&method=basic",
+    "/explanations",
+]
+
+
+def encode_npz(anomaly_data: dict) -> bytes:
+    """Encodes the output of the anomaly detection as NPZ archive.
+
+    Args:
+        anomaly_data: The output of the anomaly detection in the JSON format.
+
+    Returns:
+        The NPZ archive.
+    """
+    buffer = io.BytesIO()
+    anomalies = anomaly_data["anomalies"]
+    np.savez(buffer, **{
+        "values": np.array([list(anomaly_data["dataframe"][sensor].values()) for sensor in anomaly_data["sensors"]]),
+        "sensors": np.array(anomaly_data["sensors"]),
+        "timestamps": np.array(anomaly_data["timestamps"], dtype="datetime64[ns]"),
+        "deep-error": np.array(anomaly_data["deep-error"]),
+        "error": np.array(anomaly_data["error"]),
+        "algo": np.array(anomaly_data["algo"]),
+        "anomaly-index": np.array([anomaly["index"] for anomaly in anomalies]),
+        "anomaly-length": np.array([anomaly["length"] for anomaly in anomalies]),
+        "anomaly-timestamp": np.array([anomaly["timestamp"] for anomaly in anomalies]),
+        "anomaly-type": np.array([anomaly["type"] for anomaly in anomalies])
+    })
+    return buffer.getvalue()
+
+
+def encode_arrow(anomaly_data: dict) -> bytes:
+    """Encodes the output of the anomaly detection as Arrow IPC stream.
+
+    Args:
+        anomaly_data: The output of the anomaly detection in the JSON format.
+
+    Returns:
+        The Arrow IPC stream.
+    """
+    columns = {"timestamp": pa.array(np.array(anomaly_data["timestamps"], dtype="datetime64[ns]"))}
+    for sensor in anomaly_data["sensors"]:
+        columns[sensor] = list(anomaly_data["dataframe"][sensor].values())
+    for sensor, deep_error in zip(anomaly_data["sensors"], anomaly_data["deep-error"]):
+        columns[f"deep-error/{sensor}"] = deep_error
+    columns["error"] = anomaly_data["error"]
+    table = pa.table(columns).replace_schema_metadata({"anomalies": json.dumps(anomaly_data["anomalies"]),
+                                                       "algo": json.dumps(anomaly_data["algo"])})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def decode_npz(content: bytes) -> dict:
+    """Decodes an NPZ response to lists (missing values as None) like a decoded JSON response.
+
+    Args:
+        content: The NPZ response.
+
+    Returns:
+        The arrays of the response by their flattened path.
+    """
+    with np.load(io.BytesIO(content), allow_pickle=False) as archive:
+        return {key: to_list(archive[key]) for key in archive.files}
+
+
+def decode_arrow(content: bytes) -> dict:
+    """Decodes an Arrow IPC response to lists (missing values as None) like a decoded JSON response.
+
+    Args:
+        content: The Arrow IPC response.
+
+    Returns:
+        The arrays of the response by their flattened path.
+    """
+    table = pa.ipc.open_stream(pa.py_buffer(content)).read_all()
+    return {key: to_list(np.asarray(value[0])) for key, value in table.to_pydict().items()}
+
+
+def to_list(array: np.ndarray):
+    """Converts an array to (nested) lists with None for NaN.
+
+    Args:
+        array: The array.
+
+    Returns:
+        The list or scalar.
+    """
+    value = array.tolist()
+    if isinstance(value, list):
+        return [None if isinstance(e, float) and np.isnan(e) else e for e in value]
+    return value
+
+
+@pytest.fixture(scope="module")
+def anomaly_data() -> dict:
+    return generate_anomaly_data(sensors=3, weeks=4, anomalies=4, seed=1)
+
+
+@pytest.fixture(scope="module")
+def payloads(anomaly_data: dict) -> dict:
+    return {
+        formats.JSON: orjson.dumps({"payload": anomaly_data}),
+        formats.NPZ: encode_npz(anomaly_data),
+        formats.ARROW: encode_arrow(anomaly_data)
+    }
+
+
+@pytest.mark.parametrize("url", URLS)
+@pytest.mark.parametrize("content_type", [formats.NPZ, formats.ARROW])
+def test_binary_payload_matches_json(client: TestClient, payloads: dict, url: str, content_type: str):
+    expected = client.post(url, content=payloads[formats.JSON], headers={"Content-Type": formats.JSON})
+    response = client.post(url, content=payloads[content_type], headers={"Content-Type": content_type})
+    assert expected.status_code == 200
+    assert response.status_code == 200
+    assert response.json() == expected.json()
+
+
+@pytest.mark.parametrize("url", URLS)
+@pytest.mark.parametrize("accept, decode", [(formats.NPZ, decode_npz), (formats.ARROW, decode_arrow)])
+def test_binary_response_matches_json(client: TestClient, payloads: dict, url: str, accept: str, decode):
+    headers = {"Content-Type": formats.JSON}
+    expected = client.post(url, content=payloads[formats.JSON], headers=headers)
+    response = client.post(url, content=payloads[formats.JSON], headers={**headers, "Accept": accept})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == accept
+    assert decode(response.content) == {key: to_list(formats.to_array(value))
+                                        for key, value in formats.flatten(expected.json())}
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "br"])
+def test_large_responses_are_compressed(client: TestClient, payloads: dict, encoding: str):
+    if encoding == "br" and formats.brotli is None:
+        pytest.skip("brotli is not installed")
+    headers = {"Content-Type": formats.JSON}
+    expected = client.post("/explanations", content=payloads[formats.JSON], headers={**headers,
+                                                                                       "Accept-Encoding": "identity"})
+    response = client.post("/explanations", content=payloads[formats.JSON], headers={**headers,
+                                                                                        "Accept-Encoding": encoding})
+    assert len(expected.content) >= formats.COMPRESSION_MIN_BYTES
+    assert "content-encoding" not in expected.headers
+    assert response.headers["content-encoding"] == encoding
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert int(response.headers["content-length"]) < len(expected.content)
+    assert response.json() == expected.json()
+
+
+def test_small_responses_are_not_compressed(client: TestClient):
+    response = client.get("/datasets/stats", headers={"Accept-Encoding": "gzip, br"})
+    assert response.status_code == 200
+    assert len(response.content) < formats.COMPRESSION_MIN_BYTES
+    assert "content-encoding" not in response.headers
@@ -0,0 +1,99 @@
+"""Tests the bounded history policies of the averaged prototypes"""
+import numpy as np
+import orjson
+import pytest
+
+from benchmarks.payloads import generate_anomaly_data
+from src import datasets, prototypes
+from src.context import ExplanationContext
+
+
+@pytest.fixture(scope="module")
+def parsed() -> dict:
+    return datasets.parse_anomaly_data(generate_anomaly_data(sensors=2, weeks=8, anomalies=2, seed=3))
+
+
+def weekly_windows(parsed: dict, anomaly: int, padding: int = 4) -> tuple[np.ndarray, np.ndarray]:
+    """Cuts all complete weekly windows of the anomaly out of the series of its sensor (like the original loop)."""
+    context = ExplanationContext(parsed)
+    series = context.series(context.sensor(anomaly))
+    frequency = context.frequency
+    low_bound = parsed["anomalies"][anomaly]["index"] - padding * frequency
+    w_length = 2 * padding * frequency + parsed["anomalies"][anomaly]["length"]
+    starts = np.arange(low_bound % (168 * frequency), len(series) - w_length, 168 * frequency)
+    return starts, np.array([series[start:start + w_length] for start in starts])
+
+
+def test_last_selects_the_latest_weeks():
+    positions, weights = prototypes.HistoryPolicy("last", weeks=3).select(10)
+    assert positions.tolist() == [7, 8, 9]
+    assert weights is None
+    assert prototypes.HistoryPolicy("last", weeks=30).select(10)[0].tolist() == list(range(10))
+
+
+def test_reservoir_selects_a_reproducible_sample():
+    policy = prototypes.HistoryPolicy("reservoir", weeks=4, seed=7)
+    positions, weights = policy.select(50)
+    assert len(positions) == 4
+    assert len(set(positions.tolist())) == 4
+    assert (np.diff(positions) > 0).all()
+    assert 0 <= positions.min() and positions.max() < 50
+    assert weights is None
+    np.testing.assert_array_equal(positions, prototypes.HistoryPolicy("reservoir", weeks=4, seed=7).select(50)[0])
+    assert prototypes.HistoryPolicy("reservoir", weeks=9).select(5)[0].tolist() == list(range(5))
+
+
+def test_decay_halves_the_weight_per_half_life_and_bounds_the_weeks():
+    policy = prototypes.HistoryPolicy("decay", half_life=2.0)
+    positions, weights = policy.select(100)
+    horizon = int(np.ceil(2.0 * np.log2(1 / prototypes.HistoryPolicy.MIN_WEIGHT)))
+    assert positions.tolist() == list(range(100 - horizon, 100))
+    assert weights[-1] == 1.0
+    assert weights[-3] == pytest.approx(0.5)
+    assert weights[-5] == pytest.approx(0.25)
+    assert weights.min() >= prototypes.HistoryPolicy.MIN_WEIGHT
+
+
+@pytest.mark.parametrize("mode, weeks, half_life", [
+    ("unknown", None, None), ("last", None, None), ("reservoir", 0, None), ("decay", None, None), ("decay", None, 0.0),
+    ("all", 4, None), ("all", None, 2.0), ("last", 4, 2.0), ("decay", 4, 2.0)
+])
+def test_invalid_policies_are_rejected(mode: str, weeks: int | None, half_life: float | None):
+    with pytest.raises(ValueError):
+        prototypes.HistoryPolicy(mode, weeks, half_life)
+
+
+def test_last_prototypes_average_the_latest_windows(parsed: dict):
+    starts, windows = weekly_windows(parsed, 0)
+    a, b, c = prototypes.create_averaged_prototypes(0, parsed, history=prototypes.HistoryPolicy("last", weeks=2))
+    np.testing.assert_allclose(a, windows[-2:].mean(axis=0))
+    np.testing.assert_allclose(b, np.median(windows[-2:], axis=0))
+    weeks = prototypes.fetch_history_weeks(0, parsed, history=prototypes.HistoryPolicy("last", weeks=2))
+    assert [week["weight"] for week in weeks] == [0.5, 0.5]
+    assert [week["start"] for week in weeks] == [str(np.datetime64(parsed["timestamps"][start], "s"))
+                                                 for start in starts[-2:]]
+
+
+def test_decay_prototypes_weight_the_windows(parsed: dict):
+    starts, windows = weekly_windows(parsed, 1)
+    policy = prototypes.HistoryPolicy("decay", half_life=1.0)
+    a, b, c = prototypes.create_averaged_prototypes(1, parsed, history=policy)
+    weights = 0.5 ** np.arange(len(windows))[::-1]
+    np.testing.assert_allclose(a, np.average(windows, axis=0, weights=weights))
+    # the latest week has more weight than all other weeks together
+    np.testing.assert_allclose(b, windows[-1])
+
+
+def test_all_weeks_match_the_default(parsed: dict):
+    expected = prototypes.create_averaged_prototypes(0, parsed)
+    assert prototypes.create_averaged_prototypes(0, parsed, history=prototypes.HistoryPolicy("all")) == expected
+
+
+@pytest.mark.parametrize("query, status", [
+    ("history=last&weeks=2", 200), ("history=decay&half_life=2", 200), ("history=all&weeks=2", 400),
+    ("history=last&weeks=2&half_life=2", 400), ("history=decay&half_life=2&weeks=2", 400), ("weeks=2", 400)
+])
+def test_parameters_of_other_policies_are_rejected(client, query: str, status: int):
+    body = orjson.dumps({"payload": generate_anomaly_data(sensors=2, weeks=3, anomalies=1, seed=13)})
+    response = client.post(f"/prototypes?anomaly=1&{query}", content=body, headers={"Content-Type": "application/json"})
+    assert response.status_code == status
@@ -0,0 +1,84 @@
+"""Tests the mask prototypes looked up in the minute-of-week index"""
+import numpy as np
+import pytest
+
+from benchmarks.payloads import generate_anomaly_data
+from src import datasets, prototypes
+from src.context import ExplanationContext
+
+FREQUENCY = 2
+WEEK_LENGTH = 168 * FREQUENCY
+PADDING = 4
+LENGTH = 5
+
+
+def generate_parsed(values: int) -> dict:
+    """Generates a parsed output of the anomaly detection with the given number of values and one anomaly per value.
+
+    Args:
+        values: The number of values of each sensor.
+
+    Returns:
+        The parsed output of the anomaly detection.
+    """
+    anomaly_data = generate_anomaly_data(sensors=2, weeks=values // WEEK_LENGTH + 1, frequency=FREQUENCY,
+                                         anomalies=1, anomaly_length=LENGTH, seed=values)
+    anomaly_data["timestamps"] = anomaly_data["timestamps"][:values]
+    anomaly_data["dataframe"] = {sensor: dict(list(series.items())[:values])
+                                 for sensor, series in anomaly_data["dataframe"].items()}
+    anomaly_data["deep-error"] = [row[:values] for row in anomaly_data["deep-error"]]
+    anomaly_data["error"] = anomaly_data["error"][:values]
+    anomaly_data["anomalies"] = [{"timestamp": anomaly_data["timestamps"][i], "type": "Area", "index": i,
+                                  "length": LENGTH} for i in range(values - LENGTH)]
+    return datasets.parse_anomaly_data(anomaly_data)
+
+
+def complete_windows(parsed: dict, anomaly: int) -> tuple[np.ndarray, np.ndarray]:
+    """Cuts the timeframes at the same time of the week that lie completely within the data out of the series.
+
+    Args:
+        parsed: The parsed output of the anomaly detection.
+        anomaly: The ID of the anomaly.
+
+    Returns:
+        The windows and the padded anomaly window (without the part outside the data).
+    """
+    context = ExplanationContext(parsed)
+    series = context.series(context.sensor(anomaly))
+    low_bound = parsed["anomalies"][anomaly]["index"] - PADDING * FREQUENCY
+    w_length = 2 * PADDING * FREQUENCY + LENGTH
+    starts = [start for start in range(low_bound % WEEK_LENGTH, len(series), WEEK_LENGTH)
+              if start + w_length <= len(series)]
+    return np.array([series[start:start + w_length] for start in starts]), \
+        series[max(low_bound, 0):low_bound + w_length]
+
+
+@pytest.mark.parametrize("values, anomaly", [
+    # whole weeks: the timeframe of the week before the first one crosses the start, the one of the last week the end
+    (3 * WEEK_LENGTH, WEEK_LENGTH - 3),
+    (3 * WEEK_LENGTH, 2 * WEEK_LENGTH + 2),
+    (3 * WEEK_LENGTH, 2),
+    # the timeframe of the last week crosses the end
+    (3 * WEEK_LENGTH + 50, 45),
+    # the timeframe of the first week crosses the start
+    (3 * WEEK_LENGTH + 50, 2 * WEEK_LENGTH + 3),
+    # no timeframe crosses the start or the end
+    (3 * WEEK_LENGTH + 50, 100)
+])
+def test_partial_timeframes_are_left_out(values: int, anomaly: int):
+    parsed = generate_parsed(values)
+    windows, anomaly_window = complete_windows(parsed, anomaly)
+    a, b, c = prototypes.create_averaged_prototypes_mask(anomaly, parsed, PADDING)
+    assert len(windows) >= 2
+    np.testing.assert_allclose(a, windows.mean(axis=0))
+    np.testing.assert_allclose(b, np.median(windows, axis=0))
+    np.testing.assert_allclose(c, anomaly_window)
+
+
+def test_mask_prototypes_match_the_averaged_prototypes_with_complete_weeks():
+    parsed = generate_parsed(4 * WEEK_LENGTH)
+    for anomaly in (30, WEEK_LENGTH + 7, 3 * WEEK_LENGTH - 40):
+        a, b, _ = prototypes.create_averaged_prototypes_mask(anomaly, parsed, PADDING)
+        expected_a, expected_b, _ = prototypes.create_averaged_prototypes(anomaly, parsed, PADDING)
+        np.testing.assert_allclose(a, expected_a)
+        np.testing.assert_allclose(b, expected_b)
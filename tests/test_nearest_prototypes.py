@@ -0,0 +1,77 @@
+"""Tests the FFT-based distance profile (MASS) and the nearest-neighbour prototypes"""
+import numpy as np
+import pytest
+
+from benchmarks.nearest_prototypes import naive_distance_profile
+from benchmarks.payloads import generate_anomaly_data
+from src import datasets, prototypes
+
+
+def random_walk(length: int, offset: float, seed: int) -> np.ndarray:
+    return offset + np.cumsum(np.random.default_rng(seed).normal(size=length))
+
+
+@pytest.mark.parametrize("offset", [0.0, 1e3, 1e6])
+@pytest.mark.parametrize("start, length", [(0, 16), (500, 48), (1952, 48)])
+def test_distance_profile_matches_naive_scan(offset: float, start: int, length: int):
+    series = random_walk(2000, offset, seed=start)
+    query = series[start:start + length]
+    mass = prototypes.calculate_distance_profile(series, query)
+    naive = naive_distance_profile(series, query)
+    assert mass.shape == naive.shape
+    # the squared distances are compared, the square root amplifies the rounding errors close to zero
+    np.testing.assert_allclose(mass ** 2, naive ** 2, rtol=0, atol=1e-6)
+    assert mass[start] == pytest.approx(0.0, abs=1e-3)
+
+
+def test_distance_profile_of_a_shifted_query_is_unchanged():
+    series = random_walk(1000, 0.0, seed=3)
+    query = series[100:140]
+    np.testing.assert_allclose(prototypes.calculate_distance_profile(series, query + 50.0) ** 2,
+                               prototypes.calculate_distance_profile(series, query) ** 2, atol=1e-8)
+
+
+def test_windows_without_variance_or_with_missing_values_are_infinite():
+    series = random_walk(300, 1e6, seed=4)
+    series[50:80] = 1e6
+    series[200] = np.nan
+    distances = prototypes.calculate_distance_profile(series, series[100:110])
+    assert np.isinf(distances[50:71]).all()
+    assert np.isfinite(distances[[49, 71]]).all()
+    assert np.isinf(distances[191:201]).all()
+    assert np.isfinite(distances[100])
+    assert np.isinf(prototypes.calculate_distance_profile(series, np.full(10, 3.0))).all()
+
+
+def test_too_short_series_are_rejected():
+    with pytest.raises(ValueError):
+        prototypes.calculate_distance_profile(np.arange(5.0), np.arange(6.0))
+
+
+def test_nearest_windows_overlap_neither_the_excluded_range_nor_each_other():
+    pattern = np.sin(np.linspace(0, 2 * np.pi, 50, endpoint=False))
+    series = np.tile(pattern, 20) + np.random.default_rng(5).normal(0, 0.01, 1000)
+    starts = prototypes.find_nearest_windows(series, 500, 50, 3, (500, 550))
+    assert len(starts) == 3
+    for i, start in enumerate(starts):
+        assert start + 50 <= 500 or start >= 550
+        assert start % 50 in (0, 1, 49)
+        assert all(abs(start - other) >= 50 for other in starts[i + 1:])
+
+
+@pytest.mark.parametrize("index", [0, 3, 7, 2 * 168 * 4 - 12])
+def test_prototypes_are_aligned_with_an_anomaly_window_crossing_the_data_ends(index: int):
+    anomaly_data = generate_anomaly_data(sensors=1, weeks=2, anomalies=1, seed=6)
+    sensor = anomaly_data["sensors"][0]
+    # an exactly periodic series, so the matches of the anomaly window are the same values one period apart
+    pattern = np.random.default_rng(6).normal(size=96)
+    values = np.tile(pattern, len(anomaly_data["timestamps"]) // 96)
+    anomaly_data["dataframe"][sensor] = dict(zip(anomaly_data["dataframe"][sensor], values.tolist()))
+    anomaly_data["anomalies"] = [{"timestamp": anomaly_data["timestamps"][index], "type": "Area", "index": index,
+                                  "length": 8}]
+    a, b, c = prototypes.create_nearest_prototypes(0, datasets.parse_anomaly_data(anomaly_data), padding=2)
+    assert len(a) == len(b) == len(c) == 2 * 2 * 4 + 8
+    inside = [i for i, value in enumerate(c) if value is not None]
+    assert len(inside) < len(c)
+    np.testing.assert_allclose([a[i] for i in inside], [c[i] for i in inside], atol=1e-9)
+    np.testing.assert_allclose([b[i] for i in inside], [c[i] for i in inside], atol=1e-9)
@@ -0,0 +1,73 @@
+"""Tests the incremental seasonal profiles and their error bound"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from src import profiles
+
+WEEK_LENGTH = 24
+
+
+def generate_series(weeks: int, seed: int) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    series = rng.lognormal(0, 2, weeks * WEEK_LENGTH) * rng.choice([-1.0, 1.0], weeks * WEEK_LENGTH)
+    series[rng.random(len(series)) < 0.05] = 0.0
+    timestamps = pd.date_range("2021-01-04", periods=len(series), freq="7h").values
+    return series, timestamps
+
+
+@pytest.mark.parametrize("accuracy", [0.01, 0.05])
+@pytest.mark.parametrize("weeks", [1, 4, 9])
+def test_median_is_within_the_error_bound(accuracy: float, weeks: int):
+    series, timestamps = generate_series(weeks, seed=weeks)
+    profile = profiles.SeasonalProfile(WEEK_LENGTH, accuracy)
+    profile.update(series, timestamps)
+    slots = np.arange(WEEK_LENGTH)
+    values = np.sort(series.reshape(weeks, WEEK_LENGTH), axis=0)
+    # the error of the interpolated median is bounded by the accuracy times the mean magnitude of the middle values
+    bound = accuracy * (np.abs(values[(weeks - 1) // 2]) + np.abs(values[weeks // 2])) / 2
+    assert (np.abs(profile.median(slots) - np.median(values, axis=0)) <= bound + 1e-12).all()
+    np.testing.assert_allclose(profile.mean(slots), values.mean(axis=0))
+
+
+def test_quantiles_are_within_the_error_bound():
+    series, timestamps = generate_series(11, seed=1)
+    profile = profiles.SeasonalProfile(WEEK_LENGTH, 0.02)
+    profile.update(series, timestamps)
+    values = np.sort(series.reshape(11, WEEK_LENGTH), axis=0)
+    for q, rank in ((0.0, 0), (0.1, 1), (0.9, 9), (1.0, 10)):
+        estimates = profile.quantile(np.arange(WEEK_LENGTH), q)
+        assert (np.abs(estimates - values[rank]) <= 0.02 * np.abs(values[rank]) + 1e-12).all()
+
+
+def test_incremental_updates_match_a_single_update():
+    series, timestamps = generate_series(6, seed=2)
+    incremental = profiles.SeasonalProfile(WEEK_LENGTH, 0.01)
+    for end in (30, 31, 100, len(series)):
+        incremental.update(series[:end], timestamps[:end])
+    complete = profiles.SeasonalProfile(WEEK_LENGTH, 0.01)
+    complete.update(series, timestamps)
+    np.testing.assert_allclose(incremental.sums, complete.sums)
+    np.testing.assert_array_equal(incremental.counts, complete.counts)
+    assert incremental.sketches == complete.sketches
+
+
+def test_missing_values_are_left_out():
+    series, timestamps = generate_series(3, seed=3)
+    series[5] = np.nan
+    profile = profiles.SeasonalProfile(WEEK_LENGTH, 0.01)
+    profile.update(series, timestamps)
+    assert profile.counts[5] == 2
+    assert profile.mean(np.array([5])) == pytest.approx(np.nanmean(series[5::WEEK_LENGTH]))
+
+
+def test_follows_only_a_continuation_of_the_series():
+    series, timestamps = generate_series(4, seed=4)
+    profile = profiles.SeasonalProfile(WEEK_LENGTH, 0.01)
+    profile.update(series[:60], timestamps[:60])
+    assert profile.follows(series, timestamps)
+    changed = series.copy()
+    changed[55] += 1.0
+    assert not profile.follows(changed, timestamps)
+    assert not profile.follows(series[:50], timestamps[:50])
+    assert not profile.follows(series, timestamps + np.timedelta64(1, "h"))
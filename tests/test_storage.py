@@ -0,0 +1,96 @@
+"""Tests the memory-mapped on-disk store of registered datasets"""
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from benchmarks.payloads import generate_anomaly_data
+from src import datasets, storage
+from src.context import ExplanationContext
+from src import feature_attribution as ft
+
+
+@pytest.fixture
+def anomaly_data() -> dict:
+    return generate_anomaly_data(sensors=2, weeks=2, anomalies=2, seed=4)
+
+
+@pytest.fixture
+def store(tmp_path) -> storage.HistoryStore:
+    return storage.HistoryStore(str(tmp_path), max_bytes=1 << 30)
+
+
+def test_stored_dataset_matches_the_payload(store: storage.HistoryStore, anomaly_data: dict):
+    key = store.put(anomaly_data)
+    assert store.put(anomaly_data) == key
+    stored = store.get(key)
+    for i, sensor in enumerate(anomaly_data["sensors"]):
+        np.testing.assert_array_equal(stored["series"][i], list(anomaly_data["dataframe"][sensor].values()))
+    np.testing.assert_array_equal(stored["deep-error"], anomaly_data["deep-error"])
+    np.testing.assert_allclose(stored["deep-error-prefix-sums"],
+                               ft.calculate_prefix_sums(np.array(anomaly_data["deep-error"])))
+    np.testing.assert_array_equal(stored["error"], anomaly_data["error"])
+    np.testing.assert_array_equal(np.asarray(stored["timestamps"]),
+                                  np.array(anomaly_data["timestamps"], dtype="datetime64[ns]"))
+    assert stored["anomalies"] == anomaly_data["anomalies"]
+    assert ExplanationContext(stored).frequency == 4
+    assert pickle.loads(pickle.dumps(stored))["sensors"] == anomaly_data["sensors"]
+    assert store.stats()["entries"] == 1
+
+
+def test_unknown_keys_are_not_found(store: storage.HistoryStore):
+    assert store.get("0" * 64) is None
+    assert store.get("../etc") is None
+
+
+def test_datasets_without_deep_error_are_stored(store: storage.HistoryStore, anomaly_data: dict):
+    anomaly_data["deep-error"] = []
+    stored = store.get(store.put(anomaly_data))
+    assert stored["deep-error"].shape == (0, len(anomaly_data["timestamps"]))
+
+
+@pytest.mark.parametrize("change, message", [
+    (lambda data: data.update(timestamps=data["timestamps"][:-1]), "Timestamps must match"),
+    (lambda data: data.update(timestamps=data["timestamps"][1:] + data["timestamps"][:1]), "Timestamps must match"),
+    (lambda data: data.update({"deep-error": data["deep-error"][:1]}), "Deep error must have the shape"),
+    (lambda data: data.update({"deep-error": [row[:-1] for row in data["deep-error"]]}),
+     "Deep error must have the shape"),
+    (lambda data: data.update(error=data["error"][:-1]), "Error must have"),
+    (lambda data: [values.pop(next(iter(values))) for values in data["dataframe"].values()],
+     "Timestamps must match"),
+    (lambda data: [values.pop(list(values)[5]) for values in data["dataframe"].values()], "evenly spaced")
+])
+def test_inconsistent_shapes_are_rejected(store: storage.HistoryStore, anomaly_data: dict, change, message: str):
+    change(anomaly_data)
+    with pytest.raises(ValueError, match=message):
+        store.put(anomaly_data)
+    assert store.stats()["entries"] == 0
+
+
+def test_least_recently_used_datasets_are_evicted(tmp_path):
+    payloads = [generate_anomaly_data(sensors=2, weeks=2, anomalies=2, seed=seed) for seed in range(3)]
+    probe = storage.HistoryStore(str(tmp_path / "probe"), max_bytes=1 << 30)
+    probe.put(payloads[0])
+    size = probe.stats()["bytes"]
+    store = storage.HistoryStore(str(tmp_path / "store"), max_bytes=int(2.5 * size))
+    a, b = store.put(payloads[0]), store.put(payloads[1])
+    # the access times are set explicitly, since the resolution of the file system may be too coarse
+    os.utime(os.path.join(store.directory, a), (2, 2))
+    os.utime(os.path.join(store.directory, b), (1, 1))
+    c = store.put(payloads[2])
+    assert store.get(b) is None
+    assert store.get(a) is not None
+    assert store.get(c) is not None
+    stats = store.stats()
+    assert stats["entries"] == 2
+    assert stats["evictions"] == 1
+    assert stats["bytes"] <= stats["max_bytes"]
+
+
+def test_datasets_larger_than_the_store_are_rejected(tmp_path, anomaly_data: dict):
+    store = storage.HistoryStore(str(tmp_path), max_bytes=1024)
+    with pytest.raises(datasets.DatasetTooLarge):
+        store.put(anomaly_data)
+    assert store.stats()["entries"] == 0
+    assert os.listdir(tmp_path) == []
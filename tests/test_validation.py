@@ -0,0 +1,31 @@
+"""Tests the validation of the query parameters of the explanation endpoints"""
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+
+from benchmarks.payloads import generate_anomaly_data
+
+
+@pytest.fixture(scope="module")
+def body() -> bytes:
+    return orjson.dumps({"payload": generate_anomaly_data(sensors=2, weeks=3, anomalies=2, seed=8)})
+
+
+@pytest.mark.parametrize("url", [
+    "/prototypes?anomaly=1&padding=-1",
+    "/prototypes?anomaly=1&method=nearest&padding=-4",
+    "/explanations?padding=-1"
+])
+def test_negative_padding_is_rejected(client: TestClient, body: bytes, url: str):
+    response = client.post(url, content=body, headers={"Content-Type": "application/json"})
+    assert response.status_code == 422
+
+
+@pytest.mark.parametrize("url", ["/prototypes?anomaly=1&padding=0", "/explanations?padding=0"])
+def test_zero_padding_returns_the_anomaly_window(client: TestClient, body: bytes, url: str):
+    response = client.post(url, content=body, headers={"Content-Type": "application/json"})
+    assert response.status_code == 200
+    result = response.json()
+    windows = result["prototypes"] if "prototypes" in result else result["explanations"][0]["prototypes"]
+    assert len(windows["anomaly"]) == 8
+    assert len(windows["prototype a"]) == 8